@@ -1,31 +1,82 @@
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import json
 import logging
-import traceback
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from .storage import save_upload
-from .extractor import extract_text
-from .chunker import chunk_text
-from .embedder import Embedder
-from .vectorstore import QdrantStore
+from pydantic import AfterValidator, BaseModel
+from typing import Annotated, Dict, List, Literal, Optional, Union
+from .storage import save_multipart_upload, BadUpload, UploadTooLarge, MULTIPART_OVERHEAD
+from .jobs import job_queue
+from .vectorstore import close_clients, validate_collection
+from .local_store import flush_local_stores
 from .rag import RAGPipeline
-from .config import CHUNK_SIZE, CHUNK_OVERLAP, QDRANT_COLLECTION
-from .llm_client import LLMClient
+from .config import (
+    QDRANT_COLLECTION, EMBED_WARMUP, QUERY_BATCH_MAX, BATCH_LLM_CONCURRENCY, MAX_UPLOAD_BYTES, TIMING_HEADER,
+)
+from .llm_client import LLMClient, close_async_client
+from . import model_registry, cache, metrics, batcher
 
-app = FastAPI(title="RAG Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if EMBED_WARMUP:
+        # Load the shared embedding model once so requests never pay for it.
+        try:
+            model_registry.warmup()
+        except Exception:
+            logging.exception("Embedding model warmup failed; it will be loaded on first use")
+    job_queue.start()
+    yield
+    job_queue.shutdown()
+    batcher.close_batchers()
+    flush_local_stores()
+    close_clients()
+    await close_async_client()
+    metrics.shutdown()
+
+
+app = FastAPI(title="RAG Service", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 # Serve the frontend static files at /frontend
 app.mount("/frontend", StaticFiles(directory="frontend"), name="frontend")
 
 
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """Record request latency and, with TIMING_HEADER, return the stage breakdown as Server-Timing.
+
+    Streaming responses are measured until their headers are sent, so their
+    stage timings stop at retrieval; the LLM stage is still recorded in the
+    histograms and traced as a child of the request's span.
+    """
+    started = time.perf_counter()
+    with metrics.request_timings(request.method) as timings:
+        response = await call_next(request)
+        # label by route template, not raw path, to keep the number of series (and span names) bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.annotate_request(f"{request.method} {route}", {
+            "http.request.method": request.method, "http.route": route,
+            "http.response.status_code": response.status_code})
+    elapsed = time.perf_counter() - started
+    metrics.request_seconds.observe(elapsed, request.method, route, str(response.status_code))
+    if TIMING_HEADER:
+        response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    return response
+
+
+# rejected with a 422 before a name reaches any file path
+Collection = Annotated[str, AfterValidator(validate_collection)]
+
+
 class IngestRequest(BaseModel):
     file_id: str
     path: str
-    collection: str = QDRANT_COLLECTION
+    collection: Collection = QDRANT_COLLECTION
 
 
 @app.get("/health")
@@ -33,73 +84,120 @@ async def health():
     return {"status": "ok"}
 
 
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    file_id, path = save_upload(file, file.filename)
-    return {"file_id": file_id, "path": path}
+@app.get("/stats")
+async def stats():
+    return {"embedding": {**model_registry.stats(), "batching": batcher.stats()}, "cache": cache.stats(),
+            "stages": metrics.stats()}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage and request latency histograms in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# the body is parsed by the handler itself (see save_multipart_upload), so describe it for the docs
+_UPLOAD_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
+
+
+@app.post("/upload", openapi_extra=_UPLOAD_BODY)
+async def upload(request: Request, ingest: bool = False, collection: Collection = QDRANT_COLLECTION):
+    """Store the multipart ``file`` part; with ``?ingest=true`` also queue its ingestion job.
+
+    The request body is read and written to storage as it arrives, and
+    refused with 413 once it exceeds MAX_UPLOAD_BYTES.
+    """
+    # reject obviously oversized bodies before reading them (allowing for multipart framing)
+    declared = request.headers.get("content-length")
+    if MAX_UPLOAD_BYTES and declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    try:
+        saved = await save_multipart_upload(request.stream(), request.headers.get("content-type", ""))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BadUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if ingest:
+        job = job_queue.submit("ingest", {"file_id": saved["file_id"], "path": saved["path"], "collection": collection})
+        saved["job_id"] = job["id"]
+    return saved
 
 
 @app.post("/ingest")
 async def ingest(req: IngestRequest):
-    try:
-        # extract
-        if not os.path.exists(req.path):
-            raise HTTPException(status_code=404, detail="file not found")
-        text = extract_text(req.path)
-        chunks = chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
-        # embed
-        embedder = Embedder()
-        texts = [c['text'] for c in chunks]
-        embs = embedder.embed_texts(texts)
-        # upsert to qdrant
-        store = QdrantStore(collection=req.collection)
-        import uuid
-
-        points = []
-        for c, v in zip(chunks, embs):
-            # Qdrant requires point IDs to be either unsigned ints or UUIDs.
-            # Use a fresh UUID for the Qdrant point id, and keep the original
-            # chunk id inside the payload so we can reference it later.
-            pid = uuid.uuid4()
-            payload = {"text": c['text'], "file_id": req.file_id, "index": c['index'], "chunk_id": c['id']}
-            points.append({
-                "id": pid,
-                "vector": v,
-                "payload": payload,
-            })
-        # qdrant upload: prefer using the library model objects but delegate
-        # normalization to QdrantStore.upsert so we never pass raw dicts
-        # directly into low-level client methods (which can expect .id attributes).
-        try:
-            from qdrant_client.models import PointStruct
-            points_structs = [PointStruct(id=p['id'], vector=p['vector'], payload=p['payload']) for p in points]
-            store.upsert(points_structs)
-        except Exception as e:
-            # If constructing PointStructs or the preferred path fails,
-            # fall back to letting QdrantStore.upsert normalize dicts itself.
-            logging.debug(f"PointStruct path failed, falling back to dict upsert: {e}")
-            store.upsert(points)
-        return {"ingested": True, "num_chunks": len(chunks)}
-    except Exception as e:
-        logging.exception("Error during ingest")
-        tb = traceback.format_exc()
-        # Return error details (trim long tracebacks) to help debugging in dev
-        return JSONResponse(status_code=500, content={"error": str(e), "traceback": tb[:2000]})
+    if not os.path.exists(req.path):
+        raise HTTPException(status_code=404, detail="file not found")
+    # extract -> chunk -> embed -> upsert runs on the job worker pool, off the event loop
+    job = job_queue.submit("ingest", {"file_id": req.file_id, "path": req.path, "collection": req.collection})
+    return {"job_id": job["id"], "status": job["status"]}
 
 
-class QueryRequest(BaseModel):
-    query: str
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+class RetrievalOptions(BaseModel):
     top_k: int = 3
-    collection: str = QDRANT_COLLECTION
+    collection: Collection = QDRANT_COLLECTION
+    # None uses RETRIEVAL_MODE / RRF_K from the environment
+    retrieval: Optional[Literal["dense", "lexical", "hybrid"]] = None
+    rrf_k: Optional[int] = None
+    # payload equality filter applied inside the search, e.g. {"file_id": ["<id1>", "<id2>"]};
+    # a list matches any of its values
+    filter: Optional[Dict[str, Union[str, int, bool, List[Union[str, int, bool]]]]] = None
+    # dense search knobs: wider HNSW candidate list, or exact (brute-force) search
+    hnsw_ef: Optional[int] = None
+    exact: bool = False
+
+    def retrieval_options(self) -> dict:
+        return {"mode": self.retrieval, "rrf_k": self.rrf_k, "filter": self.filter,
+                "hnsw_ef": self.hnsw_ef, "exact": self.exact}
+
+
+class QueryRequest(RetrievalOptions):
+    query: str
 
 
 @app.post("/query")
 async def query(req: QueryRequest):
     rag = RAGPipeline(collection=req.collection)
-    result = rag.answer(req.query, top_k=req.top_k)
+    result = await rag.aanswer(req.query, top_k=req.top_k, **req.retrieval_options())
     return result
 
 
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """Stream the answer as NDJSON: a sources event, token events, then done."""
+    rag = RAGPipeline(collection=req.collection)
+
+    async def events():
+        async for event in rag.astream_answer(req.query, top_k=req.top_k, **req.retrieval_options()):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+class BatchQueryRequest(RetrievalOptions):
+    queries: List[str]
+    max_concurrency: int = BATCH_LLM_CONCURRENCY
+
+
+@app.post("/query/batch")
+async def query_batch(req: BatchQueryRequest):
+    if len(req.queries) > QUERY_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"at most {QUERY_BATCH_MAX} queries per batch")
+    rag = RAGPipeline(collection=req.collection)
+    results = await rag.aanswer_many(req.queries, top_k=req.top_k, max_concurrency=req.max_concurrency,
+                                     **req.retrieval_options())
+    return {"results": results}
+
+
 class LLMTestRequest(BaseModel):
     prompt: str
 
@@ -108,7 +206,7 @@ class LLMTestRequest(BaseModel):
 async def llm_test(req: LLMTestRequest):
     client = LLMClient()
     try:
-        out = client.generate(req.prompt)
+        out = await client.agenerate(req.prompt)
         return {'ok': True, 'response': out}
     except Exception as e:
         return JSONResponse(status_code=500, content={'ok': False, 'error': str(e)})
@@ -0,0 +1,185 @@
+"""Micro-batching of query embeddings across concurrent requests.
+
+Each query is a single short text, and encoding them one at a time leaves
+most of the encoder's throughput unused. An EmbeddingBatcher owns one worker
+thread in front of the shared model: callers enqueue texts and block on
+futures while the worker collects up to ``max_batch`` texts, or whatever
+arrived within ``max_wait_ms`` of the first one, and encodes them in one call.
+A lone request therefore waits at most ``max_wait_ms``; under load batches
+fill up without waiting. Once a batcher is closed, callers that still hold
+it encode on their own thread instead.
+
+Batch sizes and queueing delays are recorded in the metrics histograms
+(/metrics) and summarized by stats() (/stats).
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from . import metrics
+from .config import EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch: int = EMBED_BATCH_MAX,
+                 max_wait_ms: float = EMBED_BATCH_WAIT_MS, name: str = "embed"):
+        self.encode = encode
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        # (text, future, enqueue time)
+        self._queue: "queue.Queue" = queue.Queue()
+        # guards _closed so that nothing is queued behind _STOP
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: Sequence[str]) -> List[Future]:
+        """Queue texts for encoding; returns one future per text resolving to its vector."""
+        now = time.perf_counter()
+        futures = [Future() for _ in texts]
+        with self._submit_lock:
+            if not self._closed:
+                for text, future in zip(texts, futures):
+                    self._queue.put((text, future, now))
+                return futures
+        # closed: no worker reads the queue any more
+        try:
+            vectors = self.encode(list(texts)) if futures else []
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+        return futures
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Encode texts through the batcher, blocking until all are done; returns a (len(texts), dim) array."""
+        return np.stack([f.result() for f in self.submit(texts)])
+
+    def _collect(self, first) -> List[Tuple[str, Future, float]]:
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # take what is already queued without waiting, then wait until the deadline
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                self._queue.put(_STOP)  # finish this batch, stop on the next get
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [item for item in self._collect(first) if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            self._record(batch, started)
+            try:
+                vectors = self.encode([text for text, _, _ in batch])
+            except Exception as e:
+                logging.exception("Batched %s encode failed", self.name)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def _record(self, batch, started: float):
+        delays = [started - enqueued for _, _, enqueued in batch]
+        metrics.embed_batch_size.observe(len(batch))
+        for delay in delays:
+            metrics.embed_queue_seconds.observe(delay)
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.queue_delay_total += sum(delays)
+            self.queue_delay_max = max(self.queue_delay_max, max(delays))
+
+    def close(self):
+        """Stop the worker after the queued texts are encoded; later calls encode directly."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+        # nothing can be queued after _STOP, but never leave a caller blocked on a future
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError(f"{self.name} batcher closed"))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_queue_delay_ms": round(self.queue_delay_total / self.items * 1000, 3) if self.items else 0.0,
+                "max_queue_delay_ms": round(self.queue_delay_max * 1000, 3),
+            }
+
+
+# (model name, device, normalize, dtype) -> batcher shared by every Retriever using that encoder
+_batchers: Dict[tuple, EmbeddingBatcher] = {}
+_lock = threading.Lock()
+
+
+def get_batcher(embedder) -> EmbeddingBatcher:
+    """Return the process-wide batcher for ``embedder``'s model and output settings."""
+    key = (embedder.model_name, embedder.device, embedder.normalize, str(embedder.dtype))
+    batcher = _batchers.get(key)
+    if batcher is None:
+        with _lock:
+            batcher = _batchers.get(key)
+            if batcher is None:
+                batcher = _batchers[key] = EmbeddingBatcher(embedder.embed_texts, name=embedder.model_name)
+    return batcher
+
+
+def close_batchers():
+    """Stop all batcher threads (used on app shutdown)."""
+    with _lock:
+        for batcher in _batchers.values():
+            batcher.close()
+        _batchers.clear()
+
+
+def stats() -> List[dict]:
+    return [{"model": key[0], **b.stats()} for key, b in list(_batchers.items())]
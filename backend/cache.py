@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+from .config import (
+    COLLECTION_VERSION_DIR, QUERY_EMBED_CACHE_SIZE, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL,
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD,
+)
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count, with an optional TTL.
+
+    A ``max_entries`` of 0 disables the cache (every get is a miss and set is a no-op).
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None, name: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, stored_at = item
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SemanticCache:
+    """Answer cache matched by cosine similarity of query embeddings.
+
+    An entry is reused only if the new query is within ``threshold`` cosine
+    similarity of the cached one *and* retrieval returned the same source ids,
+    so answers are never served for contexts they were not generated from.
+    Entries are evicted oldest-first beyond ``max_entries`` or after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._latency = {"hit": [0, 0.0], "miss": [0, 0.0]}  # count, total seconds
+
+    @staticmethod
+    def _unit(vector):
+        import numpy as np
+        v = np.asarray(vector, dtype=np.float32)
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def _expire(self, now: float):
+        while self._entries:
+            _, oldest = next(iter(self._entries.items()))
+            if now - oldest["created"] <= self.ttl:
+                break
+            self._entries.popitem(last=False)
+
+    def lookup(self, collection: str, vector, source_ids: Iterable) -> Optional[str]:
+        import numpy as np
+        sources = frozenset(source_ids)
+        with self._lock:
+            self._expire(time.monotonic())
+            candidates = [e for e in self._entries.values()
+                          if e["collection"] == collection and e["sources"] == sources]
+            if candidates:
+                sims = np.stack([e["vector"] for e in candidates]) @ self._unit(vector)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self.hits += 1
+                    return candidates[best]["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, collection: str, vector, source_ids: Iterable, answer: str):
+        if self.max_entries <= 0:
+            return
+        entry = {
+            "collection": collection,
+            "vector": self._unit(vector),
+            "sources": frozenset(source_ids),
+            "answer": answer,
+            "created": time.monotonic(),
+        }
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_latency(self, hit: bool, seconds: float):
+        with self._lock:
+            bucket = self._latency["hit" if hit else "miss"]
+            bucket[0] += 1
+            bucket[1] += seconds
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+
+        def avg_ms(kind):
+            count, total = self._latency[kind]
+            return round(total / count * 1000, 2) if count else None
+
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_hit_latency_ms": avg_ms("hit"),
+            "avg_full_pipeline_latency_ms": avg_ms("miss"),
+        }
+
+
+# query text -> embedding. Embeddings only depend on the model, so entries
+# stay valid across ingests. Bounded by entry count: each entry is one
+# EMBED_DIM float32 vector of its own (not a view into a batch array).
+query_embedding_cache = LRUCache(QUERY_EMBED_CACHE_SIZE, name="query_embedding")
+# (collection, collection version, vector hash, top_k, ...) -> hits
+search_cache = LRUCache(SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, name="search")
+# paraphrase-tolerant answers, used by RAGPipeline when SEMANTIC_CACHE_ENABLED
+semantic_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD)
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+
+def vector_hash(vector) -> str:
+    import numpy as np
+    return hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()
+
+
+def filter_key(flt: Optional[dict]) -> Optional[str]:
+    # canonical form of a payload filter, so equal filters share cache entries
+    if not flt:
+        return None
+    return json.dumps(flt, sort_keys=True, default=str)
+
+
+def _version_path(collection: str) -> str:
+    # named by hash: the collection name comes from requests and must not pick the path
+    return os.path.join(COLLECTION_VERSION_DIR, hashlib.sha256(collection.encode()).hexdigest())
+
+
+def collection_version(collection: str) -> str:
+    """Current version token of ``collection``, as last set by invalidate_collection() in any process."""
+    try:
+        with open(_version_path(collection), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def invalidate_collection(collection: str):
+    """Give ``collection`` a new version token, orphaning every search result cached under the old one.
+
+    The token lives in a file under COLLECTION_VERSION_DIR, so ingests in job
+    worker processes or other uvicorn workers invalidate this process's
+    cache too. Tokens are random rather than counters, so concurrent bumps
+    can never produce a version a reader has already cached under.
+    """
+    os.makedirs(COLLECTION_VERSION_DIR, exist_ok=True)
+    path = _version_path(collection)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp, path)
+
+
+def stats() -> dict:
+    return {
+        "query_embedding": query_embedding_cache.stats(),
+        "search": search_cache.stats(),
+        "semantic": semantic_cache.stats(),
+    }
@@ -0,0 +1,58 @@
+import os
+from typing import Dict, Iterable, Tuple
+
+from .config import CHUNK_INDEX_PATH, VECTOR_BACKEND
+from .db import sqlite_transaction
+
+
+class ChunkIndex:
+    """Local record of which chunk hashes of a file are already in a collection.
+
+    Lets re-ingestion skip embedding/upserting unchanged chunks and find the
+    points of chunks that no longer exist in the document. Entries are kept
+    per vector ``backend``: a collection of the same name in another backend
+    is a different set of points.
+    """
+
+    def __init__(self, path: str = CHUNK_INDEX_PATH, backend: str = VECTOR_BACKEND):
+        self.path = path
+        self.backend = backend
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with sqlite_transaction(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(chunks)")]
+            if columns and "backend" not in columns:
+                # the key used to leave out the backend; the rows were written by the configured one
+                conn.execute("ALTER TABLE chunks RENAME TO chunks_old")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " backend TEXT, collection TEXT, file_id TEXT, chunk_hash TEXT, point_id TEXT,"
+                " PRIMARY KEY (backend, collection, file_id, chunk_hash))"
+            )
+            if columns and "backend" not in columns:
+                conn.execute("INSERT OR IGNORE INTO chunks SELECT ?, collection, file_id, chunk_hash, point_id"
+                             " FROM chunks_old", (backend,))
+                conn.execute("DROP TABLE chunks_old")
+
+    def known(self, collection: str, file_id: str) -> Dict[str, str]:
+        """Return {chunk_hash: point_id} for everything ingested from file_id."""
+        with sqlite_transaction(self.path) as conn:
+            rows = conn.execute(
+                "SELECT chunk_hash, point_id FROM chunks WHERE backend = ? AND collection = ? AND file_id = ?",
+                (self.backend, collection, file_id),
+            ).fetchall()
+        return dict(rows)
+
+    def add(self, collection: str, file_id: str, entries: Iterable[Tuple[str, str]]):
+        with sqlite_transaction(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)",
+                [(self.backend, collection, file_id, h, pid) for h, pid in entries],
+            )
+
+    def remove(self, collection: str, file_id: str, hashes: Iterable[str]):
+        with sqlite_transaction(self.path) as conn:
+            conn.executemany(
+                "DELETE FROM chunks WHERE backend = ? AND collection = ? AND file_id = ? AND chunk_hash = ?",
+                [(self.backend, collection, file_id, h) for h in hashes],
+            )
@@ -1,27 +1,242 @@
-import uuid
-from typing import List
+import hashlib
+import logging
+import math
+import re
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[dict]:
-    """Chunk text into overlapping windows of approx chunk_size."""
+# texts -> token count per text; called once per batch of segments
+TokenCounter = Callable[[Sequence[str]], np.ndarray]
+
+# Segment boundaries: a sentence end followed by spaces, or a line break
+# together with any blank lines after it. Segments keep their trailing
+# whitespace, so concatenated segments reproduce the text exactly.
+# Both alternatives start with one character class so the scan stays fast.
+_SEGMENT_END = re.compile(r"[.!?\n](?:(?<=\n)\s*|[\"')\]]*[ \t]+)")
+_HEADING = re.compile(r"#{1,6}\s")
+# Without a boundary for this long, cut anyway so the buffer stays bounded
+MAX_SEGMENT_CHARS = 20000
+# Segments tokenized per tokenizer call
+TOKENIZE_BATCH = 1024
+_WORDPIECE = re.compile(r"\w+|[^\w\s]")
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def _make_chunk(text: str, start: int, end: int, idx: int, tokens: Optional[int] = None) -> dict:
+    h = chunk_hash(text)
+    # ids are derived from the content so re-chunking the same text gives the same ids
+    chunk = {
+        "id": f"chunk_{idx}_{h[:8]}",
+        "hash": h,
+        "text": text,
+        "start": start,
+        "end": end,
+        "index": idx,
+    }
+    if tokens is not None:
+        chunk["tokens"] = tokens
+    return chunk
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 1000, overlap: int = 200) -> Iterator[dict]:
+    """Chunk a stream of text pieces into overlapping windows of approx chunk_size.
+
+    Produces exactly the chunks ``chunk_text("".join(pieces))`` would, but only
+    keeps about one chunk of text buffered at a time.
+    """
     if chunk_size <= overlap:
         raise ValueError("chunk_size must be greater than overlap")
-    chunks = []
+    buf = ""
+    buf_start = 0  # offset of buf[0] in the whole text
     start = 0
-    text_len = len(text)
     idx = 0
+    for piece in pieces:
+        if not piece:
+            continue
+        buf += piece
+        # Only emit windows that are known not to be the last one: the final
+        # window is decided once the stream ends.
+        while start + chunk_size < buf_start + len(buf):
+            end = start + chunk_size
+            yield _make_chunk(buf[start - buf_start:end - buf_start], start, end, idx)
+            idx += 1
+            start = end - overlap
+        buf = buf[start - buf_start:]
+        buf_start = start
+    text_len = buf_start + len(buf)
     while start < text_len:
         end = min(start + chunk_size, text_len)
-        chunk = text[start:end]
-        chunks.append({
-            "id": f"chunk_{idx}_{uuid.uuid4().hex[:8]}",
-            "text": chunk,
-            "start": start,
-            "end": end,
-            "index": idx,
-        })
+        yield _make_chunk(buf[start - buf_start:end - buf_start], start, end, idx)
         idx += 1
         if end == text_len:
             break
         start = end - overlap
-    return chunks
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[dict]:
+    """Chunk text into overlapping windows of approx chunk_size."""
+    return list(iter_chunks([text], chunk_size=chunk_size, overlap=overlap))
+
+
+def estimate_tokens(texts: Sequence[str]) -> np.ndarray:
+    """Rough token counts (words and punctuation) for when no tokenizer is available."""
+    return np.fromiter((len(_WORDPIECE.findall(t)) for t in texts), dtype=np.int64, count=len(texts))
+
+
+def token_counter(model_name: Optional[str] = None) -> TokenCounter:
+    """Batched token counter using the embedding model's own tokenizer.
+
+    Falls back to estimate_tokens() if the model has no usable tokenizer.
+    """
+    from .config import EMBED_MODEL, EMBED_DEVICE
+    from .model_registry import get_model
+    try:
+        tokenizer = getattr(get_model(model_name or EMBED_MODEL, EMBED_DEVICE), 'tokenizer', None)
+    except Exception:
+        logging.warning("Could not load the embedding model for tokenization", exc_info=True)
+        tokenizer = None
+    if tokenizer is None or not callable(tokenizer):
+        logging.warning("No tokenizer available; chunk sizes are estimated")
+        return estimate_tokens
+
+    def count(texts: Sequence[str]) -> np.ndarray:
+        ids = tokenizer(list(texts), add_special_tokens=False, return_attention_mask=False,
+                        return_token_type_ids=False)["input_ids"]
+        return np.fromiter(map(len, ids), dtype=np.int64, count=len(ids))
+    return count
+
+
+def iter_segments(pieces: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    """Split a stream of text into sentence/line segments, yielding (text, start offset)."""
+    buf = ""
+    offset = 0  # offset of buf[0] in the whole text
+    for piece in pieces:
+        if not piece:
+            continue
+        buf += piece
+        ends = [m.end() for m in _SEGMENT_END.finditer(buf)]
+        # a boundary touching the end of the buffer may continue in the next piece
+        if ends and ends[-1] == len(buf):
+            ends.pop()
+        cuts, pos = [], 0
+        for end in ends:
+            while end - pos > MAX_SEGMENT_CHARS:
+                pos += MAX_SEGMENT_CHARS
+                cuts.append(pos)
+            cuts.append(end)
+            pos = end
+        while len(buf) - pos > MAX_SEGMENT_CHARS:
+            pos += MAX_SEGMENT_CHARS
+            cuts.append(pos)
+        starts = [0] + cuts[:-1]
+        yield from zip([buf[a:b] for a, b in zip(starts, cuts)], [offset + a for a in starts])
+        buf = buf[pos:]
+        offset += pos
+    if buf:
+        yield buf, offset
+
+
+def _split_oversized(text: str, start: int, tokens: int, max_tokens: int,
+                     count_tokens: TokenCounter) -> List[Tuple[str, int, int]]:
+    # cut a segment longer than the budget at whitespace, re-counting the parts
+    parts = math.ceil(tokens / max_tokens) + 1
+    step = max(1, len(text) // parts)
+    cuts, pos = [0], 0
+    while len(text) - pos > step:
+        cut = text.rfind(" ", pos + 1, pos + step + 1)
+        pos = cut + 1 if cut > pos else pos + step
+        cuts.append(pos)
+    cuts.append(len(text))
+    pieces = [(text[a:b], start + a) for a, b in zip(cuts, cuts[1:]) if b > a]
+    counts = count_tokens([p for p, _ in pieces])
+    out = []
+    for (piece, piece_start), n in zip(pieces, counts):
+        if n > max_tokens and len(piece) > 1:
+            out.extend(_split_oversized(piece, piece_start, int(n), max_tokens, count_tokens))
+        else:
+            out.append((piece, piece_start, int(n)))
+    return out
+
+
+def iter_token_chunks(pieces: Iterable[str], max_tokens: int = 250, overlap_tokens: int = 32,
+                      count_tokens: TokenCounter = estimate_tokens) -> Iterator[dict]:
+    """Pack sentence/line segments into chunks of at most ``max_tokens`` tokens.
+
+    Chunks end on segment boundaries (never mid-word unless a single segment
+    exceeds the budget), a Markdown heading always starts a new chunk, and
+    consecutive chunks share up to ``overlap_tokens`` tokens of whole
+    segments. Segments are tokenized in batches and packed with prefix sums,
+    so the tokenizer is called once per TOKENIZE_BATCH segments, not per
+    chunk. Each chunk carries its ``tokens`` count (the sum over its segments).
+    """
+    if max_tokens <= overlap_tokens:
+        raise ValueError("max_tokens must be greater than overlap_tokens")
+    texts: List[str] = []
+    starts: List[int] = []
+    counts = np.zeros(0, dtype=np.int64)
+    idx = 0
+
+    def take(final: bool):
+        # emit every chunk that cannot grow any more; return the segments to keep
+        nonlocal idx, counts
+        cum = np.concatenate(([0], np.cumsum(counts)))
+        heads = np.fromiter((i for i, t in enumerate(texts) if _HEADING.match(t)), dtype=np.int64)
+        i, n = 0, len(texts)
+        while i < n:
+            j = int(np.searchsorted(cum, cum[i] + max_tokens, side="right")) - 1
+            h = int(np.searchsorted(heads, i, side="right"))
+            ends_at_heading = h < len(heads) and heads[h] <= j
+            if ends_at_heading:
+                j = int(heads[h])
+            elif j >= n and not final:
+                break  # the chunk starting at i may still grow
+            j = max(min(j, n), i + 1)
+            text = "".join(texts[i:j])
+            body = text.strip()
+            if body:
+                start = starts[i] + len(text) - len(text.lstrip())
+                yield _make_chunk(body, start, start + len(body), idx, int(cum[j] - cum[i]))
+                idx += 1
+            if j >= n:
+                i = n
+                break
+            if ends_at_heading:
+                nxt = j
+            else:
+                # step back by up to overlap_tokens, but keep room for segment j in the next chunk
+                nxt = max(int(np.searchsorted(cum, cum[j] - overlap_tokens, side="left")),
+                          int(np.searchsorted(cum, cum[j + 1] - max_tokens, side="left")))
+            i = max(min(nxt, j), i + 1)
+        del texts[:i], starts[:i]
+        counts = counts[i:]
+
+    def add(batch: List[Tuple[str, int]]):
+        nonlocal counts
+        batch_counts = count_tokens([t for t, _ in batch])
+        new_counts = []
+        for (text, start), n in zip(batch, batch_counts):
+            if n > max_tokens:
+                for piece, piece_start, m in _split_oversized(text, start, int(n), max_tokens, count_tokens):
+                    texts.append(piece)
+                    starts.append(piece_start)
+                    new_counts.append(m)
+            else:
+                texts.append(text)
+                starts.append(start)
+                new_counts.append(int(n))
+        counts = np.concatenate((counts, np.asarray(new_counts, dtype=np.int64)))
+
+    batch: List[Tuple[str, int]] = []
+    for segment in iter_segments(pieces):
+        batch.append(segment)
+        if len(batch) >= TOKENIZE_BATCH:
+            add(batch)
+            batch = []
+            yield from take(final=False)
+    if batch:
+        add(batch)
+    yield from take(final=True)
@@ -1,21 +1,151 @@
 import os
 
+
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
 # Qdrant
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "user_docs")
+QDRANT_PREFER_GRPC = _env_bool("QDRANT_PREFER_GRPC")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", 6334))
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", 10))  # connections (REST) or channels (gRPC) per client
+QDRANT_UPLOAD_BATCH = int(os.getenv("QDRANT_UPLOAD_BATCH", 256))  # points per upload request
+QDRANT_UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL", 1))  # upload worker processes
+# Payload fields indexed when a collection is set up, comma-separated "field" or "field:type"
+# (type keyword, integer or bool; default keyword) -> {field: type}
+QDRANT_PAYLOAD_INDEXES = {name.strip(): kind.strip() or "keyword" for name, _, kind in
+                          (f.partition(":") for f in os.getenv("QDRANT_PAYLOAD_INDEXES", "file_id").split(","))
+                          if name.strip()}
+# Vector quantization for new collections: "" (none) | scalar (int8, 4x smaller) | binary (32x smaller)
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "").strip().lower()
+QDRANT_ON_DISK = _env_bool("QDRANT_ON_DISK")  # keep original vectors on disk, quantized ones in RAM
+QDRANT_RESCORE = _env_bool("QDRANT_RESCORE", "true")  # rescore quantized candidates with original vectors
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", 2.0))  # candidates fetched per result before rescoring
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", 0))  # default search ef; 0 uses the server setting
+
+# Vector store backend: qdrant (server) or local (in-process, persisted under LOCAL_INDEX_DIR)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+# Local backend: collections at least this large are searched with HNSW
+# (requires hnswlib; 0 disables it), others with an exact flat scan
+LOCAL_HNSW_THRESHOLD = int(os.getenv("LOCAL_HNSW_THRESHOLD", 50000))
+LOCAL_HNSW_M = int(os.getenv("LOCAL_HNSW_M", 16))
+LOCAL_HNSW_EF_CONSTRUCTION = int(os.getenv("LOCAL_HNSW_EF_CONSTRUCTION", 200))
+LOCAL_HNSW_EF = int(os.getenv("LOCAL_HNSW_EF", 64))  # search-time candidate list size
 
 # Embeddings
 EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
 EMBED_DIM = int(os.getenv("EMBED_DIM", 384))
+EMBED_DEVICE = os.getenv("EMBED_DEVICE", "")  # e.g. cpu, cuda; empty lets the library choose
+EMBED_WARMUP = _env_bool("EMBED_WARMUP", "true")  # load the model at app startup
+EMBED_NORMALIZE = _env_bool("EMBED_NORMALIZE")  # L2-normalize embeddings at encode time
+EMBED_DTYPE = os.getenv("EMBED_DTYPE", "float32")  # float32 | float16
+# Inference backend of the embedding model: torch, or onnx / openvino (sentence-transformers >= 3.2,
+# with optimum installed). EMBED_ONNX_FILE picks an exported file, e.g. onnx/model_qint8_avx512_vnni.onnx
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "")
+EMBED_QUANTIZE = os.getenv("EMBED_QUANTIZE", "").strip().lower()  # "" | int8 (dynamic quantization, torch on CPU)
+# Query embeddings from concurrent requests are coalesced into one encode call
+# of up to EMBED_BATCH_MAX texts, waiting at most EMBED_BATCH_WAIT_MS for more
+EMBED_BATCHING = _env_bool("EMBED_BATCHING", "true")
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", 64))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 2))
 
 # LLM
 LLM_ENDPOINT = os.getenv("LLM_ENDPOINT", "")  # e.g. https://api.groq.ai/v1/generate
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 100))  # keep-alive connections shared by all LLM calls
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))  # in-flight requests per provider
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))  # seconds, doubled on every retry
+
+# Batched queries (/query/batch): max questions per request and concurrent LLM calls per batch
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", 5000))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 8))
+
+# Query caches: entry limits (0 disables) and TTL in seconds for search results
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", 10000))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 10000))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 300))
+
+# Semantic answer cache (opt-in): reuse an answer when a new query embeds within
+# SEMANTIC_CACHE_THRESHOLD cosine similarity and retrieves the same sources
+SEMANTIC_CACHE_ENABLED = _env_bool("SEMANTIC_CACHE_ENABLED")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1000))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 3600))
 
-# Chunking
+# Retrieval: default mode (dense | lexical | hybrid), reciprocal-rank-fusion k,
+# and how many candidates per list (x top_k) hybrid search fuses
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+RRF_K = int(os.getenv("RRF_K", 60))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 4))
+# Maintain the in-process BM25 index at ingest time (needed for lexical/hybrid)
+LEXICAL_INDEX_ENABLED = _env_bool("LEXICAL_INDEX_ENABLED", "true")
+
+# Chunking: "tokens" packs sentences/lines into chunks of at most CHUNK_MAX_TOKENS
+# tokens of the embedding model's tokenizer and starts a new chunk at headings;
+# "chars" is the fixed-size character splitter (CHUNK_SIZE / CHUNK_OVERLAP)
+CHUNKER = os.getenv("CHUNKER", "tokens")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 250))  # keep below the model's max sequence length
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
 
+# Context packing for the LLM prompt: merge adjacent chunks of a file, drop
+# near-duplicates (MMR over the retrieved vectors) and fill a token budget.
+# CONTEXT_TOKEN_BUDGETS overrides the budget per model, e.g. "gpt-4o:12000,gpt-3.5-turbo:3000"
+CONTEXT_PACKING = _env_bool("CONTEXT_PACKING", "true")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_TOKEN_BUDGETS = {
+    model.strip(): int(budget)
+    for model, _, budget in (item.rpartition(":") for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(","))
+    if model.strip()
+}
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))  # 1.0 = relevance only
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.95))  # cosine; at or above is a duplicate
+
+# Extraction: PDF page-range sharding across processes and the extracted-text cache
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+EXTRACT_SHARD_PAGES = int(os.getenv("EXTRACT_SHARD_PAGES", 16))  # pages per worker task
+EXTRACT_MIN_PARALLEL_PAGES = int(os.getenv("EXTRACT_MIN_PARALLEL_PAGES", 64))  # smaller PDFs stay serial
+EXTRACT_CACHE = _env_bool("EXTRACT_CACHE", "true")
+
+# Ingestion: chunks embedded and upserted per batch (bounds peak memory)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+
+# Background jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_EXECUTOR = os.getenv("JOB_EXECUTOR", "thread")  # thread | process (process needs JOB_DB_PATH)
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "")  # SQLite file for persistent jobs; empty keeps them in memory
+# Seconds without a heartbeat from a job's owner before another worker resumes it
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+
 # Storage
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1 << 20))  # bytes copied per read/write
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 1 << 30))  # 0 disables the limit
+DATA_DIR = os.getenv("DATA_DIR", "./data")  # local service state (indexes, caches)
+# SQLite index of chunk hashes already ingested per (vector backend, collection, file_id)
+CHUNK_INDEX_PATH = os.getenv("CHUNK_INDEX_PATH", os.path.join(DATA_DIR, "chunk_index.db"))
+# Extracted text keyed by source file SHA-256
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join(DATA_DIR, "extract_cache"))
+# Search-cache version token per collection, shared by every process using DATA_DIR
+COLLECTION_VERSION_DIR = os.getenv("COLLECTION_VERSION_DIR", os.path.join(DATA_DIR, "collection_versions"))
+# BM25 (SQLite FTS5) indexes, one file per vector backend and collection
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(DATA_DIR, "lexical"))
+# Local vector store collections (VECTOR_BACKEND=local), one directory each
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(DATA_DIR, "vectors"))
+
+# Observability: per-stage latency histograms are served at /metrics (Prometheus
+# text format); TIMING_HEADER adds a Server-Timing breakdown to every response
+METRICS_BUCKETS = [float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",") if b.strip()]
+TIMING_HEADER = _env_bool("TIMING_HEADER")
+# Export stage spans with OpenTelemetry (needs opentelemetry-sdk and the OTLP exporter)
+OTEL_ENABLED = _env_bool("OTEL_ENABLED")
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "rag-service")
@@ -0,0 +1,194 @@
+"""Context packing: fit retrieved chunks into the LLM's prompt budget.
+
+Retrieved hits often repeat themselves: neighbouring chunks of a file share
+their overlap, and near-identical passages (boilerplate, copies of the same
+document) rank next to each other. pack_context() drops exact and near
+duplicates, orders the rest by maximal marginal relevance over the retrieved
+vectors, keeps as many as fit a token budget and merges chunks that are
+adjacent in the same file into one block without repeating the overlap.
+"""
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .chunker import estimate_tokens
+from .config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGETS, CONTEXT_MMR_LAMBDA, CONTEXT_DEDUP_THRESHOLD
+
+# Longest overlap searched for when chunks carry no offsets
+MAX_OVERLAP_CHARS = 2000
+
+# model -> tiktoken encoding, or None when tiktoken does not know the model
+_encodings: Dict[str, object] = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: str):
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except Exception:
+                # not installed, unknown model or no network to fetch the BPE ranks
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def token_counter(model: Optional[str] = None) -> Callable[[Sequence[str]], np.ndarray]:
+    """Batched token counter for an LLM: tiktoken if it knows ``model``, else estimate_tokens()."""
+    encoding = _encoding(model) if model else None
+    if encoding is None:
+        return estimate_tokens
+
+    def count(texts: Sequence[str]) -> np.ndarray:
+        return np.fromiter((len(ids) for ids in encoding.encode_ordinary_batch(list(texts))), dtype=np.int64,
+                           count=len(texts))
+    return count
+
+
+def context_budget(model: Optional[str] = None) -> int:
+    """Context token budget for ``model``: the longest CONTEXT_TOKEN_BUDGETS prefix match, else the default."""
+    matches = [name for name in CONTEXT_TOKEN_BUDGETS if model and model.startswith(name)]
+    return CONTEXT_TOKEN_BUDGETS[max(matches, key=len)] if matches else CONTEXT_TOKEN_BUDGET
+
+
+def _text(hit: dict) -> str:
+    return (hit.get('payload') or {}).get('text') or ''
+
+
+def _dedup_exact(hits: List[dict]) -> List[dict]:
+    seen, unique = set(), []
+    for h in hits:
+        payload = h.get('payload') or {}
+        key = payload.get('hash') or _text(h)
+        if key not in seen:
+            seen.add(key)
+            unique.append(h)
+    return unique
+
+
+def mmr_order(hits: List[dict], lambda_: float = CONTEXT_MMR_LAMBDA,
+              threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[dict]:
+    """Order hits by maximal marginal relevance, dropping near-duplicates.
+
+    Relevance is the retrieval score scaled to [0, 1]; redundancy is the
+    highest cosine similarity to an already selected hit, using the hits'
+    ``vector``. A hit at or above ``threshold`` similarity is dropped. Hits
+    without a vector (e.g. lexical-only) are never penalised.
+    """
+    if len(hits) < 2:
+        return list(hits)
+    scores = np.array([float(h.get('score') or 0.0) for h in hits])
+    spread = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / spread if spread > 0 else np.ones(len(hits))
+    dims = {len(h['vector']) for h in hits if h.get('vector') is not None}
+    vectors = np.zeros((len(hits), dims.pop() if len(dims) == 1 else 0), dtype=np.float32)
+    if vectors.shape[1]:
+        for i, h in enumerate(hits):
+            if h.get('vector') is not None:
+                vectors[i] = h['vector']
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1.0)
+
+    redundancy = np.zeros(len(hits))
+    remaining = list(range(len(hits)))
+    order = []
+    while remaining:
+        cand = np.array(remaining)
+        best = int(cand[np.argmax(lambda_ * relevance[cand] - (1 - lambda_) * redundancy[cand])])
+        order.append(hits[best])
+        remaining.remove(best)
+        if remaining and vectors.shape[1]:
+            sims = vectors[remaining] @ vectors[best]
+            redundancy[remaining] = np.maximum(redundancy[remaining], sims)
+            remaining = [r for r, s in zip(remaining, sims) if s < threshold]
+    return order
+
+
+def _overlap(prev: dict, nxt: dict) -> int:
+    """Characters at the start of ``nxt``'s text that repeat the end of ``prev``'s."""
+    a, b = prev.get('payload') or {}, nxt.get('payload') or {}
+    a_text, b_text = a.get('text') or '', b.get('text') or ''
+    if all(isinstance(p.get(k), int) for p in (a, b) for k in ('start', 'end')):
+        shared = min(max(0, a['end'] - b['start']), len(b_text), len(a_text))
+        if not shared or b_text[:shared] == a_text[-shared:]:
+            return shared
+        # offsets from different versions of the file, e.g. an edited chunk next to a skipped one
+    for k in range(min(len(a_text), len(b_text), MAX_OVERLAP_CHARS), 0, -1):
+        if b_text.startswith(a_text[-k:]):
+            return k
+    return 0
+
+
+def _adjacent(prev: dict, nxt: dict) -> bool:
+    a, b = prev.get('payload') or {}, nxt.get('payload') or {}
+    return (a.get('file_id') is not None and a.get('file_id') == b.get('file_id')
+            and isinstance(a.get('index'), int) and b.get('index') == a['index'] + 1)
+
+
+def _merge(hits: List[dict]) -> List[dict]:
+    """Merge runs of adjacent chunks of the same file into blocks, keeping the hits' rank order."""
+    rank = {id(h): i for i, h in enumerate(hits)}
+    ordered = sorted(hits, key=lambda h: (str((h.get('payload') or {}).get('file_id')),
+                                          (h.get('payload') or {}).get('index') or 0))
+    blocks = []
+    prev = None
+    for h in ordered:
+        if prev is not None and _adjacent(prev, h):
+            block = blocks[-1]
+            shared = _overlap(prev, h)
+            # without any overlap the chunks may have been split at a stripped line break
+            block['text'] += _text(h)[shared:] if shared else "\n" + _text(h)
+            block['ids'].append(h.get('id'))
+            block['rank'] = min(block['rank'], rank[id(h)])
+        else:
+            blocks.append({'ids': [h.get('id')], 'text': _text(h), 'rank': rank[id(h)]})
+        prev = h
+    blocks.sort(key=lambda b: b['rank'])
+    for b in blocks:
+        del b['rank']
+    return blocks
+
+
+def pack_context(hits: List[dict], budget: Optional[int] = None, count_tokens=estimate_tokens,
+                 lambda_: float = CONTEXT_MMR_LAMBDA, threshold: float = CONTEXT_DEDUP_THRESHOLD) -> dict:
+    """Pack retrieved hits into at most ``budget`` context tokens.
+
+    Returns ``{'blocks': [{'ids': [...], 'text': ...}], 'tokens_before',
+    'tokens_after', 'chunks_in', 'chunks_used'}``; blocks are in relevance
+    order and the token counts cover the hits' texts before and the blocks'
+    texts after packing. The best hit is truncated if it alone exceeds the
+    budget, so the context is never empty when something was retrieved.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    texts = [_text(h) for h in hits]
+    tokens_before = int(count_tokens(texts).sum()) if texts else 0
+    candidates = mmr_order(_dedup_exact([h for h, t in zip(hits, texts) if t.strip()]), lambda_, threshold)
+    costs = count_tokens([_text(h) for h in candidates]) if candidates else []
+
+    selected, used = [], 0
+    for h, cost in zip(candidates, costs):
+        # an adjacent chunk already selected makes the shared overlap free
+        neighbour = next((s for s in selected if _adjacent(s, h) or _adjacent(h, s)), None)
+        if neighbour is not None and len(_text(h)):
+            shared = _overlap(*((neighbour, h) if _adjacent(neighbour, h) else (h, neighbour)))
+            cost = int(cost) * (len(_text(h)) - shared) // len(_text(h))
+        if used + cost <= budget:
+            selected.append(h)
+            used += int(cost)
+        elif not selected and budget > 0:
+            text = _text(h)[:len(_text(h)) * budget // max(1, int(cost))]
+            logging.debug("Truncated context chunk %s to %d characters", h.get('id'), len(text))
+            selected.append({**h, 'payload': {**(h.get('payload') or {}), 'text': text}})
+            break
+
+    blocks = _merge(selected)
+    return {
+        'blocks': blocks,
+        'tokens_before': tokens_before,
+        'tokens_after': int(count_tokens([b['text'] for b in blocks]).sum()) if blocks else 0,
+        'chunks_in': len(hits),
+        'chunks_used': len(selected),
+    }
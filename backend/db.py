@@ -0,0 +1,15 @@
+import sqlite3
+from contextlib import closing, contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def sqlite_transaction(path: str, timeout: float = 30) -> Iterator[sqlite3.Connection]:
+    """Open a short-lived connection to ``path`` for one transaction.
+
+    Commits on success, rolls back on error and always closes the
+    connection (sqlite3's own context manager only commits). One
+    connection per call keeps the stores safe across threads and processes.
+    """
+    with closing(sqlite3.connect(path, timeout=timeout)) as conn, conn:
+        yield conn
@@ -1,23 +1,31 @@
 from typing import List
 
+import numpy as np
+
+from .config import EMBED_MODEL, EMBED_DEVICE, EMBED_NORMALIZE, EMBED_DTYPE
+from .model_registry import get_model
+
 
 class Embedder:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = EMBED_MODEL, device: str = EMBED_DEVICE,
+                 normalize: bool = EMBED_NORMALIZE, dtype: str = EMBED_DTYPE):
         self.model_name = model_name
+        self.device = device
+        self.normalize = normalize
+        self.dtype = np.dtype(dtype)
         self.model = None
 
     def _load(self):
         if self.model is None:
-            try:
-                from sentence_transformers import SentenceTransformer
-            except Exception as e:
-                raise RuntimeError("sentence-transformers not installed") from e
-            self.model = SentenceTransformer(self.model_name)
+            # the registry keeps one model per (name, device) for the whole process
+            self.model = get_model(self.model_name, self.device)
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a contiguous (len(texts), dim) array of ``self.dtype``."""
         self._load()
-        embs = self.model.encode(texts, show_progress_bar=False)
-        return embs.tolist() if hasattr(embs, 'tolist') else embs
+        embs = self.model.encode(texts, show_progress_bar=False, convert_to_numpy=True,
+                                 normalize_embeddings=self.normalize)
+        return np.ascontiguousarray(embs, dtype=self.dtype)
 
-    def embed_text(self, text: str) -> List[float]:
+    def embed_text(self, text: str) -> np.ndarray:
         return self.embed_texts([text])[0]
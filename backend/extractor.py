@@ -1,34 +1,250 @@
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
 from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
 
+from .config import (
+    EXTRACT_WORKERS, EXTRACT_SHARD_PAGES, EXTRACT_MIN_PARALLEL_PAGES, EXTRACT_CACHE, EXTRACT_CACHE_DIR,
+)
 
-def extract_text_from_pdf(path: str) -> str:
+# Plain-text files are streamed in blocks of this many characters
+TEXT_BLOCK_SIZE = 1 << 20
+# CSV rows per yielded piece
+CSV_ROWS_PER_PIECE = 500
+
+# extension -> (extractor, cacheable). Extractors take a path and yield text
+# pieces whose concatenation is the document text.
+_EXTRACTORS: Dict[str, Tuple[Callable[[str], Iterator[str]], bool]] = {}
+
+
+def register_extractor(*exts: str, cache: bool = True):
+    """Register a piece-yielding extractor for file extensions (e.g. ".pdf").
+
+    ``cache`` controls whether its output is stored in the extracted-text
+    cache; cheap formats (plain text) are not worth the disk.
+    """
+    def decorator(func):
+        for ext in exts:
+            _EXTRACTORS[ext.lower()] = (func, cache)
+        return func
+    return decorator
+
+
+def _extract_pdf_range(path: str, start: int, end: int) -> List[str]:
+    # runs in a worker process: each shard opens its own reader
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+@register_extractor(".pdf")
+def iter_text_from_pdf(path: str, workers: int = EXTRACT_WORKERS, shard_pages: int = EXTRACT_SHARD_PAGES,
+                       min_parallel_pages: int = EXTRACT_MIN_PARALLEL_PAGES) -> Iterator[str]:
+    """Yield PDF pages in order; large PDFs are sharded by page range across processes.
+
+    Below ``min_parallel_pages`` pages, starting worker processes costs more
+    than it saves, so pages are extracted lazily in this process.
+    """
     try:
         from pypdf import PdfReader
     except Exception:
         raise RuntimeError("pypdf not installed; install pypdf or pypdf2")
-    text = []
     reader = PdfReader(path)
-    for p in reader.pages:
-        text.append(p.extract_text() or "")
-    return "\n".join(text)
+    num_pages = len(reader.pages)
+    if workers <= 1 or num_pages < max(min_parallel_pages, 2 * shard_pages):
+        for i, p in enumerate(reader.pages):
+            text = p.extract_text() or ""
+            yield text if i == 0 else "\n" + text
+        return
+    del reader
+    shards = [(s, min(s + shard_pages, num_pages)) for s in range(0, num_pages, shard_pages)]
+    first = True
+    # spawn, not fork: the parent may hold model/threads state that must not be forked
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # keep a bounded window of shards in flight so memory does not grow with page count
+        window = 2 * workers
+        futures = [pool.submit(_extract_pdf_range, path, s, e) for s, e in shards[:window]]
+        next_shard = len(futures)
+        while futures:
+            pages = futures.pop(0).result()
+            if next_shard < len(shards):
+                s, e = shards[next_shard]
+                futures.append(pool.submit(_extract_pdf_range, path, s, e))
+                next_shard += 1
+            for text in pages:
+                yield text if first else "\n" + text
+                first = False
 
 
-def extract_text_from_docx(path: str) -> str:
+@register_extractor(".docx", ".doc")
+def iter_text_from_docx(path: str) -> Iterator[str]:
     try:
         import docx
     except Exception:
         raise RuntimeError("python-docx not installed; install python-docx")
     doc = docx.Document(path)
-    paragraphs = [p.text for p in doc.paragraphs]
-    return "\n".join(paragraphs)
+    for i, p in enumerate(doc.paragraphs):
+        yield p.text if i == 0 else "\n" + p.text
 
 
-def extract_text(path: str) -> str:
-    ext = Path(path).suffix.lower()
-    if ext in (".pdf",):
-        return extract_text_from_pdf(path)
-    if ext in (".docx", ".doc"):
-        return extract_text_from_docx(path)
-    # fallback: read as text
+class _HTMLText(HTMLParser):
+    _SKIP = {"script", "style", "noscript", "template"}
+    _BLOCK = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article",
+              "header", "footer", "pre", "blockquote", "table", "ul", "ol"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skipping += 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skipping:
+            self._skipping -= 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+@register_extractor(".html", ".htm")
+def iter_text_from_html(path: str) -> Iterator[str]:
+    parser = _HTMLText()
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        while True:
+            block = f.read(TEXT_BLOCK_SIZE)
+            if not block:
+                break
+            parser.feed(block)
+            if parser.parts:
+                yield _BLANK_LINES.sub("\n\n", "".join(parser.parts))
+                parser.parts = []
+    parser.close()
+    if parser.parts:
+        yield _BLANK_LINES.sub("\n\n", "".join(parser.parts))
+
+
+_MD_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_MD_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+
+
+@register_extractor(".md", ".markdown")
+def iter_text_from_markdown(path: str) -> Iterator[str]:
+    # Keep headings and structure; only drop link/image targets, which are noise for embeddings.
+    for block in iter_text_from_file(path):
+        yield _MD_LINK.sub(r"\1", _MD_IMAGE.sub(r"\1", block))
+
+
+@register_extractor(".csv", ".tsv")
+def iter_text_from_csv(path: str) -> Iterator[str]:
+    """Yield rows as "column: value" lines so each row reads as a record."""
+    delimiter = "\t" if path.lower().endswith(".tsv") else ","
+    with open(path, 'r', encoding='utf-8', errors='ignore', newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return
+        lines = []
+        first = True
+        for row in reader:
+            lines.append("; ".join(f"{h}: {v}" for h, v in zip(header, row) if v))
+            if len(lines) >= CSV_ROWS_PER_PIECE:
+                yield ("" if first else "\n") + "\n".join(lines)
+                first = False
+                lines = []
+        if lines:
+            yield ("" if first else "\n") + "\n".join(lines)
+
+
+def iter_text_from_file(path: str, block_size: int = TEXT_BLOCK_SIZE) -> Iterator[str]:
     with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-        return f.read()
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def file_sha256(path: str, block_size: int = TEXT_BLOCK_SIZE) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _iter_cached(path: str, extractor: Callable[[str], Iterator[str]], ext: str) -> Iterator[str]:
+    """Serve pieces from the extracted-text cache, or extract and fill it.
+
+    Cache files are JSON lines (one piece per line) named by the source file's
+    SHA-256, so a re-ingest of identical content skips parsing entirely.
+    """
+    cache_path = Path(EXTRACT_CACHE_DIR) / f"{file_sha256(path)}{ext}.jsonl"
+    if cache_path.exists():
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+        return
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # unique per call: job threads of one process may extract the same bytes at once
+    tmp_path = cache_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    complete = False
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for piece in extractor(path):
+                f.write(json.dumps(piece) + "\n")
+                yield piece
+        complete = True
+    finally:
+        if complete:
+            os.replace(tmp_path, cache_path)
+        else:
+            # partial extraction (error or consumer stopped early) must not be cached
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                logging.debug(f"Could not remove {tmp_path}")
+
+
+def iter_text(path: str) -> Iterator[str]:
+    """Yield a document's text one page (PDF), paragraph (docx) or block at a time.
+
+    Separators are included, so ``"".join(iter_text(path)) == extract_text(path)``.
+    Extractors are picked by extension (see register_extractor); unknown
+    extensions are read as text.
+    """
+    ext = Path(path).suffix.lower()
+    extractor, cacheable = _EXTRACTORS.get(ext, (iter_text_from_file, False))
+    if cacheable and EXTRACT_CACHE:
+        return _iter_cached(path, extractor, ext)
+    return extractor(path)
+
+
+def extract_text_from_pdf(path: str) -> str:
+    return "".join(iter_text_from_pdf(path))
+
+
+def extract_text_from_docx(path: str) -> str:
+    return "".join(iter_text_from_docx(path))
+
+
+def extract_text(path: str) -> str:
+    return "".join(iter_text(path))
@@ -0,0 +1,207 @@
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from .cache import invalidate_collection
+from .chunk_index import ChunkIndex
+from .chunker import iter_chunks, iter_token_chunks, token_counter
+from .config import (
+    CHUNKER, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_SIZE, CHUNK_OVERLAP, QDRANT_COLLECTION,
+    INGEST_BATCH_SIZE, LEXICAL_INDEX_ENABLED,
+)
+from .embedder import Embedder
+from .extractor import iter_text
+from . import lexical, metrics
+from .vectorstore import get_store
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _timed(items: Iterable, timings: dict, key: str) -> Iterator:
+    """Yield from ``items``, adding the time spent producing each item to ``timings[key]``."""
+    it = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            timings[key] += time.perf_counter() - t0
+        yield item
+
+
+# Namespace for deterministic point ids (uuid5 of file id + chunk content hash)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c7a52-3d4e-4b8a-9a57-2f0f2d1f5c11")
+
+
+def point_id(file_id: str, chunk_hash: str) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{file_id}:{chunk_hash}"))
+
+
+# Payload fields that locate a chunk in its file; they change when text is inserted above it
+POSITION_FIELDS = ("index", "chunk_id", "start", "end")
+
+
+def _payloads(chunks: List[dict], file_id: str) -> List[dict]:
+    # start/end (character offsets in the file) let context packing drop the overlap of adjacent chunks
+    return [{"text": c['text'], "file_id": file_id, "index": c['index'], "chunk_id": c['id'], "hash": c['hash'],
+             "start": c['start'], "end": c['end']} for c in chunks]
+
+
+def _chunks(pieces: Iterable[str], model_name: str) -> Iterator[dict]:
+    if CHUNKER == "tokens":
+        return iter_token_chunks(pieces, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                                 count_tokens=token_counter(model_name))
+    if CHUNKER != "chars":
+        raise ValueError(f"Unknown CHUNKER: {CHUNKER}")
+    return iter_chunks(pieces, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+
+
+def ingest_file(path: str, file_id: str, collection: str = QDRANT_COLLECTION,
+                batch_size: int = INGEST_BATCH_SIZE, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Stream a document through extract -> chunk -> embed -> upsert.
+
+    Work happens in batches of ``batch_size`` chunks and the upsert of one
+    batch overlaps with embedding the next, so peak memory is bounded by the
+    batch size rather than the document size. ``progress`` (if given) is
+    called with the running counters after every batch.
+
+    Ingestion is incremental: chunks whose content hash is already recorded
+    for ``file_id`` skip embedding and upsert, and points of chunks that are
+    no longer in the document are deleted. Skipped chunks that moved within
+    the document get their position fields (POSITION_FIELDS) updated in
+    place; ones the store turns out not to have are embedded again.
+    """
+    embedder = Embedder()
+    store = get_store(collection)
+    index = ChunkIndex()
+    known = index.known(collection, file_id)
+    lex = lexical.get_index(collection) if LEXICAL_INDEX_ENABLED else None
+    seen = set()
+    stats = {"pages": 0, "chunks": 0, "points": 0, "skipped": 0, "moved": 0, "deleted": 0}
+    # seconds per stage; extraction and chunking are streamed into each other,
+    # so "chunk" is the time spent producing batches minus the extraction in it
+    timings = dict.fromkeys(("extract", "chunk", "embed", "upsert"), 0.0)
+
+    def pages():
+        for page in _timed(iter_text(path), timings, "extract"):
+            stats["pages"] += 1
+            yield page
+
+    def upsert(chunks, embs):
+        # Qdrant requires point IDs to be either unsigned ints or UUIDs.
+        # The UUID is derived from file id + content hash, so re-ingesting a
+        # chunk overwrites its point instead of duplicating it; the chunk id
+        # stays in the payload so we can reference it later.
+        ids = [point_id(file_id, c['hash']) for c in chunks]
+        payloads = _payloads(chunks, file_id)
+        t0 = time.perf_counter()
+        with metrics.span("upsert", points=len(ids)):
+            store.upsert_arrays(ids, embs, payloads)
+        timings["upsert"] += time.perf_counter() - t0
+        if lex is not None:
+            lex.add_many((pid, c['text'], payload) for pid, c, payload in zip(ids, chunks, payloads))
+        index.add(collection, file_id, [(c['hash'], pid) for c, pid in zip(chunks, ids)])
+        # cached search results for this collection are now stale
+        invalidate_collection(collection)
+        return len(ids)
+
+    def reconcile(chunks) -> List[dict]:
+        """Update the positions of known chunks in the store; returns the ones the store does not have."""
+        ids = [known[c['hash']] for c in chunks]
+        stored = store.retrieve_payloads(ids, fields=list(POSITION_FIELDS))
+        indexed = lex.present(ids) if lex is not None else set()
+        missing, moved, reindex = [], {}, []
+        for pid, c, payload in zip(ids, chunks, _payloads(chunks, file_id)):
+            if pid not in stored:
+                # in the chunk index but not in the store, e.g. a write that never completed
+                missing.append(c)
+                continue
+            position = {k: payload[k] for k in POSITION_FIELDS}
+            if any(stored[pid].get(k) != v for k, v in position.items()):
+                moved[pid] = position
+            # also backfills chunks ingested before the lexical index existed
+            if lex is not None and (pid in moved or pid not in indexed):
+                reindex.append((pid, c['text'], payload))
+        if reindex:
+            lex.add_many(reindex)
+        if moved:
+            store.set_payloads(moved)
+            invalidate_collection(collection)
+            stats["moved"] += len(moved)
+        return missing
+
+    started = time.perf_counter()
+    try:
+        pending = None
+        with ThreadPoolExecutor(max_workers=1) as upserter:
+            for batch in _timed(_batched(_chunks(pages(), embedder.model_name), batch_size), timings, "chunk"):
+                stats["chunks"] += len(batch)
+                fresh, unchanged = [], []
+                for c in batch:
+                    # repeated text within the document maps to the same point
+                    if c['hash'] not in seen:
+                        (unchanged if c['hash'] in known else fresh).append(c)
+                    seen.add(c['hash'])
+                if unchanged:
+                    fresh += reconcile(unchanged)
+                stats["skipped"] += len(batch) - len(fresh)
+                if fresh:
+                    t0 = time.perf_counter()
+                    with metrics.span("embed", texts=len(fresh)):
+                        embs = embedder.embed_texts([c['text'] for c in fresh])
+                    timings["embed"] += time.perf_counter() - t0
+                    # wait for the previous upsert before queueing the next one so at
+                    # most two batches are alive at once
+                    if pending is not None:
+                        stats["points"] += pending.result()
+                    pending = upserter.submit(upsert, fresh, embs)
+                if progress is not None:
+                    progress(dict(stats))
+            if pending is not None:
+                stats["points"] += pending.result()
+        stale = [h for h in known if h not in seen]
+        if stale:
+            store.delete([known[h] for h in stale])
+            index.remove(collection, file_id, stale)
+            if lex is not None:
+                lex.remove_many(known[h] for h in stale)
+            invalidate_collection(collection)
+            stats["deleted"] = len(stale)
+    finally:
+        # also after a failure: persists what was upserted and releases a local store's write lock
+        store.flush()
+    if progress is not None:
+        progress(dict(stats))
+    elapsed = time.perf_counter() - started
+    timings["chunk"] -= timings["extract"]
+    # embed and upsert were observed per batch above
+    metrics.observe("extract", timings["extract"])
+    metrics.observe("chunk", timings["chunk"])
+    chunks_per_sec = stats["chunks"] / elapsed if elapsed > 0 else 0.0
+    logging.info(f"Ingested {path}: {stats['chunks']} chunks from {stats['pages']} pages "
+                 f"({stats['skipped']} unchanged, {stats['moved']} moved, {stats['deleted']} deleted) "
+                 f"in {elapsed:.2f}s ({chunks_per_sec:.1f} chunks/sec)")
+    return {
+        "ingested": True,
+        "num_chunks": stats["chunks"],
+        "pages": stats["pages"],
+        "points": stats["points"],
+        "skipped": stats["skipped"],
+        "moved": stats["moved"],
+        "deleted": stats["deleted"],
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(chunks_per_sec, 1),
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+    }
@@ -0,0 +1,259 @@
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from .config import JOB_WORKERS, JOB_EXECUTOR, JOB_DB_PATH, JOB_LEASE_SECONDS
+from .db import sqlite_transaction
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def _new_job(kind: str, params: dict) -> dict:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": QUEUED,
+        "params": params,
+        "progress": {},
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class MemoryJobStore:
+    """Jobs kept in a dict; lost when the process exits."""
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, params: dict, owner: Optional[str] = None) -> dict:
+        job = _new_job(kind, params)
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return dict(job)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def unfinished(self) -> List[dict]:
+        return []
+
+    def claim(self, job_id: str, owner: str, lease: float) -> bool:
+        return True
+
+    def heartbeat(self, owner: str):
+        pass
+
+
+class SQLiteJobStore:
+    """Jobs persisted in a local SQLite file so they survive restarts.
+
+    Every unfinished job is owned by one JobQueue, which keeps its
+    ``heartbeat`` fresh while it is alive; a queue only resumes jobs whose
+    owner stopped beating for longer than the lease (see claim()).
+    """
+
+    _COLUMNS = ("id", "kind", "status", "params", "progress", "result", "error", "created_at", "updated_at")
+    _JSON_FIELDS = ("params", "progress", "result")
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite_transaction(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT, status TEXT, params TEXT, progress TEXT,"
+                " result TEXT, error TEXT, created_at REAL, updated_at REAL, owner TEXT, heartbeat REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    def _row_to_job(self, row) -> dict:
+        job = dict(zip(self._COLUMNS, row))
+        for k in self._JSON_FIELDS:
+            job[k] = json.loads(job[k]) if job[k] is not None else None
+        return job
+
+    def create(self, kind: str, params: dict, owner: Optional[str] = None) -> dict:
+        job = _new_job(kind, params)
+        with sqlite_transaction(self.path) as conn:
+            conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], kind, job["status"], json.dumps(params), json.dumps(job["progress"]),
+                 None, None, job["created_at"], job["updated_at"], owner, job["created_at"]),
+            )
+        return job
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        cols, values = [], []
+        for k, v in fields.items():
+            cols.append(f"{k} = ?")
+            values.append(json.dumps(v) if k in self._JSON_FIELDS else v)
+        with sqlite_transaction(self.path) as conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(cols)} WHERE id = ?", (*values, job_id))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with sqlite_transaction(self.path) as conn:
+            row = conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def unfinished(self) -> List[dict]:
+        with sqlite_transaction(self.path) as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING),
+            ).fetchall()
+        return [self._row_to_job(r) for r in rows]
+
+    def claim(self, job_id: str, owner: str, lease: float) -> bool:
+        """Make ``owner`` the owner of an unfinished job whose owner's heartbeat is older than ``lease`` seconds.
+
+        The check and the takeover are one UPDATE, so of several queues
+        starting at once exactly one resumes the job.
+        """
+        now = time.time()
+        with sqlite_transaction(self.path) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET owner = ?, heartbeat = ?, status = ?, updated_at = ?"
+                " WHERE id = ? AND status IN (?, ?) AND (owner IS NULL OR heartbeat IS NULL OR heartbeat < ?)",
+                (owner, now, QUEUED, now, job_id, QUEUED, RUNNING, now - lease),
+            )
+        return cur.rowcount == 1
+
+    def heartbeat(self, owner: str):
+        """Renew the lease on every unfinished job of ``owner``."""
+        with sqlite_transaction(self.path) as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN (?, ?)",
+                         (time.time(), owner, QUEUED, RUNNING))
+
+
+def _ingest_handler(params: dict, progress: Callable[[dict], None]) -> dict:
+    from .ingest import ingest_file
+    return ingest_file(params["path"], params["file_id"], collection=params["collection"], progress=progress)
+
+
+HANDLERS: Dict[str, Callable[[dict, Callable[[dict], None]], dict]] = {
+    "ingest": _ingest_handler,
+}
+
+
+def run_job(store, job: dict):
+    """Run one job to completion, recording progress, result or error in ``store``."""
+    job_id = job["id"]
+    store.update(job_id, status=RUNNING, error=None)
+    try:
+        handler = HANDLERS[job["kind"]]
+        result = handler(job["params"], lambda p: store.update(job_id, progress=p))
+        store.update(job_id, status=DONE, result=result)
+    except Exception as e:
+        logging.exception(f"Job {job_id} ({job['kind']}) failed")
+        store.update(job_id, status=FAILED, error=f"{e}\n{traceback.format_exc()[-2000:]}")
+
+
+def _run_job_in_process(db_path: str, job: dict):
+    # worker processes reopen the SQLite store; that is how progress gets back to the API
+    run_job(SQLiteJobStore(db_path), job)
+
+
+class JobQueue:
+    """Background job runner: an in-process queue feeding a thread or process pool.
+
+    With a SQLite store several queues (uvicorn workers, restarts) share the
+    jobs table. Each queue renews the lease on its own jobs every
+    JOB_LEASE_SECONDS / 3 and resumes only jobs whose owner has let the
+    lease expire, at startup and on every renewal.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, executor: str = JOB_EXECUTOR, db_path: str = JOB_DB_PATH,
+                 lease: float = JOB_LEASE_SECONDS):
+        self.store = SQLiteJobStore(db_path) if db_path else MemoryJobStore()
+        self.db_path = db_path
+        self.workers = workers
+        self.executor_kind = executor
+        if executor == "process" and not db_path:
+            logging.warning("JOB_EXECUTOR=process needs JOB_DB_PATH to report progress; using threads")
+            self.executor_kind = "thread"
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._pool = None
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def start(self):
+        if self._pool is not None:
+            return
+        if self.executor_kind == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        # pick up jobs that were queued or interrupted before a restart
+        self._resume_orphans()
+        if self.db_path:
+            self._stop.clear()
+            self._heartbeat = threading.Thread(target=self._keep_alive, name="job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _resume_orphans(self):
+        for job in self.store.unfinished():
+            if self.store.claim(job["id"], self.owner, self.lease):
+                logging.info(f"Resuming job {job['id']} ({job['kind']})")
+                self._dispatch(job)
+
+    def _keep_alive(self):
+        while not self._stop.wait(self.lease / 3):
+            try:
+                self.store.heartbeat(self.owner)
+                self._resume_orphans()
+            except Exception:
+                logging.exception("Job lease renewal failed")
+
+    def _dispatch(self, job: dict):
+        if self.executor_kind == "process":
+            self._pool.submit(_run_job_in_process, self.db_path, job)
+        else:
+            self._pool.submit(run_job, self.store, job)
+
+    def submit(self, kind: str, params: dict) -> dict:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self.start()
+        job = self.store.create(kind, params, owner=self.owner)
+        self._dispatch(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def shutdown(self, wait: bool = False):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+
+job_queue = JobQueue()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import re
+import threading
+from heapq import nlargest
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .config import LEXICAL_INDEX_DIR, VECTOR_BACKEND
+from .db import sqlite_transaction
+from .vectorstore import validate_collection
+
+# Words plus identifier-like tokens such as ERR-1042, v2.3.1 or api/v1/users,
+# which dense embeddings tend to blur.
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers also contribute their parts."""
+    terms = []
+    for tok in _TOKEN.findall(text.lower()):
+        terms.append(tok)
+        if not tok.isalnum():
+            terms.extend(p for p in re.split(r"[-./:]", tok) if p)
+    return terms
+
+
+class LexicalIndex:
+    """BM25 index of a collection's chunks in a SQLite FTS5 table.
+
+    Documents are keyed by point id and keep their payload, so lexical hits
+    are returned without a round trip to the vector store. Every add or
+    remove is its own small transaction on the file, so ingests in several
+    processes update the index concurrently without rewriting it (or losing
+    each other's additions), and queries read the current state directly.
+    Ranking is FTS5's bm25() (k1=1.2, b=0.75) over the terms from tokenize().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with sqlite_transaction(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def __len__(self):
+        with sqlite_transaction(self.path) as conn:
+            return conn.execute("SELECT count(*) FROM docs").fetchone()[0]
+
+    def add(self, doc_id: str, text: str, payload: Optional[dict] = None):
+        self.add_many([(doc_id, text, payload)])
+
+    def add_many(self, docs: Iterable[Tuple[str, str, Optional[dict]]]):
+        """Add or replace (doc_id, text, payload) documents in one transaction."""
+        rows = [(str(doc_id), " ".join(tokenize(text)), json.dumps(payload or {})) for doc_id, text, payload in docs]
+        with sqlite_transaction(self.path) as conn:
+            conn.executemany(
+                "INSERT INTO docs (doc_id, terms, payload) VALUES (?, ?, ?)"
+                " ON CONFLICT (doc_id) DO UPDATE SET terms = excluded.terms, payload = excluded.payload",
+                rows,
+            )
+
+    def remove(self, doc_id: str):
+        self.remove_many([doc_id])
+
+    def remove_many(self, doc_ids: Iterable[str]):
+        with sqlite_transaction(self.path) as conn:
+            conn.executemany("DELETE FROM docs WHERE doc_id = ?", [(str(d),) for d in doc_ids])
+
+    def present(self, doc_ids: Sequence[str]) -> Set[str]:
+        """The ids among ``doc_ids`` that are indexed."""
+        found = set()
+        with sqlite_transaction(self.path) as conn:
+            for start in range(0, len(doc_ids), _SQL_VARS):
+                batch = [str(d) for d in doc_ids[start:start + _SQL_VARS]]
+                found.update(r[0] for r in conn.execute(
+                    f"SELECT doc_id FROM docs WHERE doc_id IN ({', '.join('?' * len(batch))})", batch))
+        return found
+
+    def search(self, query: str, top_k: int = 10, filter: Optional[dict] = None) -> List[dict]:
+        """Return up to top_k hits as {'id', 'score', 'payload'} dicts, best first.
+
+        ``filter`` restricts hits to payloads matching it, as in vector search.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+        # every term quoted, so identifiers and FTS5 keywords (AND, NEAR, ...) are matched literally
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        where, params = _payload_conditions(filter)
+        sql = ("SELECT docs.doc_id, -bm25(fts), docs.payload FROM fts JOIN docs ON docs.id = fts.rowid"
+               f" WHERE fts MATCH ?{where} ORDER BY bm25(fts) LIMIT ?")
+        with sqlite_transaction(self.path) as conn:
+            rows = conn.execute(sql, (match, *params, top_k)).fetchall()
+        return [{'id': doc_id, 'score': score, 'payload': json.loads(payload)} for doc_id, score, payload in rows]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, terms TEXT NOT NULL,
+                                 payload TEXT NOT NULL);
+CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(terms, content='docs', content_rowid='id',
+                                                  tokenize="unicode61 remove_diacritics 0 tokenchars '-./:_'");
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO fts (rowid, terms) VALUES (new.id, new.terms);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO fts (fts, rowid, terms) VALUES ('delete', old.id, old.terms);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE ON docs BEGIN
+    INSERT INTO fts (fts, rowid, terms) VALUES ('delete', old.id, old.terms);
+    INSERT INTO fts (rowid, terms) VALUES (new.id, new.terms);
+END;
+"""
+
+# bound parameters per statement, below SQLite's default limit
+_SQL_VARS = 500
+
+
+def _payload_conditions(flt: Optional[dict]) -> Tuple[str, list]:
+    # SQL version of vectorstore.match_payload over the JSON payload column
+    if not flt:
+        return "", []
+    clauses, params = [], []
+    for key, want in flt.items():
+        values = list(want) if isinstance(want, (list, tuple, set)) else [want]
+        if not values:
+            return " AND 0", []
+        clauses.append(f"json_extract(docs.payload, ?) IN ({', '.join('?' * len(values))})")
+        params += ['$.' + json.dumps(str(key)), *values]
+    return "".join(" AND " + c for c in clauses), params
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[dict]], top_k: int, k: int = 60) -> List[dict]:
+    """Fuse ranked hit lists: score(d) = sum over lists of 1 / (k + rank of d)."""
+    fused: Dict[str, float] = {}
+    hits: Dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, h in enumerate(ranking):
+            hid = str(h['id'])
+            fused[hid] = fused.get(hid, 0.0) + 1.0 / (k + rank + 1)
+            hits.setdefault(hid, h)
+    best = nlargest(top_k, fused.items(), key=lambda kv: kv[1])
+    return [{**hits[hid], 'score': score} for hid, score in best]
+
+
+# (backend, collection) -> index; the object holds no data, so one per collection is enough
+_indexes: Dict[tuple, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_path(collection: str, backend: str) -> str:
+    return os.path.join(LEXICAL_INDEX_DIR, backend, f"{collection}.sqlite")
+
+
+def get_index(collection: str, backend: str = VECTOR_BACKEND) -> LexicalIndex:
+    """Return the collection's lexical index, creating it on first use.
+
+    Like the chunk index it is kept per vector backend, so it mirrors the
+    points of the store that search fuses it with.
+    """
+    validate_collection(collection)
+    key = (backend, collection)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _indexes[key] = LexicalIndex(_index_path(collection, backend))
+                _import_json(collection, index)
+    return index
+
+
+def _import_json(collection: str, index: LexicalIndex):
+    # indexes used to be rewritten as one JSON file per collection; move one over once
+    path = os.path.join(LEXICAL_INDEX_DIR, f"{collection}.json")
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            docs = json.load(f).get("docs", {})
+        index.add_many((doc_id, (doc.get("payload") or {}).get("text") or "", doc.get("payload"))
+                       for doc_id, doc in docs.items())
+        os.replace(path, path + ".imported")
+        logging.info(f"Imported {len(docs)} documents from {path} into the lexical index")
+    except Exception:
+        logging.exception(f"Failed to import lexical index {path}")
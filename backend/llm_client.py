@@ -1,31 +1,126 @@
+import asyncio
+import json
+import logging
 import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Tuple
+
 import requests
-from .config import LLM_ENDPOINT, LLM_API_KEY
+from .config import (
+    LLM_ENDPOINT, LLM_API_KEY, LLM_TIMEOUT, LLM_POOL_SIZE, LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES, LLM_RETRY_BACKOFF,
+)
 
 # Optional provider selector: 'openai' to use OpenAI Chat Completions API
 LLM_PROVIDER = os.getenv('LLM_PROVIDER', '')
 
+STUB_RESPONSE = "[LLM endpoint not configured] This is a stubbed response. Provide a real LLM_ENDPOINT to get model answers."
+
+# Status codes worth retrying: rate limiting and transient server errors
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Shared keep-alive session for the synchronous path
+_session = None
+_session_lock = threading.Lock()
+
+# Shared httpx.AsyncClient and per-provider semaphores for the async path.
+# Both are bound to an event loop, so they are rebuilt if the loop changes.
+_async_loop = None
+_async_client = None
+_semaphores = {}
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=LLM_POOL_SIZE, pool_maxsize=LLM_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def _get_async_client():
+    global _async_loop, _async_client, _semaphores
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        try:
+            import httpx
+        except Exception as e:
+            raise RuntimeError("httpx not installed; install httpx") from e
+        try:
+            import h2  # noqa: F401 -- HTTP/2 is only enabled when the h2 package is present
+            http2 = True
+        except Exception:
+            http2 = False
+        _async_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=LLM_TIMEOUT,
+            limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+        )
+        _async_loop = loop
+        _semaphores = {}
+    return _async_client
+
+
+def _get_semaphore(provider: str) -> asyncio.Semaphore:
+    sem = _semaphores.get(provider)
+    if sem is None:
+        sem = _semaphores[provider] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return sem
+
+
+async def close_async_client():
+    """Close the shared async client (used on app shutdown)."""
+    global _async_client, _async_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _async_loop = None
+
+
+def _backoff(attempt: int) -> float:
+    return LLM_RETRY_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+
+
+def _async_retryable(e: Exception, attempt: int) -> bool:
+    import httpx
+    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+    return attempt < LLM_MAX_RETRIES and (status is None or status in _RETRY_STATUS)
+
 
 class LLMClient:
     def __init__(self, endpoint: str = None, api_key: str = None):
         self.endpoint = endpoint or LLM_ENDPOINT
         self.api_key = api_key or LLM_API_KEY
 
-    def generate(self, prompt: str, max_tokens: int = 512) -> str:
-        """Generic HTTP call to an LLM endpoint. You should configure endpoint and key in .env."""
-        if not self.endpoint:
-            return "[LLM endpoint not configured] This is a stubbed response. Provide a real LLM_ENDPOINT to get model answers."
+    @property
+    def provider(self) -> str:
+        return LLM_PROVIDER.lower()
 
+    @property
+    def model(self) -> str:
+        """Model name used to pick the context budget and tokenizer ('' for untyped endpoints)."""
+        if self.provider == 'openai':
+            return os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+        return self.provider
+
+    def _build_request(self, prompt: str, max_tokens: int) -> Tuple[str, dict, dict]:
+        """Return (url, json body, headers) for the configured provider."""
         # OpenAI provider support (Chat Completions)
-        if LLM_PROVIDER.lower() == 'openai':
+        if self.provider == 'openai':
             # LLM_ENDPOINT should be the base URL, e.g. https://api.openai.com/v1
             url = self.endpoint.rstrip('/') + '/chat/completions'
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            }
+            headers = {'Content-Type': 'application/json'}
+            if self.api_key:
+                headers['Authorization'] = f'Bearer {self.api_key}'
             body = {
-                'model': os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
+                'model': self.model,
                 'messages': [
                     {'role': 'system', 'content': 'You are a helpful assistant.'},
                     {'role': 'user', 'content': prompt}
@@ -33,32 +128,51 @@ class LLMClient:
                 'max_tokens': max_tokens,
                 'temperature': float(os.getenv('LLM_TEMPERATURE', '0.0'))
             }
-            resp = requests.post(url, json=body, headers=headers, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
-            # extract text from choices
-            try:
-                return data['choices'][0]['message']['content'].strip()
-            except Exception:
-                return str(data)
+            return url, body, headers
 
         # Groq provider support: expect the user to set LLM_ENDPOINT to the model's inference URL
         # and LLM_API_KEY to their Groq API key. Groq endpoints vary; the body below is a safe,
         # commonly-accepted shape ({"input": prompt, "max_output_tokens": ...}).
-        if LLM_PROVIDER.lower() == 'groq':
+        if self.provider == 'groq':
             url = self.endpoint.rstrip('/')
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            }
+            headers = {'Content-Type': 'application/json'}
+            if self.api_key:
+                headers['Authorization'] = f'Bearer {self.api_key}'
             body = {
                 'input': prompt,
                 'temperature': float(os.getenv('LLM_TEMPERATURE', '0.0')),
                 'max_output_tokens': max_tokens,
             }
-            resp = requests.post(url, json=body, headers=headers, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
+            return url, body, headers
+
+        # Klangoo provider support: POST {"text": prompt} to the analyze endpoint
+        if self.provider == 'klangoo':
+            # Default to the provided endpoint or Klangoo's analyze path
+            url = self.endpoint.rstrip('/') if self.endpoint else 'https://api.klangoo.com/v1/analyze'
+            headers = {
+                'Authorization': f'Bearer {self.api_key}' if self.api_key else '',
+                'Content-Type': 'application/json'
+            }
+            body = {'text': prompt}
+            return url, body, headers
+
+        # Generic HTTP provider: expect JSON with top-level text/result keys
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        payload = {
+            'prompt': prompt,
+            'max_tokens': max_tokens,
+        }
+        return self.endpoint, payload, headers
+
+    def _parse_response(self, data) -> str:
+        if self.provider == 'openai':
+            # extract text from choices
+            try:
+                return data['choices'][0]['message']['content'].strip()
+            except Exception:
+                return str(data)
+
+        if self.provider == 'groq':
             # Groq responses may vary; try a few common shapes defensively
             if isinstance(data, dict):
                 if 'output' in data and isinstance(data['output'], str):
@@ -74,18 +188,7 @@ class LLMClient:
                     return str(out0)
             return str(data)
 
-        # Klangoo provider support: POST {"text": prompt} to the analyze endpoint
-        if LLM_PROVIDER.lower() == 'klangoo':
-            # Default to the provided endpoint or Klangoo's analyze path
-            url = self.endpoint.rstrip('/') if self.endpoint else 'https://api.klangoo.com/v1/analyze'
-            headers = {
-                'Authorization': f'Bearer {self.api_key}' if self.api_key else '',
-                'Content-Type': 'application/json'
-            }
-            body = {'text': prompt}
-            resp = requests.post(url, json=body, headers=headers, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
+        if self.provider == 'klangoo':
             # Defensive parsing: try common keys that may contain textual analysis
             if isinstance(data, dict):
                 for key in ('analysis', 'result', 'text', 'output', 'data'):
@@ -105,13 +208,98 @@ class LLMClient:
                                 return out0.get(k).strip()
             return str(data)
 
-        # Generic HTTP provider: expect JSON with top-level text/result keys
-        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
-        payload = {
-            'prompt': prompt,
-            'max_tokens': max_tokens,
-        }
-        resp = requests.post(self.endpoint, json=payload, headers=headers, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
         return data.get('text') or data.get('result') or str(data)
+
+    def generate(self, prompt: str, max_tokens: int = 512) -> str:
+        """Generic HTTP call to an LLM endpoint. You should configure endpoint and key in .env."""
+        if not self.endpoint:
+            return STUB_RESPONSE
+        url, body, headers = self._build_request(prompt, max_tokens)
+        session = _get_session()
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                resp = session.post(url, json=body, headers=headers, timeout=LLM_TIMEOUT)
+                if resp.status_code in _RETRY_STATUS and attempt < LLM_MAX_RETRIES:
+                    raise requests.HTTPError(f"retryable status {resp.status_code}", response=resp)
+                resp.raise_for_status()
+                return self._parse_response(resp.json())
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if attempt >= LLM_MAX_RETRIES or (status is not None and status not in _RETRY_STATUS):
+                    raise
+                logging.warning(f"LLM call failed ({e}); retrying")
+                time.sleep(_backoff(attempt))
+
+    async def agenerate(self, prompt: str, max_tokens: int = 512) -> str:
+        """Async variant of generate() over a shared keep-alive connection pool.
+
+        Requests per provider are capped at LLM_MAX_CONCURRENCY and transient
+        failures (connection errors, 429, 5xx) are retried with exponential backoff.
+        """
+        if not self.endpoint:
+            return STUB_RESPONSE
+        import httpx
+        url, body, headers = self._build_request(prompt, max_tokens)
+        client = _get_async_client()
+        async with _get_semaphore(self.provider):
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                try:
+                    resp = await client.post(url, json=body, headers=headers)
+                    if resp.status_code in _RETRY_STATUS and attempt < LLM_MAX_RETRIES:
+                        raise httpx.HTTPStatusError(f"retryable status {resp.status_code}",
+                                                    request=resp.request, response=resp)
+                    resp.raise_for_status()
+                    return self._parse_response(resp.json())
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if not _async_retryable(e, attempt):
+                        raise
+                    logging.warning(f"LLM call failed ({e}); retrying")
+                    await asyncio.sleep(_backoff(attempt))
+
+    async def astream(self, prompt: str, max_tokens: int = 512) -> AsyncIterator[str]:
+        """Yield the answer piece by piece as the provider produces it.
+
+        OpenAI-style providers are called with ``stream=true`` and their
+        server-sent events are forwarded as they arrive; other providers have
+        no common streaming format, so their full agenerate() answer is
+        yielded as a single piece.
+        """
+        if not self.endpoint:
+            yield STUB_RESPONSE
+            return
+        if self.provider != 'openai':
+            yield await self.agenerate(prompt, max_tokens)
+            return
+        import httpx
+        url, body, headers = self._build_request(prompt, max_tokens)
+        body['stream'] = True
+        client = _get_async_client()
+        async with _get_semaphore(self.provider):
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                started = False
+                try:
+                    async with client.stream('POST', url, json=body, headers=headers) as resp:
+                        if resp.status_code in _RETRY_STATUS and attempt < LLM_MAX_RETRIES:
+                            raise httpx.HTTPStatusError(f"retryable status {resp.status_code}",
+                                                        request=resp.request, response=resp)
+                        resp.raise_for_status()
+                        async for line in resp.aiter_lines():
+                            if not line.startswith('data:'):
+                                continue
+                            data = line[len('data:'):].strip()
+                            if data == '[DONE]':
+                                return
+                            try:
+                                piece = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                            except Exception:
+                                continue
+                            if piece:
+                                started = True
+                                yield piece
+                    return
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    # once tokens went out a retry would duplicate them
+                    if started or not _async_retryable(e, attempt):
+                        raise
+                    logging.warning(f"LLM stream failed ({e}); retrying")
+                    await asyncio.sleep(_backoff(attempt))
@@ -0,0 +1,480 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; writers are not serialized there
+    fcntl = None
+
+from .config import (
+    QDRANT_COLLECTION, QDRANT_PAYLOAD_INDEXES, EMBED_DIM, LOCAL_INDEX_DIR, LOCAL_HNSW_THRESHOLD,
+    LOCAL_HNSW_M, LOCAL_HNSW_EF_CONSTRUCTION, LOCAL_HNSW_EF,
+)
+from .db import sqlite_transaction
+from .vectorstore import validate_arrays, points_to_arrays, match_payload, validate_collection
+
+# Same attributes as Qdrant's ScoredPoint, so callers handle both alike
+Hit = namedtuple("Hit", "id score payload vector", defaults=(None,))
+
+# Bound the (queries x vectors) score matrix of an exact scan to this many floats
+_SCORE_BLOCK = 1 << 24
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _hashable(value) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class LocalStore:
+    """In-process vector store with the same interface as QdrantStore.
+
+    Vectors are L2-normalized and kept in one float32 array, so cosine
+    search is a matrix product. Small collections are scanned exactly;
+    collections of at least ``hnsw_threshold`` vectors are searched with an
+    hnswlib HNSW graph when hnswlib is installed. Filtered searches always
+    scan the matching rows exactly; conditions on ``indexed_fields`` (the
+    QDRANT_PAYLOAD_INDEXES fields) find those rows through an in-memory
+    value -> ids map instead of checking every payload.
+
+    Writes stay in memory until ``flush()``, which saves ``vectors.npy``,
+    ``meta.json`` (ids, labels), the HNSW graph and the payloads that changed
+    since the last flush (``payloads.sqlite``) under ``path``. A saved
+    collection is reopened with the vectors memory-mapped, so startup does
+    not read the whole array. Each flush rewrites the collection from this
+    process's copy, so a writer holds an exclusive file lock (``write.lock``)
+    from its first change until ``flush()`` and starts from the last flushed
+    version; processes writing the same collection take turns. Readers never
+    wait for it and pick up flushes through get_local_store().
+    """
+
+    def __init__(self, collection: str = QDRANT_COLLECTION, path: str = None, dim: int = EMBED_DIM,
+                 hnsw_threshold: int = LOCAL_HNSW_THRESHOLD, hnsw_ef: int = LOCAL_HNSW_EF,
+                 indexed_fields: List[str] = tuple(QDRANT_PAYLOAD_INDEXES)):
+        self.collection = collection
+        self.path = path or os.path.join(LOCAL_INDEX_DIR, validate_collection(collection))
+        self.dim = dim
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_ef = hnsw_ef
+        self.indexed_fields = indexed_fields
+        self._lock = threading.RLock()
+        # held while changing the store or flushing it; searches only take _lock
+        self._write_guard = threading.RLock()
+        self._lock_file = None
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._n = 0
+        self._ids: list = []
+        self._payloads: List[dict] = []
+        # field -> value -> ids of the points whose payload has that value (None if the field is missing)
+        self._payload_index: Dict[str, Dict] = {field: {} for field in self.indexed_fields}
+        # ids whose payload was written or deleted since the last flush
+        self._payload_writes: Set = set()
+        self._payload_deletes: Set = set()
+        # each stored vector gets a fresh HNSW label; rows move on delete, labels do not
+        self._labels: List[int] = []
+        self._row: Dict = {}
+        self._label_row: Dict[int, int] = {}
+        self._next_label = 0
+        self._hnsw = None
+        self._hnsw_missing = False
+        self._dirty = False
+        self.mtime = None
+
+    def __len__(self):
+        return self._n
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self._file("meta.json"))
+        except OSError:
+            return
+        with open(self._file("meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        vectors = np.load(self._file("vectors.npy"), mmap_mode="r")
+        if vectors.shape != (len(meta["ids"]), self.dim):
+            raise ValueError(f"{self.path}: vectors {vectors.shape} do not match {len(meta['ids'])} ids")
+        self._vectors = vectors
+        self._n = len(meta["ids"])
+        self._ids = meta["ids"]
+        if "payloads" in meta:
+            # written before payloads moved to payloads.sqlite; copied there on the next flush
+            self._payloads = meta["payloads"]
+            self._payload_writes = set(self._ids)
+            self._dirty = True
+        else:
+            with sqlite_transaction(self._file("payloads.sqlite")) as conn:
+                stored = {pid: json.loads(payload) for pid, payload in conn.execute("SELECT id, payload FROM payloads")}
+            self._payloads = [stored.get(pid, {}) for pid in self._ids]
+        for pid, payload in zip(self._ids, self._payloads):
+            self._index_payload(pid, payload)
+        self._labels = meta["labels"]
+        self._next_label = meta["next_label"]
+        self._row = {pid: i for i, pid in enumerate(self._ids)}
+        self._label_row = {label: i for i, label in enumerate(self._labels)}
+        if meta.get("hnsw") and os.path.exists(self._file("hnsw.bin")):
+            try:
+                import hnswlib
+                index = hnswlib.Index(space="ip", dim=self.dim)
+                index.load_index(self._file("hnsw.bin"))
+                self._hnsw = index
+            except Exception:
+                logging.warning(f"Could not load HNSW index for {self.collection}; it will be rebuilt",
+                                exc_info=True)
+        self.mtime = mtime
+
+    def _begin_write(self):
+        # take the file lock before the first change since the last flush, then build
+        # on whatever another process flushed since this copy was loaded
+        if self._lock_file is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        lock_file = open(self._file("write.lock"), "a")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                mtime = os.path.getmtime(self._file("meta.json"))
+            except OSError:
+                mtime = None
+            if mtime != self.mtime:
+                with self._lock:
+                    self._reset()
+                    self._load()
+        except BaseException:
+            lock_file.close()
+            raise
+        self._lock_file = lock_file
+
+    def _end_write(self):
+        if self._lock_file is not None:
+            # closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    @contextmanager
+    def _writing(self):
+        with self._write_guard:
+            self._begin_write()
+            with self._lock:
+                yield
+
+    def _reserve(self, extra: int):
+        # grow by doubling; a memory-mapped (read-only) array is copied on first write
+        needed = self._n + extra
+        if isinstance(self._vectors, np.memmap) or needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors), 1024)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:self._n] = self._vectors[:self._n]
+            self._vectors = grown
+
+    def upsert(self, points):
+        self.upsert_arrays(*points_to_arrays(points))
+
+    def upsert_arrays(self, ids: list, vectors: np.ndarray, payloads: List[dict], **_):
+        vectors = validate_arrays(ids, vectors, payloads, dim=self.dim)
+        if len(vectors) == 0:
+            return
+        # keep the last occurrence of an id repeated within the batch
+        last = {(str(pid) if isinstance(pid, uuid.UUID) else pid): i for i, pid in enumerate(ids)}
+        vectors = _normalize(vectors[list(last.values())])
+        with self._writing():
+            self._reserve(len(last))
+            rows, labels = [], []
+            for pid, i in last.items():
+                row = self._row.get(pid)
+                if row is None:
+                    row = self._n
+                    self._n += 1
+                    self._row[pid] = row
+                    self._ids.append(pid)
+                    self._payloads.append(None)
+                    self._labels.append(-1)
+                else:
+                    old = self._labels[row]
+                    del self._label_row[old]
+                    if self._hnsw is not None:
+                        self._hnsw.mark_deleted(old)
+                    self._unindex_payload(pid, self._payloads[row])
+                self._payloads[row] = payloads[i] or {}
+                self._index_payload(pid, self._payloads[row])
+                self._payload_writes.add(pid)
+                self._payload_deletes.discard(pid)
+                label = self._labels[row] = self._next_label
+                self._next_label += 1
+                self._label_row[label] = row
+                rows.append(row)
+                labels.append(label)
+            self._vectors[rows] = vectors
+            if self._hnsw is not None:
+                self._hnsw_add(vectors, labels)
+            self._dirty = True
+
+    def delete(self, ids: list):
+        if not ids:
+            return
+        with self._writing():
+            self._reserve(0)
+            for pid in ids:
+                pid = str(pid) if isinstance(pid, uuid.UUID) else pid
+                row = self._row.pop(pid, None)
+                if row is None:
+                    continue
+                self._unindex_payload(pid, self._payloads[row])
+                self._payload_deletes.add(pid)
+                self._payload_writes.discard(pid)
+                label = self._labels[row]
+                del self._label_row[label]
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(label)
+                # move the last row into the hole so live rows stay contiguous
+                end = self._n - 1
+                if row != end:
+                    self._vectors[row] = self._vectors[end]
+                    moved = self._ids[row] = self._ids[end]
+                    self._payloads[row] = self._payloads[end]
+                    self._labels[row] = self._labels[end]
+                    self._row[moved] = row
+                    self._label_row[self._labels[row]] = row
+                self._ids.pop()
+                self._payloads.pop()
+                self._labels.pop()
+                self._n -= 1
+            self._dirty = True
+
+    def retrieve_payloads(self, ids: list, fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        with self._lock:
+            found = {}
+            for pid in ids:
+                pid = str(pid) if isinstance(pid, uuid.UUID) else pid
+                row = self._row.get(pid)
+                if row is not None:
+                    payload = self._payloads[row]
+                    found[pid] = payload if fields is None else {k: payload[k] for k in fields if k in payload}
+            return found
+
+    def set_payloads(self, updates: Dict[str, dict]):
+        with self._writing():
+            for pid, fields in updates.items():
+                pid = str(pid) if isinstance(pid, uuid.UUID) else pid
+                row = self._row.get(pid)
+                if row is not None:
+                    self._unindex_payload(pid, self._payloads[row])
+                    self._payloads[row] = {**self._payloads[row], **fields}
+                    self._index_payload(pid, self._payloads[row])
+                    self._payload_writes.add(pid)
+                    self._dirty = True
+
+    def _index_payload(self, pid, payload: dict):
+        for field, values in self._payload_index.items():
+            value = payload.get(field)
+            if _hashable(value):
+                values.setdefault(value, set()).add(pid)
+
+    def _unindex_payload(self, pid, payload: dict):
+        for field, values in self._payload_index.items():
+            value = payload.get(field)
+            if _hashable(value) and value in values:
+                values[value].discard(pid)
+                if not values[value]:
+                    del values[value]
+
+    def _filter_rows(self, filter: dict) -> np.ndarray:
+        """Rows whose payload matches ``filter`` (match_payload semantics), in row order."""
+        candidates, rest = None, {}
+        for key, want in filter.items():
+            values = self._payload_index.get(key)
+            wanted = want if isinstance(want, (list, tuple, set)) else (want,)
+            if values is None or not all(_hashable(v) for v in wanted):
+                rest[key] = want
+                continue
+            ids = set().union(*(values.get(v, ()) for v in wanted))
+            candidates = ids if candidates is None else candidates & ids
+        if candidates is None:
+            rows = (i for i, p in enumerate(self._payloads) if match_payload(p, filter))
+        else:
+            rows = sorted(row for row in (self._row[pid] for pid in candidates)
+                          if match_payload(self._payloads[row], rest))
+        return np.fromiter(rows, dtype=np.int64)
+
+    def _hnsw_add(self, vectors: np.ndarray, labels: List[int]):
+        needed = self._hnsw.get_current_count() + len(labels)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(needed, 2 * self._hnsw.get_max_elements()))
+        self._hnsw.add_items(vectors, np.asarray(labels))
+
+    def _use_hnsw(self) -> bool:
+        if not self.hnsw_threshold or self._n < self.hnsw_threshold:
+            return False
+        if self._hnsw is None:
+            if self._hnsw_missing:
+                return False
+            try:
+                import hnswlib
+            except Exception:
+                logging.warning("hnswlib not installed; local store falls back to exact search")
+                self._hnsw_missing = True
+                return False
+            # built lazily on the first search once the collection is large enough
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=max(2 * self._n, 1024), ef_construction=LOCAL_HNSW_EF_CONSTRUCTION,
+                             M=LOCAL_HNSW_M)
+            index.add_items(self._vectors[:self._n], np.asarray(self._labels))
+            self._hnsw = index
+        return True
+
+    def _hit(self, row: int, score: float, with_vectors: bool = False) -> Hit:
+        vector = self._vectors[row].copy() if with_vectors else None
+        return Hit(self._ids[row], float(score), self._payloads[row], vector)
+
+    def _exact(self, queries: np.ndarray, top_k: int, rows: Optional[np.ndarray] = None,
+               with_vectors: bool = False) -> List[List[Hit]]:
+        base = self._vectors[:self._n] if rows is None else self._vectors[rows]
+        k = min(top_k, len(base))
+        if k <= 0:
+            return [[] for _ in queries]
+        results = []
+        block = max(1, _SCORE_BLOCK // len(base))
+        for start in range(0, len(queries), block):
+            scores = queries[start:start + block] @ base.T
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for srow, cand in zip(scores, top):
+                order = cand[np.argsort(-srow[cand])]
+                results.append([self._hit(j if rows is None else rows[j], srow[j], with_vectors) for j in order])
+        return results
+
+    def _approximate(self, queries: np.ndarray, top_k: int, ef: Optional[int] = None,
+                     with_vectors: bool = False) -> List[List[Hit]]:
+        k = min(top_k, self._n)
+        self._hnsw.set_ef(max(ef or self.hnsw_ef, k))
+        labels, distances = self._hnsw.knn_query(queries, k=k)
+        # inner-product distance is 1 - cosine similarity
+        return [[self._hit(self._label_row[label], 1.0 - d, with_vectors) for label, d in zip(ls, ds)
+                 if label in self._label_row] for ls, ds in zip(labels, distances)]
+
+    def search(self, vector, top_k: int = 5, filter: Optional[dict] = None, hnsw_ef: Optional[int] = None,
+               exact: bool = False, with_vectors: bool = False) -> List[Hit]:
+        return self.search_batch([vector], top_k=top_k, filter=filter, hnsw_ef=hnsw_ef, exact=exact,
+                                 with_vectors=with_vectors)[0]
+
+    def search_batch(self, vectors, top_k: int = 5, filter: Optional[dict] = None, hnsw_ef: Optional[int] = None,
+                     exact: bool = False, with_vectors: bool = False) -> List[List[Hit]]:
+        """Return one hit list per query vector, best first (cosine similarity scores).
+
+        ``exact`` forces a flat scan; ``hnsw_ef`` overrides the HNSW search ef.
+        ``with_vectors`` adds each hit's stored (normalized) vector.
+        """
+        if len(vectors) == 0:
+            return []
+        queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        with self._lock:
+            if not self._n:
+                return [[] for _ in queries]
+            if filter:
+                return self._exact(queries, top_k, self._filter_rows(filter), with_vectors)
+            if not exact and self._use_hnsw():
+                return self._approximate(queries, top_k, hnsw_ef, with_vectors)
+            return self._exact(queries, top_k, with_vectors=with_vectors)
+
+    def flush(self):
+        """Persist pending writes and release the write lock; files are replaced atomically, meta.json last."""
+        with self._write_guard:
+            if self._dirty:
+                # changes made without the lock (an old-format store being converted)
+                self._begin_write()
+            try:
+                with self._lock:
+                    self._save()
+            finally:
+                self._end_write()
+
+    def _save(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # build the graph here so readers load it instead of rebuilding it
+        self._use_hnsw()
+        tmp = f".{os.getpid()}.tmp"
+        np.save(self._file("vectors" + tmp + ".npy"), self._vectors[:self._n])
+        if self._hnsw is not None:
+            self._hnsw.save_index(self._file("hnsw.bin" + tmp))
+        self._flush_payloads()
+        meta = {"dim": self.dim, "ids": self._ids, "labels": self._labels,
+                "next_label": self._next_label, "hnsw": self._hnsw is not None}
+        with open(self._file("meta.json" + tmp), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(self._file("vectors" + tmp + ".npy"), self._file("vectors.npy"))
+        if self._hnsw is not None:
+            os.replace(self._file("hnsw.bin" + tmp), self._file("hnsw.bin"))
+        os.replace(self._file("meta.json" + tmp), self._file("meta.json"))
+        self.mtime = os.path.getmtime(self._file("meta.json"))
+        self._dirty = False
+
+    def _flush_payloads(self):
+        # only the payloads written since the last flush; ids are stored as given (int or str)
+        with sqlite_transaction(self._file("payloads.sqlite")) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS payloads (id PRIMARY KEY, payload TEXT NOT NULL)")
+            conn.executemany("DELETE FROM payloads WHERE id = ?", ((pid,) for pid in self._payload_deletes))
+            conn.executemany("INSERT OR REPLACE INTO payloads VALUES (?, ?)",
+                             ((pid, json.dumps(self._payloads[self._row[pid]])) for pid in self._payload_writes))
+        self._payload_writes.clear()
+        self._payload_deletes.clear()
+
+
+# One store per collection, shared like the Qdrant clients
+_stores: Dict[str, LocalStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_local_store(collection: str = QDRANT_COLLECTION) -> LocalStore:
+    """Return the shared store for ``collection``, reopening it if another process flushed it."""
+    validate_collection(collection)
+    try:
+        mtime = os.path.getmtime(os.path.join(LOCAL_INDEX_DIR, collection, "meta.json"))
+    except OSError:
+        mtime = None
+    with _stores_lock:
+        store = _stores.get(collection)
+        if store is None or (not store._dirty and mtime is not None and store.mtime != mtime):
+            try:
+                store = LocalStore(collection)
+            except Exception:
+                # e.g. caught between another process's file replacements; keep what we have
+                if store is None:
+                    raise
+                logging.warning(f"Could not reload local collection {collection}", exc_info=True)
+            _stores[collection] = store
+        return store
+
+
+def flush_local_stores():
+    """Flush every open local store (used on app shutdown)."""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.flush()
+        except Exception:
+            logging.exception(f"Failed to flush local collection {store.collection}")
@@ -0,0 +1,221 @@
+"""Latency histograms, per-request timing breakdowns and optional tracing.
+
+Pipeline stages are timed with ``span(stage)``. Every span is recorded in a
+process-wide histogram (served in Prometheus text format at /metrics), added
+to the current request's breakdown (the Server-Timing header) and, with
+OTEL_ENABLED, exported as an OpenTelemetry span. Each request gets a server
+span (request_timings()) and its stage spans are children of it, so one
+trace shows the request's breakdown.
+
+Histograms live in the process that observed them: ingestion running in a
+process job executor is not visible at /metrics, but its per-stage timings
+are part of the job result.
+"""
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import METRICS_BUCKETS, OTEL_ENABLED, OTEL_EXPORTER_OTLP_ENDPOINT, OTEL_SERVICE_NAME
+
+STAGES = ("extract", "chunk", "embed", "upsert", "query_embed", "search", "prompt_build", "llm")
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float] = METRICS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = sorted(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self) -> Dict[Tuple[str, ...], dict]:
+        with self._lock:
+            return {labels: {"count": count, "sum": total} for labels, (_, total, count) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total, count) for labels, (counts, total, count)
+                            in self._series.items())
+        for labels, counts, total, count in series:
+            base = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, labels)]
+            cumulative = 0
+            for le, c in zip([*map(_format, self.buckets), "+Inf"], counts):
+                cumulative += c
+                bucket_labels = ",".join(base + ['le="%s"' % le])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(base) + "}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {total!r}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(bucket: float) -> str:
+    return repr(float(bucket))
+
+
+stage_seconds = Histogram("rag_stage_duration_seconds", "Time spent in a pipeline stage.", ["stage"])
+request_seconds = Histogram("rag_http_request_duration_seconds", "HTTP request latency until the response starts.",
+                            ["method", "route", "status"])
+embed_batch_size = Histogram("rag_embed_batch_size", "Query texts per micro-batched encode call.", [],
+                             buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+embed_queue_seconds = Histogram("rag_embed_queue_delay_seconds",
+                                "Time a query text waited for its micro-batch to start encoding.", [])
+
+# stage -> seconds spent in it during the current request (None outside requests)
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None)
+# OpenTelemetry span of the current request, parent of its stage spans (None outside requests)
+_request_span: contextvars.ContextVar = contextvars.ContextVar("request_span", default=None)
+
+_tracer = None
+_tracer_lock = threading.Lock()
+_tracer_failed = False
+
+
+def _get_tracer():
+    global _tracer, _tracer_failed
+    if not OTEL_ENABLED or _tracer_failed:
+        return None
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None and not _tracer_failed:
+                try:
+                    from opentelemetry import trace
+                    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+                    from opentelemetry.sdk.resources import Resource
+                    from opentelemetry.sdk.trace import TracerProvider
+                    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                except Exception:
+                    logging.warning("OTEL_ENABLED is set but opentelemetry-sdk / the OTLP exporter are not "
+                                    "installed; spans are not exported")
+                    _tracer_failed = True
+                    return None
+                provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=OTEL_EXPORTER_OTLP_ENDPOINT)))
+                trace.set_tracer_provider(provider)
+                _tracer = trace.get_tracer("rag-service")
+    return _tracer
+
+
+def shutdown():
+    """Flush pending OpenTelemetry spans (used on app shutdown)."""
+    if _tracer is not None:
+        from opentelemetry import trace
+        provider = trace.get_tracer_provider()
+        if hasattr(provider, "shutdown"):
+            provider.shutdown()
+
+
+def observe(stage: str, seconds: float):
+    """Record ``seconds`` spent in ``stage`` (for stages timed without span())."""
+    stage_seconds.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time the enclosed block as ``stage``.
+
+    The OpenTelemetry span (if enabled) is a child of the request's span but
+    not made current, so it is safe across threads and async generators.
+    """
+    tracer = _get_tracer()
+    otel_span = None
+    if tracer is not None:
+        from opentelemetry import trace
+        parent = _request_span.get()
+        otel_span = tracer.start_span(stage, context=trace.set_span_in_context(parent) if parent else None,
+                                      attributes=attributes or None)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+        if otel_span is not None:
+            otel_span.end()
+
+
+@contextmanager
+def request_timings(name: str = "request"):
+    """Collect the stage timings of one request; yields the stage -> seconds dict.
+
+    The dict is shared with threads started via asyncio.to_thread, which copy
+    the context. With OTEL_ENABLED every span() inside the block is a child
+    of the request's span: the current span if the server already traces
+    requests, else a new server span ``name``. See annotate_request().
+    """
+    timings: Dict[str, float] = {}
+    tracer = _get_tracer()
+    otel_span = owned = None
+    if tracer is not None:
+        from opentelemetry import trace
+        current = trace.get_current_span()
+        if current.get_span_context().is_valid:
+            # the server already traces requests (framework instrumentation); nest stages under its span
+            otel_span = current
+        else:
+            otel_span = owned = tracer.start_span(name, kind=trace.SpanKind.SERVER)
+    token = _request_timings.set(timings)
+    span_token = _request_span.set(otel_span)
+    try:
+        yield timings
+    finally:
+        _request_span.reset(span_token)
+        _request_timings.reset(token)
+        if owned is not None:
+            owned.end()
+
+
+def annotate_request(name: Optional[str] = None, attributes: Optional[dict] = None):
+    """Rename the current request's span and set attributes on it (no-op without tracing)."""
+    otel_span = _request_span.get()
+    if otel_span is None:
+        return
+    if name:
+        otel_span.update_name(name)
+    if attributes:
+        otel_span.set_attributes(attributes)
+
+
+def server_timing(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Format timings as a Server-Timing header value (durations in ms)."""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def stats() -> dict:
+    """Count and average latency per stage (for /stats)."""
+    return {labels[0]: {"count": s["count"], "avg_ms": round(s["sum"] / s["count"] * 1000, 2)}
+            for labels, s in sorted(stage_seconds.summary().items()) if s["count"]}
+
+
+def render() -> str:
+    """All histograms in Prometheus text exposition format."""
+    histograms = (stage_seconds, request_seconds, embed_batch_size, embed_queue_seconds)
+    return "\n".join(line for h in histograms for line in h.render()) + "\n"
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .config import EMBED_MODEL, EMBED_DEVICE, EMBED_BACKEND, EMBED_ONNX_FILE, EMBED_QUANTIZE
+
+# Process-wide cache of loaded SentenceTransformer models, keyed by
+# (model_name, device). Loading a model takes seconds and hundreds of MB, so
+# every Embedder in the process shares the same instance.
+_models: Dict[Tuple[str, str], object] = {}
+_stats: Dict[Tuple[str, str], dict] = {}
+_lock = threading.Lock()
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process in bytes (best effort)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        pass
+    try:
+        import resource
+        # ru_maxrss is the peak, in KB on Linux; good enough as a fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return 0
+
+
+def _key(model_name: str, device: Optional[str]) -> Tuple[str, str]:
+    return (model_name, device or 'auto')
+
+
+def _load(SentenceTransformer, model_name: str, device: Optional[str]):
+    if EMBED_BACKEND == 'torch':
+        model = SentenceTransformer(model_name, device=device or None)
+    else:
+        # ONNX / OpenVINO inference; older sentence-transformers have no backend argument
+        model_kwargs = {'file_name': EMBED_ONNX_FILE} if EMBED_ONNX_FILE else None
+        try:
+            model = SentenceTransformer(model_name, device=device or None, backend=EMBED_BACKEND,
+                                        model_kwargs=model_kwargs)
+        except TypeError as e:
+            raise RuntimeError(f"EMBED_BACKEND={EMBED_BACKEND} needs sentence-transformers >= 3.2") from e
+    if EMBED_QUANTIZE == 'int8':
+        if EMBED_BACKEND != 'torch' or str(getattr(model, 'device', 'cpu')) != 'cpu':
+            logging.warning("EMBED_QUANTIZE=int8 only applies to the torch backend on CPU; ignored")
+        else:
+            import torch
+            # int8 weights for the linear layers, activations quantized on the fly
+            torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif EMBED_QUANTIZE:
+        raise ValueError(f"Unknown EMBED_QUANTIZE: {EMBED_QUANTIZE}")
+    return model
+
+
+def get_model(model_name: str = EMBED_MODEL, device: Optional[str] = EMBED_DEVICE):
+    """Return the shared model for (model_name, device), loading it once."""
+    key = _key(model_name, device)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        try:
+            from sentence_transformers import SentenceTransformer
+        except Exception as e:
+            raise RuntimeError("sentence-transformers not installed") from e
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        model = _load(SentenceTransformer, model_name, device)
+        load_seconds = time.perf_counter() - t0
+        _stats[key] = {
+            'model': model_name,
+            'device': str(getattr(model, 'device', key[1])),
+            'backend': EMBED_BACKEND,
+            'quantize': EMBED_QUANTIZE or None,
+            'load_seconds': round(load_seconds, 3),
+            'rss_delta_bytes': max(_rss_bytes() - rss_before, 0),
+            'loaded_at': time.time(),
+        }
+        _models[key] = model
+        logging.info(f"Loaded embedding model {model_name} on {_stats[key]['device']} in {load_seconds:.2f}s")
+        return model
+
+
+def warmup(model_name: str = EMBED_MODEL, device: Optional[str] = EMBED_DEVICE):
+    """Load the model and run one tiny encode so the first request pays nothing."""
+    model = get_model(model_name, device)
+    model.encode(["warmup"], show_progress_bar=False)
+    return model
+
+
+def stats() -> dict:
+    return {
+        'models': list(_stats.values()),
+        'rss_bytes': _rss_bytes(),
+    }
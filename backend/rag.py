@@ -1,26 +1,65 @@
-from typing import Dict
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from .retriever import Retriever
 from .llm_client import LLMClient
-from .config import CHUNK_SIZE, CHUNK_OVERLAP
+from .cache import semantic_cache
+from . import context, metrics
+from .config import CHUNK_SIZE, CHUNK_OVERLAP, SEMANTIC_CACHE_ENABLED, BATCH_LLM_CONCURRENCY, CONTEXT_PACKING
+
+
+def _render_prompt(question: str, blocks: List[Tuple[str, str]]) -> str:
+    # blocks are (source label, text) pairs
+    parts = ["You are a helpful assistant. Use the provided context to answer the question. Cite sources by [id].\n"]
+    parts.append("CONTEXTS:\n")
+    for label, text in blocks:
+        parts.append(f"[{label}] {text}\n---\n")
+    parts.append("QUESTION:\n" + question + "\n\nAnswer:" )
+    return "\n".join(parts)
 
 
 class RAGPipeline:
-    def __init__(self, collection: str = None):
+    def __init__(self, collection: str = None, use_semantic_cache: bool = SEMANTIC_CACHE_ENABLED,
+                 pack_context: bool = CONTEXT_PACKING):
         self.retriever = Retriever(collection=collection)
         self.llm = LLMClient()
+        self.use_semantic_cache = use_semantic_cache
+        self.pack_context = pack_context
 
     def build_prompt(self, question: str, contexts: list) -> str:
-        parts = ["You are a helpful assistant. Use the provided context to answer the question. Cite sources by [id].\n"]
-        parts.append("CONTEXTS:\n")
-        for c in contexts:
-            parts.append(f"[{c.get('id')}] {c.get('payload', {}).get('text','')[:1000]}\n---\n")
-        parts.append("QUESTION:\n" + question + "\n\nAnswer:" )
-        return "\n".join(parts)
-
-    def answer(self, question: str, top_k: int = 3) -> Dict:
-        hits = self.retriever.retrieve(question, top_k=top_k)
-        prompt = self.build_prompt(question, hits)
-        answer = self.llm.generate(prompt)
+        return self.pack_prompt(question, contexts)[0]
+
+    def pack_prompt(self, question: str, contexts: list) -> Tuple[str, Dict]:
+        """Build the LLM prompt; returns (prompt, stats).
+
+        With context packing the retrieved chunks are deduplicated, merged and
+        cut to the model's token budget (see context.pack_context); otherwise
+        each chunk is truncated to 1000 characters. ``stats`` reports the
+        prompt tokens before packing (every retrieved chunk in full) and after.
+        """
+        with metrics.span("prompt_build"):
+            return self._pack_prompt(question, contexts)
+
+    def _pack_prompt(self, question: str, contexts: list) -> Tuple[str, Dict]:
+        count_tokens = context.token_counter(self.llm.model)
+        full = _render_prompt(question, [(c.get('id'), c.get('payload', {}).get('text', '')) for c in contexts])
+        if self.pack_context:
+            budget = context.context_budget(self.llm.model)
+            packed = context.pack_context(contexts, budget=budget, count_tokens=count_tokens)
+            prompt = _render_prompt(question, [(", ".join(map(str, b['ids'])), b['text']) for b in packed['blocks']])
+            stats = {'chunks_retrieved': packed['chunks_in'], 'chunks_used': packed['chunks_used'],
+                     'token_budget': budget}
+        else:
+            prompt = _render_prompt(question, [(c.get('id'), c.get('payload', {}).get('text', '')[:1000])
+                                               for c in contexts])
+            stats = {'chunks_retrieved': len(contexts), 'chunks_used': len(contexts)}
+        before, after = (int(n) for n in count_tokens([full, prompt]))
+        stats.update(prompt_tokens_before=before, prompt_tokens_after=after)
+        return prompt, stats
+
+    def sanitize_hits(self, hits: list) -> list:
         # Sanitize hits for user-facing output: keep id, score, file_id, index and a short snippet
         sanitized = []
         for h in hits:
@@ -33,8 +72,152 @@ class RAGPipeline:
                 'index': payload.get('index'),
                 'snippet': snippet,
             })
+        return sanitized
+
+    def _prepare(self, question: str, top_k: int, **options):
+        qvecs, hits = self._retrieve_many([question], top_k, **options)
+        return self._prepare_one(question, qvecs[0], hits[0])
+
+    def _prepare_many(self, questions: List[str], top_k: int, **options) -> list:
+        qvecs, hits_list = self._retrieve_many(questions, top_k, **options)
+        return [self._prepare_one(q, v, h) for q, v, h in zip(questions, qvecs, hits_list)]
+
+    def _prepare_one(self, question: str, qvec, hits: list):
+        # -> (qvec, hits, cached answer, prompt, stats); the prompt is only packed on a cache miss.
+        # The async paths run this in a worker thread with retrieval: packing counts the tokens
+        # of every hit and would otherwise block the event loop.
+        cached = self._cached_answer(qvec, hits)
+        if cached is not None:
+            return qvec, hits, cached, None, None
+        return (qvec, hits, None, *self.pack_prompt(question, hits))
+
+    def _retrieve_many(self, questions: List[str], top_k: int, **options):
+        # ``options`` are Retriever.search_queries() arguments: mode, rrf_k, filter, hnsw_ef, exact.
+        # The query vector is needed in every mode: the semantic cache is keyed on it.
+        # Packing uses the hits' vectors to drop near-duplicates.
+        options.setdefault('with_vectors', self.pack_context)
+        with metrics.span("query_embed", queries=len(questions)):
+            qvecs = self.retriever.embed_queries(questions)
+        with metrics.span("search", queries=len(questions)):
+            hits = self.retriever.search_queries(questions, qvecs, top_k=top_k, **options)
+        return qvecs, hits
+
+    def _cached_answer(self, qvec, hits: list) -> Optional[str]:
+        if not self.use_semantic_cache:
+            return None
+        return semantic_cache.lookup(self.retriever.store.collection, qvec, [h.get('id') for h in hits])
 
-        return {
+    def _remember_answer(self, qvec, hits: list, answer: str, started: float):
+        if not self.use_semantic_cache:
+            return
+        semantic_cache.store(self.retriever.store.collection, qvec, [h.get('id') for h in hits], answer)
+        semantic_cache.record_latency(False, time.perf_counter() - started)
+
+    def _result(self, answer: str, hits: list, cached: bool, started: float, stats: Optional[Dict] = None) -> Dict:
+        result = {
             'answer': answer,
-            'sources': sanitized,
+            'sources': self.sanitize_hits(hits),
         }
+        if stats is not None:
+            result['context'] = stats
+        if self.use_semantic_cache:
+            result['cached'] = cached
+            if cached:
+                semantic_cache.record_latency(True, time.perf_counter() - started)
+        return result
+
+    def answer(self, question: str, top_k: int = 3, **options) -> Dict:
+        started = time.perf_counter()
+        qvec, hits, cached, prompt, stats = self._prepare(question, top_k, **options)
+        if cached is not None:
+            return self._result(cached, hits, True, started)
+        with metrics.span("llm"):
+            answer = self.llm.generate(prompt)
+        self._remember_answer(qvec, hits, answer, started)
+        return self._result(answer, hits, False, started, stats)
+
+    async def aanswer(self, question: str, top_k: int = 3, **options) -> Dict:
+        """Async answer(): retrieval and prompt packing run in a worker thread, the LLM call on the event loop."""
+        started = time.perf_counter()
+        qvec, hits, cached, prompt, stats = await asyncio.to_thread(self._prepare, question, top_k, **options)
+        if cached is not None:
+            return self._result(cached, hits, True, started)
+        with metrics.span("llm"):
+            answer = await self.llm.agenerate(prompt)
+        self._remember_answer(qvec, hits, answer, started)
+        return self._result(answer, hits, False, started, stats)
+
+    def answer_many(self, questions: List[str], top_k: int = 3,
+                    max_concurrency: int = BATCH_LLM_CONCURRENCY, **options) -> List[Dict]:
+        """Answer many questions: one batched embed, one batched search, then
+        LLM calls on at most ``max_concurrency`` threads. Results keep input order."""
+        started = time.perf_counter()
+        qvecs, hits_list = self._retrieve_many(questions, top_k, **options)
+
+        def one(question, qvec, hits):
+            cached = self._cached_answer(qvec, hits)
+            if cached is not None:
+                return self._result(cached, hits, True, started)
+            prompt, stats = self.pack_prompt(question, hits)
+            with metrics.span("llm"):
+                answer = self.llm.generate(prompt)
+            self._remember_answer(qvec, hits, answer, started)
+            return self._result(answer, hits, False, started, stats)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            return list(pool.map(one, questions, qvecs, hits_list))
+
+    async def aanswer_many(self, questions: List[str], top_k: int = 3,
+                           max_concurrency: int = BATCH_LLM_CONCURRENCY, **options) -> List[Dict]:
+        """Async answer_many(): at most ``max_concurrency`` LLM calls are in flight."""
+        started = time.perf_counter()
+        prepared = await asyncio.to_thread(self._prepare_many, questions, top_k, **options)
+        sem = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def one(qvec, hits, cached, prompt, stats):
+            if cached is not None:
+                return self._result(cached, hits, True, started)
+            async with sem:
+                with metrics.span("llm"):
+                    answer = await self.llm.agenerate(prompt)
+            self._remember_answer(qvec, hits, answer, started)
+            return self._result(answer, hits, False, started, stats)
+
+        return await asyncio.gather(*(one(*p) for p in prepared))
+
+    async def astream_answer(self, question: str, top_k: int = 3, **options) -> AsyncIterator[Dict]:
+        """Stream an answer as events: the sources first, then answer tokens.
+
+        Yields ``{'type': 'sources', 'sources': [...]}`` once the hits are retrieved and the prompt packed,
+        ``{'type': 'token', 'text': ...}`` per piece from the LLM and finally
+        ``{'type': 'done', 'context': {...}}`` with the prompt packing stats.
+        If retrieval, packing or the LLM fails, the stream ends with
+        ``{'type': 'error', 'error': ...}`` instead.
+        """
+        started = time.perf_counter()
+        try:
+            qvec, hits, cached, prompt, stats = await asyncio.to_thread(self._prepare, question, top_k, **options)
+        except Exception as e:
+            # the response status is already sent; report the failure in the stream
+            logging.exception("Retrieval or prompt packing failed")
+            yield {'type': 'error', 'error': str(e)}
+            return
+        yield {'type': 'sources', 'sources': self.sanitize_hits(hits)}
+        if cached is not None:
+            semantic_cache.record_latency(True, time.perf_counter() - started)
+            yield {'type': 'token', 'text': cached}
+            yield {'type': 'done', 'cached': True}
+            return
+        pieces = []
+        try:
+            # includes the time the client takes to consume each token
+            with metrics.span("llm", stream=True):
+                async for piece in self.llm.astream(prompt):
+                    pieces.append(piece)
+                    yield {'type': 'token', 'text': piece}
+        except Exception as e:
+            logging.exception("LLM streaming failed")
+            yield {'type': 'error', 'error': str(e)}
+            return
+        self._remember_answer(qvec, hits, "".join(pieces), started)
+        yield {'type': 'done', 'context': stats}
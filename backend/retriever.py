@@ -1,23 +1,134 @@
-from typing import List
+from typing import List, Optional
+
+import numpy as np
 
 from .embedder import Embedder
-from .vectorstore import QdrantStore
+from .vectorstore import get_store
+from .config import (
+    EMBED_MODEL, QDRANT_COLLECTION, RETRIEVAL_MODE, RRF_K, HYBRID_CANDIDATES, EMBED_BATCHING, EMBED_BATCH_MAX,
+)
+from . import lexical
+from .batcher import get_batcher
+from .cache import (
+    query_embedding_cache, search_cache, normalize_query, vector_hash, filter_key, collection_version,
+)
+
+
+def _hits_to_dicts(hits) -> List[dict]:
+    # convert hits to simple dicts
+    results = []
+    for h in hits:
+        hit = {
+            'id': h.id,
+            'score': h.score,
+            'payload': h.payload,
+        }
+        vector = getattr(h, 'vector', None)
+        if vector is not None:
+            # only present when searched with_vectors (used by context packing)
+            hit['vector'] = np.asarray(vector, dtype=np.float32)
+        results.append(hit)
+    return results
+
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
 
 
 class Retriever:
-    def __init__(self, embed_model: str = None, collection: str = None):
-        self.embedder = Embedder(embed_model or 'all-MiniLM-L6-v2')
-        self.store = QdrantStore(collection=collection) if collection else QdrantStore()
-
-    def retrieve(self, query: str, top_k: int = 3):
-        qvec = self.embedder.embed_text(query)
-        hits = self.store.search(qvec, top_k=top_k)
-        # convert hits to simple dicts
-        results = []
-        for h in hits:
-            results.append({
-                'id': h.id,
-                'score': h.score,
-                'payload': h.payload,
-            })
-        return results
+    def __init__(self, embed_model: str = None, collection: str = None, batching: bool = EMBED_BATCHING):
+        self.embedder = Embedder(embed_model or EMBED_MODEL)
+        self.store = get_store(collection or QDRANT_COLLECTION)
+        self.batching = batching
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed queries, serving repeats from the cache and encoding the rest in one batch."""
+        texts = [normalize_query(q) for q in queries]
+        keys = [(self.embedder.model_name, t) for t in texts]
+        qvecs = [query_embedding_cache.get(k) for k in keys]
+        missing = [i for i, v in enumerate(qvecs) if v is None]
+        if missing:
+            # embed each distinct text once even if it repeats within the batch
+            distinct = list(dict.fromkeys(texts[i] for i in missing))
+            # copy the rows: a cached view would keep the whole batch array alive
+            embedded = dict(zip(distinct, (v.copy() for v in np.asarray(self._encode(distinct)))))
+            for i in missing:
+                qvecs[i] = embedded[texts[i]]
+                query_embedding_cache.set(keys[i], qvecs[i])
+        return qvecs
+
+    def _encode(self, texts: List[str]):
+        # a full batch gains nothing from waiting for other requests' queries
+        if self.batching and len(texts) < EMBED_BATCH_MAX:
+            return get_batcher(self.embedder).embed(texts)
+        return self.embedder.embed_texts(texts)
+
+    def _search_key(self, version: str, qvec, top_k: int, filter: Optional[dict] = None,
+                    hnsw_ef: Optional[int] = None, exact: bool = False, with_vectors: bool = False):
+        return (self.store.collection, version, vector_hash(qvec), top_k,
+                filter_key(filter), hnsw_ef, exact, with_vectors)
+
+    def search(self, qvec: List[float], top_k: int = 3, **params) -> List[dict]:
+        return self.search_many([qvec], top_k=top_k, **params)[0]
+
+    def search_many(self, qvecs: List[List[float]], top_k: int = 3, filter: Optional[dict] = None,
+                    hnsw_ef: Optional[int] = None, exact: bool = False,
+                    with_vectors: bool = False) -> List[List[dict]]:
+        """Search for several vectors; cache misses go to the store in one batch request.
+
+        ``filter`` (payload equality, e.g. ``{'file_id': [...]}``), ``hnsw_ef``,
+        ``exact`` and ``with_vectors`` are passed to the store and are part of
+        the cache key.
+        """
+        params = {'filter': filter, 'hnsw_ef': hnsw_ef, 'exact': exact, 'with_vectors': with_vectors}
+        version = collection_version(self.store.collection)
+        keys = [self._search_key(version, v, top_k, **params) for v in qvecs]
+        results = [search_cache.get(k) for k in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if len(missing) == 1:
+            i = missing[0]
+            results[i] = _hits_to_dicts(self.store.search(qvecs[i], top_k=top_k, **params))
+            search_cache.set(keys[i], results[i])
+        elif missing:
+            batches = self.store.search_batch([qvecs[i] for i in missing], top_k=top_k, **params)
+            for i, hits in zip(missing, batches):
+                results[i] = _hits_to_dicts(hits)
+                search_cache.set(keys[i], results[i])
+        return [list(r) for r in results]
+
+    def retrieve(self, query: str, top_k: int = 3, **options):
+        return self.retrieve_many([query], top_k=top_k, **options)[0]
+
+    def retrieve_many(self, queries: List[str], top_k: int = 3, **options) -> List[List[dict]]:
+        return self.search_queries(queries, self.embed_queries(queries), top_k=top_k, **options)
+
+    def lexical_search(self, query: str, top_k: int = 3, filter: Optional[dict] = None) -> List[dict]:
+        return lexical.get_index(self.store.collection).search(query, top_k, filter=filter)
+
+    def search_queries(self, queries: List[str], qvecs: List[List[float]], top_k: int = 3,
+                       mode: str = None, rrf_k: int = None, filter: Optional[dict] = None,
+                       hnsw_ef: Optional[int] = None, exact: bool = False,
+                       with_vectors: bool = False) -> List[List[dict]]:
+        """Search in ``mode``: dense (vector store), lexical (BM25) or hybrid.
+
+        Hybrid takes top_k * HYBRID_CANDIDATES candidates from each side and
+        fuses them with reciprocal-rank fusion, so exact identifiers found by
+        BM25 can outrank near-miss dense neighbours. ``filter`` applies to
+        both sides; ``hnsw_ef``, ``exact`` and ``with_vectors`` only to the
+        dense one (lexical hits carry no vector).
+        """
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        params = {'filter': filter, 'hnsw_ef': hnsw_ef, 'exact': exact, 'with_vectors': with_vectors}
+        if mode == "dense":
+            return self.search_many(qvecs, top_k=top_k, **params)
+        if mode == "lexical":
+            return [self.lexical_search(q, top_k, filter=filter) for q in queries]
+        depth = top_k * max(1, HYBRID_CANDIDATES)
+        dense = self.search_many(qvecs, top_k=depth, **params)
+        return [lexical.reciprocal_rank_fusion([d, self.lexical_search(q, depth, filter=filter)], top_k,
+                                               k=rrf_k if rrf_k is not None else RRF_K)
+                for q, d in zip(queries, dense)]
@@ -1,18 +1,154 @@
+import hashlib
 import os
 import uuid
 from pathlib import Path
+from typing import AsyncIterable, AsyncIterator
 
-from .config import UPLOAD_DIR
+import anyio
+
+from .config import UPLOAD_DIR, UPLOAD_CHUNK_SIZE, MAX_UPLOAD_BYTES
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Room for multipart boundaries and part headers on top of MAX_UPLOAD_BYTES of file data
+MULTIPART_OVERHEAD = 65536
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class BadUpload(ValueError):
+    pass
+
+
+async def save_upload(chunks: AsyncIterable[bytes], filename: str = '') -> dict:
+    """Write an upload, as it arrives, to content-addressed storage.
+
+    ``chunks`` are written with async file I/O while their SHA-256 is
+    computed, then the file is stored as ``<sha[:2]>/<sha><ext>``. The hash
+    plus extension is the file_id, so identical uploads are stored (and
+    ingested) once; the extension is part of it because it selects the
+    extractor. Raises UploadTooLarge past MAX_UPLOAD_BYTES.
+    """
+    tmp, sha, size = await _write_tmp(chunks)
+    return _place(tmp, sha, size, filename)
+
+
+async def _write_tmp(chunks: AsyncIterable[bytes]):
+    tmp_dir = Path(UPLOAD_DIR) / ".tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / uuid.uuid4().hex
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(tmp, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp, digest.hexdigest(), size
+
+
+def _place(tmp: Path, sha: str, size: int, filename: str) -> dict:
+    # keep the extension: extractors are chosen by it
+    name = f"{sha}{Path(filename or '').suffix.lower()}"
+    dest = Path(UPLOAD_DIR) / sha[:2] / name
+    deduplicated = dest.exists()
+    if deduplicated:
+        tmp.unlink(missing_ok=True)
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, dest)
+    return {
+        "file_id": name,
+        "path": str(dest),
+        "filename": filename,
+        "size": size,
+        "sha256": sha,
+        "deduplicated": deduplicated,
+    }
+
+
+async def save_multipart_upload(body: AsyncIterable[bytes], content_type: str, field: str = "file") -> dict:
+    """Store the ``field`` file part of a multipart/form-data request body with save_upload().
+
+    The body is parsed as it is received, so the file goes to disk once,
+    without being spooled by the form parser first, and an oversized body
+    is refused as soon as it passes MAX_UPLOAD_BYTES. Other parts are
+    skipped. Raises BadUpload for a malformed body or a missing file part.
+    """
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    mime, options = parse_options_header(content_type)
+    if mime != b"multipart/form-data" or not options.get(b"boundary"):
+        raise BadUpload("expected a multipart/form-data body")
+
+    part = {"headers": {}, "mine": False}
+    found = {"filename": None, "done": False}
+    pending = bytearray()
+    header = [b"", b""]
+
+    def on_part_begin():
+        part.update(headers={}, mine=False)
+
+    def on_header_field(data, start, end):
+        header[0] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header[1] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header[0].lower()] = header[1]
+        header[0] = header[1] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition"))
+        name, filename = disposition.get(b"name"), disposition.get(b"filename")
+        if name == field.encode() and filename is not None and found["filename"] is None:
+            part["mine"] = True
+            found["filename"] = filename.decode("utf-8", "replace")
+
+    def on_part_data(data, start, end):
+        if part["mine"]:
+            pending.extend(data[start:end])
+
+    def on_part_end():
+        if part["mine"]:
+            found["done"] = True
+
+    parser = MultipartParser(options[b"boundary"], {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end,
+    })
+
+    async def file_data() -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in body:
+            received += len(chunk)
+            # other parts are not stored, but the body as a whole must stay bounded too
+            if MAX_UPLOAD_BYTES and received > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+                raise UploadTooLarge(f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise BadUpload(f"malformed multipart body: {e}") from e
+            # parser callbacks hand out slices of each body chunk; write UPLOAD_CHUNK_SIZE pieces
+            if len(pending) >= UPLOAD_CHUNK_SIZE:
+                yield bytes(pending)
+                pending.clear()
+        parser.finalize()
+        if pending:
+            yield bytes(pending)
+        if not found["done"]:
+            raise BadUpload(f"no complete '{field}' file part in the body")
 
-def save_upload(file_obj, filename: str = None):
-    """Save fastapi UploadFile to disk and return file_id and path."""
-    file_id = str(uuid.uuid4())
-    filename = filename or getattr(file_obj, 'filename', file_id)
-    dest = Path(UPLOAD_DIR) / f"{file_id}_{filename}"
-    with open(dest, "wb") as f:
-        content = file_obj.file.read()
-        f.write(content)
-    return file_id, str(dest)
+    tmp, sha, size = await _write_tmp(file_data())
+    # the filename (and so the extension) is known once the part headers are parsed
+    return _place(tmp, sha, size, found["filename"])
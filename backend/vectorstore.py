@@ -1,81 +1,376 @@
 import logging
+import re
+import threading
+import uuid
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-from .config import QDRANT_HOST, QDRANT_PORT, QDRANT_COLLECTION, EMBED_DIM
+from .config import (
+    QDRANT_HOST, QDRANT_PORT, QDRANT_COLLECTION, EMBED_DIM,
+    QDRANT_PREFER_GRPC, QDRANT_GRPC_PORT, QDRANT_POOL_SIZE, QDRANT_UPLOAD_BATCH, QDRANT_UPLOAD_PARALLEL,
+    VECTOR_BACKEND, QDRANT_PAYLOAD_INDEXES, QDRANT_QUANTIZATION, QDRANT_ON_DISK, QDRANT_RESCORE,
+    QDRANT_OVERSAMPLING, QDRANT_HNSW_EF,
+)
+
+# Long-lived clients shared by every QdrantStore in the process, keyed by
+# (host, port, prefer_grpc). A QdrantClient keeps its own keep-alive
+# connection pool, so reusing it avoids a handshake per request.
+_clients: Dict[Tuple[str, int, bool], QdrantClient] = {}
+# (host, port, collection) triples already known to exist; skips the
+# get_collection round trip on every store construction.
+_verified_collections = set()
+_lock = threading.Lock()
+
+
+class _SerializedClient:
+    """Runs one call at a time on a client that is not thread-safe (qdrant-client local mode)."""
+
+    def __init__(self, client):
+        self._client = client
+        self._call_lock = threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._call_lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+def get_client(host: str = QDRANT_HOST, port: int = QDRANT_PORT, prefer_grpc: bool = QDRANT_PREFER_GRPC,
+               pool_size: int = QDRANT_POOL_SIZE) -> QdrantClient:
+    key = (host, port, prefer_grpc)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None and host == ':memory:':
+            # embedded qdrant-client local mode: no server, nothing persisted (tests, benchmarks)
+            client = _clients[key] = _SerializedClient(QdrantClient(location=':memory:'))
+        if client is None:
+            kwargs = {'prefer_grpc': prefer_grpc, 'grpc_port': QDRANT_GRPC_PORT}
+            try:
+                client = QdrantClient(host=host, port=port, pool_size=pool_size, **kwargs)
+            except TypeError:
+                # older qdrant-client versions have no pool_size; size the REST pool directly
+                import httpx
+                client = QdrantClient(host=host, port=port,
+                                      limits=httpx.Limits(max_connections=pool_size,
+                                                          max_keepalive_connections=pool_size),
+                                      **kwargs)
+            _clients[key] = client
+        return client
+
+
+def _as_list(vector) -> List[float]:
+    # the client validates query vectors as plain floats; one small conversion per query
+    return vector.tolist() if hasattr(vector, 'tolist') else list(vector)
+
+
+def validate_arrays(ids: list, vectors: np.ndarray, payloads: List[dict], dim: int = EMBED_DIM) -> np.ndarray:
+    vectors = np.asarray(vectors)
+    if vectors.ndim != 2 or vectors.shape[1] != dim:
+        raise ValueError(f"vectors shape {vectors.shape} does not match (n, EMBED_DIM={dim})")
+    if len(ids) != len(vectors) or len(payloads) != len(vectors):
+        raise ValueError(f"got {len(ids)} ids and {len(payloads)} payloads for {len(vectors)} vectors")
+    if not np.isfinite(vectors).all():
+        raise ValueError("vectors contain NaN or infinite values")
+    return vectors
+
+
+def points_to_arrays(points) -> Tuple[list, np.ndarray, List[dict]]:
+    """Split PointStruct-like objects or {'id', 'vector', 'payload'} dicts into ids, array, payloads."""
+    ids, vectors, payloads = [], [], []
+    for p in points:
+        if isinstance(p, dict):
+            pid = p.get('id')
+            vec = p.get('vector')
+            payload = p.get('payload')
+        else:
+            pid = getattr(p, 'id', None)
+            vec = getattr(p, 'vector', None)
+            payload = getattr(p, 'payload', None)
+        if vec is None:
+            raise ValueError(f"Point {pid} has no vector")
+        # If pid is a UUID object, cast to string to satisfy some client versions
+        ids.append(str(pid) if isinstance(pid, uuid.UUID) else pid)
+        vectors.append(vec)
+        payloads.append(payload)
+    try:
+        arr = np.asarray(vectors, dtype=np.float32)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Point vectors do not form a (n, {EMBED_DIM}) array: {e}") from e
+    return ids, arr, payloads
+
+
+def match_payload(payload: Optional[dict], flt: Optional[dict]) -> bool:
+    """Python version of _qdrant_filter, for stores that filter in process."""
+    if not flt:
+        return True
+    payload = payload or {}
+    for key, want in flt.items():
+        have = payload.get(key)
+        if isinstance(want, (list, tuple, set)):
+            if have not in want:
+                return False
+        elif have != want:
+            return False
+    return True
+
+
+def _qdrant_filter(flt: Optional[dict]):
+    # {key: value} must match exactly; {key: [v1, v2]} matches any of the values
+    if not flt:
+        return None
+    from qdrant_client import models
+    conditions = []
+    for key, want in flt.items():
+        if isinstance(want, (list, tuple, set)):
+            match = models.MatchAny(any=list(want))
+        else:
+            match = models.MatchValue(value=want)
+        conditions.append(models.FieldCondition(key=key, match=match))
+    return models.Filter(must=conditions)
+
+
+def _quantization_config(kind: str = QDRANT_QUANTIZATION):
+    if not kind:
+        return None
+    from qdrant_client import models
+    if kind == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown QDRANT_QUANTIZATION: {kind}")
+
+
+def _payload_schema(kind: str):
+    # QDRANT_PAYLOAD_INDEXES types; integer MatchValue filters only use an integer index
+    from qdrant_client import models
+    schemas = {"keyword": models.PayloadSchemaType.KEYWORD, "integer": models.PayloadSchemaType.INTEGER,
+               "bool": models.PayloadSchemaType.BOOL}
+    if kind not in schemas:
+        raise ValueError(f"Unknown QDRANT_PAYLOAD_INDEXES type: {kind} (use keyword, integer or bool)")
+    return schemas[kind]
+
+
+def _search_params(hnsw_ef: Optional[int] = None, exact: bool = False):
+    from qdrant_client import models
+    hnsw_ef = hnsw_ef or QDRANT_HNSW_EF or None
+    quantization = None
+    if QDRANT_QUANTIZATION:
+        quantization = models.QuantizationSearchParams(rescore=QDRANT_RESCORE, oversampling=QDRANT_OVERSAMPLING)
+    if hnsw_ef is None and not exact and quantization is None:
+        return None
+    return models.SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+
+# Collection names come from requests and end up in file names (local store, lexical index, cache tokens)
+COLLECTION_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def validate_collection(name: str) -> str:
+    """Return ``name`` if it is a valid collection name, else raise ValueError."""
+    if not isinstance(name, str) or not COLLECTION_NAME.fullmatch(name):
+        raise ValueError(f"Invalid collection name {name!r}: use 1-64 letters, digits, '_' or '-'")
+    return name
+
+
+def get_store(collection: str = QDRANT_COLLECTION, backend: str = VECTOR_BACKEND):
+    """Return the vector store for ``collection`` on ``backend`` (qdrant | local).
+
+    Both backends expose the same methods: ``upsert``, ``upsert_arrays``,
+    ``delete``, ``search`` and ``search_batch`` (hits with ``id``, ``score``
+    and ``payload`` attributes; optional equality ``filter`` on payload
+    fields, ``hnsw_ef`` and ``exact``), ``retrieve_payloads``,
+    ``set_payloads`` and ``flush``.
+    """
+    validate_collection(collection)
+    if backend == "local":
+        from .local_store import get_local_store
+        return get_local_store(collection)
+    if backend != "qdrant":
+        raise ValueError(f"Unknown vector backend: {backend}")
+    return QdrantStore(collection=collection)
+
+
+def close_clients():
+    """Close all cached clients (used on app shutdown)."""
+    with _lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                logging.debug("Failed to close Qdrant client", exc_info=True)
+        _clients.clear()
+        _verified_collections.clear()
 
 
 class QdrantStore:
     def __init__(self, host: str = QDRANT_HOST, port: int = QDRANT_PORT, collection: str = QDRANT_COLLECTION):
-        self.client = QdrantClient(host=host, port=port)
+        self.client = get_client(host, port)
         self.collection = collection
-        # Ensure collection exists. qdrant-client API versions vary; be tolerant of differences.
-        try:
-            coll = self.client.get_collection(collection_name=collection)
-            exists = bool(coll)
-        except Exception:
-            exists = False
+        self._verified_key = (host, port, collection)
+        if self._verified_key not in _verified_collections:
+            self._ensure_collection()
+            _verified_collections.add(self._verified_key)
 
-        if not exists:
-            # create/recreate collection
-            self.client.recreate_collection(
-                collection_name=collection,
-                vectors_config=VectorParams(size=EMBED_DIM, distance=Distance.COSINE),
+    def _ensure_collection(self):
+        # Create the collection only when Qdrant says it is missing; any other error (timeout,
+        # connection reset) propagates, since treating it as "missing" would drop live data.
+        quantization = _quantization_config()
+        if not self.client.collection_exists(collection_name=self.collection):
+            self.client.create_collection(
+                collection_name=self.collection,
+                vectors_config=VectorParams(size=EMBED_DIM, distance=Distance.COSINE, on_disk=QDRANT_ON_DISK),
+                quantization_config=quantization,
             )
+            coll = None
+        else:
+            coll = self.client.get_collection(collection_name=self.collection)
+            if quantization is not None and getattr(coll.config, 'quantization_config', None) is None:
+                # quantize an existing collection in place; Qdrant rebuilds it in the background
+                self.client.update_collection(collection_name=self.collection, quantization_config=quantization)
+        self._ensure_payload_indexes(coll)
 
-    def upsert(self, points: List[PointStruct]):
-        # qdrant-client upload_points expects PointStruct-like objects with .id/.vector/.payload
-        # Log types and sample content to help debug issues where dicts slip through.
-        logging.debug(f"Upsert called with {len(points)} points. Sample types: {[type(p) for p in points[:3]]}")
-        for i, p in enumerate(points[:3]):
+    def _ensure_payload_indexes(self, coll=None):
+        existing = getattr(coll, 'payload_schema', None) or {}
+        for field, kind in QDRANT_PAYLOAD_INDEXES.items():
+            schema = _payload_schema(kind)
+            if getattr(existing.get(field), 'data_type', None) == schema:
+                continue
             try:
-                if isinstance(p, dict):
-                    logging.debug(f"point[{i}] dict keys: {list(p.keys())}")
-                else:
-                    logging.debug(f"point[{i}] attrs: id={getattr(p,'id',None)} payload_keys={list(getattr(p,'payload',{}).keys()) if getattr(p,'payload',None) else None}")
+                # also replaces an index of another type, e.g. after a field's type was set in the config
+                self.client.create_payload_index(collection_name=self.collection, field_name=field,
+                                                 field_schema=schema)
             except Exception:
-                logging.debug(f"point[{i}] preview failed: {p}")
-
-        # Validate and normalize vectors
-        normalized = []
-        for p in points:
-            if isinstance(p, dict):
-                pid = p.get('id')
-                vec = p.get('vector')
-                payload = p.get('payload')
-            else:
-                pid = getattr(p, 'id', None)
-                vec = getattr(p, 'vector', None)
-                payload = getattr(p, 'payload', None)
-
-            # validate vector shape
-            if vec is None:
-                raise ValueError(f"Point {pid} has no vector")
-            if not hasattr(vec, '__len__'):
-                raise ValueError(f"Point {pid} vector is not a sequence: {type(vec)}")
-            if len(vec) != EMBED_DIM:
-                raise ValueError(f"Point {pid} vector length {len(vec)} does not match EMBED_DIM={EMBED_DIM}")
-
-            # construct fresh PointStruct objects to avoid cross-import isinstance issues
-            try:
-                # If pid is a UUID object, cast to string to satisfy some client versions
-                if hasattr(pid, 'hex') or hasattr(pid, 'urn'):
-                    pid_for_struct = str(pid)
-                else:
-                    pid_for_struct = pid
-                normalized.append(PointStruct(id=pid_for_struct, vector=list(vec), payload=payload))
-            except Exception as e:
-                logging.exception("Failed to construct PointStruct; passing raw dict as fallback")
-                normalized.append({"id": str(pid), "vector": list(vec), "payload": payload})
-
-        # finally call upload
+                logging.warning(f"Could not create payload index {field} on {self.collection}", exc_info=True)
+
+    def _forget_collection(self):
+        # Something went wrong (e.g. the collection was dropped behind our back);
+        # re-verify on the next construction.
+        _verified_collections.discard(self._verified_key)
+
+    def upsert(self, points: List[PointStruct]):
+        """Upsert PointStruct-like objects or {'id', 'vector', 'payload'} dicts."""
+        logging.debug(f"Upsert called with {len(points)} points. Sample types: {[type(p) for p in points[:3]]}")
+        self.upsert_arrays(*points_to_arrays(points))
+
+    def upsert_arrays(self, ids: list, vectors: np.ndarray, payloads: List[dict],
+                      batch_size: int = QDRANT_UPLOAD_BATCH, parallel: int = QDRANT_UPLOAD_PARALLEL):
+        """Upload an (n, EMBED_DIM) array with matching ids and payloads.
+
+        The array goes to the client as-is (columnar upload_collection), so no
+        per-point Python float lists or PointStruct objects are built here.
+        """
+        vectors = validate_arrays(ids, vectors, payloads)
+        if len(vectors) == 0:
+            return
         try:
-            self.client.upload_points(collection_name=self.collection, points=normalized)
+            # wait=True: the caller invalidates cached searches next, which must not
+            # be refilled from a collection that has not applied the points yet
+            self.client.upload_collection(collection_name=self.collection, vectors=vectors, payload=payloads,
+                                          ids=ids, batch_size=batch_size, parallel=parallel, wait=True)
         except Exception:
-            logging.exception("upload_points failed")
+            logging.exception("upload_collection failed")
+            self._forget_collection()
             raise
 
-    def search(self, vector: List[float], top_k: int = 5):
-        hits = self.client.search(collection_name=self.collection, query_vector=vector, limit=top_k)
+    def delete(self, ids: list):
+        if not ids:
+            return
+        from qdrant_client import models
+        try:
+            self.client.delete(collection_name=self.collection,
+                               points_selector=models.PointIdsList(points=list(ids)))
+        except Exception:
+            logging.exception("delete failed")
+            self._forget_collection()
+            raise
+
+    def retrieve_payloads(self, ids: list, fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        """Payloads (only ``fields`` if given) of the points among ``ids`` that exist, by point id."""
+        if not ids:
+            return {}
+        try:
+            points = self.client.retrieve(collection_name=self.collection, ids=list(ids),
+                                          with_payload=fields if fields is not None else True, with_vectors=False)
+        except Exception:
+            self._forget_collection()
+            raise
+        return {str(p.id): p.payload or {} for p in points}
+
+    def set_payloads(self, updates: Dict[str, dict]):
+        """Merge ``{point id: fields}`` into the points' payloads, in one request."""
+        if not updates:
+            return
+        from qdrant_client import models
+        operations = [models.SetPayloadOperation(set_payload=models.SetPayload(payload=fields, points=[pid]))
+                      for pid, fields in updates.items()]
+        try:
+            self.client.batch_update_points(collection_name=self.collection, update_operations=operations,
+                                            wait=True)
+        except Exception:
+            logging.exception("set_payloads failed")
+            self._forget_collection()
+            raise
+
+    def flush(self):
+        # Qdrant persists writes itself
+        pass
+
+    def search(self, vector: List[float], top_k: int = 5, filter: Optional[dict] = None,
+               hnsw_ef: Optional[int] = None, exact: bool = False, with_vectors: bool = False):
+        """Nearest points to ``vector``.
+
+        ``filter`` is applied by Qdrant during the search (see _qdrant_filter),
+        ``hnsw_ef`` widens the HNSW candidate list and ``exact`` skips the
+        index altogether. Quantized collections oversample and rescore.
+        ``with_vectors`` also returns the stored vector of each point.
+        """
+        vector = _as_list(vector)
+        query_filter = _qdrant_filter(filter)
+        params = _search_params(hnsw_ef, exact)
+        # qdrant-client >= 1.10 replaces search() with query_points(); newer
+        # releases drop search() entirely, so prefer whichever is available.
+        try:
+            if hasattr(self.client, 'query_points'):
+                hits = self.client.query_points(collection_name=self.collection, query=vector, limit=top_k,
+                                                query_filter=query_filter, search_params=params,
+                                                with_payload=True, with_vectors=with_vectors).points
+            else:
+                hits = self.client.search(collection_name=self.collection, query_vector=vector, limit=top_k,
+                                          query_filter=query_filter, search_params=params,
+                                          with_vectors=with_vectors)
+        except Exception:
+            self._forget_collection()
+            raise
         return hits
+
+    def search_batch(self, vectors: List[List[float]], top_k: int = 5, filter: Optional[dict] = None,
+                     hnsw_ef: Optional[int] = None, exact: bool = False, with_vectors: bool = False) -> List[list]:
+        """Run several searches in a single request; returns one hit list per vector, in order."""
+        if len(vectors) == 0:
+            return []
+        from qdrant_client import models
+        query_filter = _qdrant_filter(filter)
+        params = _search_params(hnsw_ef, exact)
+        try:
+            if hasattr(self.client, 'query_batch_points'):
+                requests = [models.QueryRequest(query=_as_list(v), limit=top_k, filter=query_filter, params=params,
+                                                with_payload=True, with_vector=with_vectors) for v in vectors]
+                responses = self.client.query_batch_points(collection_name=self.collection, requests=requests)
+                return [r.points for r in responses]
+            requests = [models.SearchRequest(vector=_as_list(v), limit=top_k, filter=query_filter, params=params,
+                                             with_payload=True, with_vector=with_vectors) for v in vectors]
+            return self.client.search_batch(collection_name=self.collection, requests=requests)
+        except Exception:
+            self._forget_collection()
+            raise
@@ -0,0 +1,66 @@
+"""Compare per-query answering with RAGPipeline.answer_many().
+
+Runs N generated questions against an already-ingested collection, once
+through a loop of ``RAGPipeline.answer`` and once through ``answer_many``,
+and prints queries/sec for both. Leave LLM_ENDPOINT empty to measure
+retrieval only (the stub LLM answers instantly), or point it at
+scripts/mock_llm_server.py to include generation. Caches are cleared
+before each run so both paths do the same work.
+
+    python -m benchmarks.bench_batch_query --n 1000 --collection user_docs
+"""
+import argparse
+import json
+import random
+import time
+
+from backend.cache import query_embedding_cache, search_cache
+from backend.config import QDRANT_COLLECTION, BATCH_LLM_CONCURRENCY
+from backend.rag import RAGPipeline
+
+WORDS = ("what how why when document policy error code install configure limit "
+         "report user account service request timeout memory index search").split()
+
+
+def make_questions(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))) + f" #{i}?" for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-query loop vs answer_many")
+    parser.add_argument("--n", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--collection", default=QDRANT_COLLECTION)
+    parser.add_argument("--concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    args = parser.parse_args()
+
+    questions = make_questions(args.n)
+    rag = RAGPipeline(collection=args.collection, use_semantic_cache=False)
+    rag.answer("warmup")
+
+    query_embedding_cache.clear()
+    search_cache.clear()
+    t0 = time.perf_counter()
+    for q in questions:
+        rag.answer(q, top_k=args.top_k)
+    loop_s = time.perf_counter() - t0
+
+    query_embedding_cache.clear()
+    search_cache.clear()
+    t0 = time.perf_counter()
+    rag.answer_many(questions, top_k=args.top_k, max_concurrency=args.concurrency)
+    batch_s = time.perf_counter() - t0
+
+    print(json.dumps({
+        "queries": args.n,
+        "loop_seconds": round(loop_s, 3),
+        "loop_qps": round(args.n / loop_s, 1),
+        "batch_seconds": round(batch_s, 3),
+        "batch_qps": round(args.n / batch_s, 1),
+        "speedup": round(loop_s / batch_s, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Throughput and chunk count of the token chunker vs the character splitter.
+
+Streams a synthetic corpus (Markdown-like headings, paragraphs of sentences
+of varying length) through ``iter_chunks`` (CHUNK_SIZE / CHUNK_OVERLAP
+characters) and ``iter_token_chunks`` (CHUNK_MAX_TOKENS /
+CHUNK_OVERLAP_TOKENS) and prints chunks/sec, MB/s, how many character
+chunks cut a word in half, and the reduction in chunk count. By default
+tokens are estimated; ``--tokenizer`` uses the embedding model's tokenizer
+(``"tokenizer"`` in the output says "estimate" if it could not be loaded).
+
+    python -m benchmarks.bench_chunker --mb 100 --tokenizer
+"""
+import argparse
+import json
+import random
+import time
+
+from backend.chunker import iter_chunks, iter_token_chunks, estimate_tokens, token_counter
+from backend.config import CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+WORDS = ("the service request returns an error when the index is rebuilt during upload of large "
+         "documents and the worker retries with exponential backoff until the queue drains").split()
+
+
+def corpus(mb: int, piece_chars: int = 1 << 20, seed: int = 0):
+    """Yield about ``mb`` MB of text in pieces of ``piece_chars`` characters."""
+    rng = random.Random(seed)
+    target = mb * (1 << 20)
+    produced, buf, section = 0, [], 0
+    while produced < target:
+        if rng.random() < 0.05:
+            section += 1
+            block = f"\n## Section {section}\n"
+        else:
+            sentences = (" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))).capitalize() + "."
+                         for _ in range(rng.randint(2, 8)))
+            block = " ".join(sentences) + "\n\n"
+        buf.append(block)
+        produced += len(block)
+        if sum(map(len, buf)) >= piece_chars:
+            yield "".join(buf)
+            buf = []
+    if buf:
+        yield "".join(buf)
+
+
+def run(name: str, chunks, mb: int) -> dict:
+    t0 = time.perf_counter()
+    count, mid_word, prev = 0, 0, None
+    for c in chunks:
+        count += 1
+        if prev is not None and name == "chars" and prev["text"][-1:].isalnum() and \
+                c["text"][prev["end"] - c["start"]:prev["end"] - c["start"] + 1].isalnum():
+            mid_word += 1
+        prev = c
+    seconds = time.perf_counter() - t0
+    result = {"chunks": count, "seconds": round(seconds, 2), "chunks_per_sec": round(count / seconds, 1),
+              "mb_per_sec": round(mb / seconds, 2)}
+    if name == "chars":
+        result["mid_word_cuts"] = mid_word
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="token chunker vs character splitter")
+    parser.add_argument("--mb", type=int, default=100)
+    parser.add_argument("--tokenizer", action="store_true", help="use the embedding model's tokenizer")
+    args = parser.parse_args()
+
+    count_tokens = token_counter() if args.tokenizer else estimate_tokens
+    # generated up front so only chunking is timed
+    pieces = list(corpus(args.mb))
+    chars = run("chars", iter_chunks(pieces, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP), args.mb)
+    tokens = run("tokens", iter_token_chunks(pieces, max_tokens=CHUNK_MAX_TOKENS,
+                                             overlap_tokens=CHUNK_OVERLAP_TOKENS, count_tokens=count_tokens),
+                 args.mb)
+    print(json.dumps({
+        "mb": args.mb,
+        # token_counter() falls back to the estimate when the model cannot be loaded
+        "tokenizer": "estimate" if count_tokens is estimate_tokens else "model",
+        "chars": chars,
+        "tokens": tokens,
+        "chunk_reduction": round(1 - tokens["chunks"] / chars["chunks"], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Query embedding throughput with and without micro-batching.
+
+``--threads`` concurrent callers each embed ``--queries`` single questions,
+the way concurrent /query requests do: once calling the encoder directly and
+once through an EmbeddingBatcher for every ``--wait-ms`` value. Prints
+queries/sec, p50/p95/p99 per-query latency and the batcher's batch-size and
+queueing-delay stats, for picking EMBED_BATCH_MAX / EMBED_BATCH_WAIT_MS.
+Set EMBED_BACKEND / EMBED_QUANTIZE to compare inference backends.
+
+    python -m benchmarks.bench_embed_batching --threads 32 --queries 50 --wait-ms 0,2,5
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+import numpy as np
+
+from backend.batcher import EmbeddingBatcher
+from backend.config import EMBED_BATCH_MAX
+from backend.embedder import Embedder
+from benchmarks.bench_batch_query import make_questions
+
+
+def drive(embed, questions, threads: int) -> dict:
+    per_thread = [questions[i::threads] for i in range(threads)]
+    latencies = [[] for _ in range(threads)]
+
+    def caller(i):
+        for q in per_thread[i]:
+            t0 = time.perf_counter()
+            embed([q])
+            latencies[i].append((time.perf_counter() - t0) * 1000)
+
+    workers = [threading.Thread(target=caller, args=(i,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    seconds = time.perf_counter() - t0
+    ms = np.concatenate([np.asarray(lat) for lat in latencies if lat])
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"qps": round(len(questions) / seconds, 1), "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="direct vs micro-batched query embedding")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=50, help="queries per thread")
+    parser.add_argument("--max-batch", type=int, default=EMBED_BATCH_MAX)
+    parser.add_argument("--wait-ms", default="0,2,5")
+    args = parser.parse_args()
+
+    embedder = Embedder()
+    embedder.embed_texts(["warmup"])
+    questions = make_questions(args.threads * args.queries)
+    random.Random(0).shuffle(questions)
+
+    report = {"threads": args.threads, "queries": len(questions), "direct": drive(embedder.embed_texts, questions,
+                                                                                  args.threads)}
+    for wait in (float(w) for w in args.wait_ms.split(",")):
+        batcher = EmbeddingBatcher(embedder.embed_texts, max_batch=args.max_batch, max_wait_ms=wait)
+        result = drive(batcher.embed, questions, args.threads)
+        batcher.close()
+        report[f"batched_wait_{wait:g}ms"] = {**result, **batcher.stats()}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Measure PDF extraction throughput (pages/sec and pages/sec per core).
+
+Extracts the given PDF with 1..N worker processes, bypassing the
+extracted-text cache, and prints one JSON record per worker count.
+
+    python -m benchmarks.bench_extract path/to/large.pdf --max-workers 8
+"""
+import argparse
+import json
+import time
+
+from backend.config import EXTRACT_SHARD_PAGES
+from backend.extractor import iter_text_from_pdf
+
+
+def run(path: str, workers: int, shard_pages: int) -> dict:
+    t0 = time.perf_counter()
+    pages = sum(1 for _ in iter_text_from_pdf(path, workers=workers, shard_pages=shard_pages, min_parallel_pages=0))
+    seconds = time.perf_counter() - t0
+    return {
+        "workers": workers,
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(pages / seconds, 1),
+        "pages_per_sec_per_core": round(pages / seconds / workers, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF extraction throughput")
+    parser.add_argument("pdf")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--shard-pages", type=int, default=EXTRACT_SHARD_PAGES)
+    args = parser.parse_args()
+    workers = 1
+    while workers <= args.max_workers:
+        print(json.dumps(run(args.pdf, workers, args.shard_pages)))
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
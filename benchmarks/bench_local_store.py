@@ -0,0 +1,98 @@
+"""Search latency of the local vector store (exact and HNSW) vs Qdrant.
+
+For each collection size, random unit vectors are loaded into a LocalStore
+scanned exactly, a LocalStore with an HNSW graph (if hnswlib is installed)
+and, with ``--qdrant``, a throwaway collection on the configured server.
+Reports load time, p50/p95 single-query latency and HNSW recall@k against
+the exact results. Random Gaussian vectors are a hard case for HNSW;
+raise ``--ef`` to trade latency for recall.
+
+    python -m benchmarks.bench_local_store --sizes 10000,100000,1000000 --qdrant
+"""
+import argparse
+import json
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from backend.config import EMBED_DIM, LOCAL_HNSW_EF
+from backend.local_store import LocalStore
+
+
+def latency(store, queries, top_k):
+    times, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append([h.id for h in store.search(q, top_k=top_k)])
+        times.append(time.perf_counter() - t0)
+    ms = np.array(times) * 1000
+    return results, {"p50_ms": round(float(np.percentile(ms, 50)), 3),
+                     "p95_ms": round(float(np.percentile(ms, 95)), 3)}
+
+
+def load(store, ids, vectors, payloads, batch=4096):
+    t0 = time.perf_counter()
+    for i in range(0, len(ids), batch):
+        store.upsert_arrays(ids[i:i + batch], vectors[i:i + batch], payloads[i:i + batch])
+    return round(time.perf_counter() - t0, 2)
+
+
+def recall(approx, exact):
+    return round(float(np.mean([len(set(a) & set(e)) / max(1, len(e)) for a, e in zip(approx, exact)])), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local vector store vs Qdrant")
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--ef", type=int, default=LOCAL_HNSW_EF, help="HNSW search candidate list size")
+    parser.add_argument("--qdrant", action="store_true", help="also benchmark the configured Qdrant")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    report = []
+    for n in (int(s) for s in args.sizes.split(",")):
+        vectors = rng.standard_normal((n, EMBED_DIM), dtype=np.float32)
+        ids = [str(uuid.UUID(int=i)) for i in range(n)]
+        payloads = [{"index": i} for i in range(n)]
+        # queries near stored vectors, as real queries are near their answers
+        queries = vectors[rng.integers(0, n, args.queries)] + 0.3 * rng.standard_normal(
+            (args.queries, EMBED_DIM), dtype=np.float32)
+        row = {"n": n, "dim": EMBED_DIM}
+        with tempfile.TemporaryDirectory() as tmp:
+            flat = LocalStore("bench", path=f"{tmp}/flat", hnsw_threshold=0)
+            row["exact"] = {"load_s": load(flat, ids, vectors, payloads)}
+            exact, stats = latency(flat, queries, args.top_k)
+            row["exact"].update(stats)
+            del flat
+
+            hnsw = LocalStore("bench", path=f"{tmp}/hnsw", hnsw_threshold=1, hnsw_ef=args.ef)
+            row["hnsw"] = {"load_s": load(hnsw, ids, vectors, payloads)}
+            t0 = time.perf_counter()
+            if hnsw._use_hnsw():
+                row["hnsw"]["build_s"] = round(time.perf_counter() - t0, 2)
+                approx, stats = latency(hnsw, queries, args.top_k)
+                row["hnsw"].update(stats, recall_at_k=recall(approx, exact))
+            else:
+                row["hnsw"] = "hnswlib not installed"
+            del hnsw
+
+        if args.qdrant:
+            from backend.vectorstore import QdrantStore
+            store = QdrantStore(collection=f"bench_local_{uuid.uuid4().hex[:8]}")
+            try:
+                row["qdrant"] = {"load_s": load(store, ids, vectors, payloads)}
+                approx, stats = latency(store, queries, args.top_k)
+                row["qdrant"].update(stats, recall_at_k=recall([[str(i) for i in a] for a in approx], exact))
+            finally:
+                store.client.delete_collection(store.collection)
+        report.append(row)
+        print(json.dumps(row), flush=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Micro-benchmarks of the ingest and query hot paths (pytest-benchmark).
+
+Covers chunking, embedding, vector upsert/search (Qdrant and the local store)
+and prompt building. The file is only collected when named explicitly, so
+the regular test run does not pick it up:
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks/bench_micro.py --benchmark-autosave
+    python -m pytest benchmarks/bench_micro.py --benchmark-compare --benchmark-compare-fail=median:10%
+
+``--benchmark-autosave`` stores a JSON run (with the commit id) under
+.benchmarks/ and ``--benchmark-compare`` diffs against the latest one.
+Qdrant defaults to the embedded in-process client (QDRANT_HOST=:memory:);
+export QDRANT_HOST to measure a server instead. The embedding benchmark is
+skipped when sentence-transformers is not installed.
+"""
+import os
+
+os.environ.setdefault("QDRANT_HOST", ":memory:")
+
+import uuid  # noqa: E402
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+pytest.importorskip("pytest_benchmark")
+
+from backend.chunker import chunk_text, iter_token_chunks  # noqa: E402
+from backend.config import (  # noqa: E402
+    CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, EMBED_DIM,
+)
+from backend.local_store import LocalStore  # noqa: E402
+from backend.vectorstore import QdrantStore  # noqa: E402
+from benchmarks.bench_chunker import corpus  # noqa: E402
+
+POINTS = 5000
+BATCH = 256
+
+
+@pytest.fixture(scope="module")
+def text():
+    return "".join(corpus(1))
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((POINTS, EMBED_DIM), dtype=np.float32)
+
+
+def _points(vectors):
+    ids = [str(uuid.UUID(int=i)) for i in range(len(vectors))]
+    payloads = [{"text": f"chunk {i}", "file_id": f"f{i % 10}", "index": i} for i in range(len(vectors))]
+    return ids, payloads
+
+
+@pytest.fixture(scope="module")
+def qdrant_store(vectors):
+    store = QdrantStore(collection=f"bench_micro_{uuid.uuid4().hex[:8]}")
+    ids, payloads = _points(vectors)
+    store.upsert_arrays(ids, vectors, payloads)
+    yield store
+    store.client.delete_collection(store.collection)
+
+
+@pytest.fixture(scope="module")
+def local_store(vectors, tmp_path_factory):
+    store = LocalStore("bench", path=str(tmp_path_factory.mktemp("local")), dim=EMBED_DIM, hnsw_threshold=0)
+    ids, payloads = _points(vectors)
+    store.upsert_arrays(ids, vectors, payloads)
+    return store
+
+
+def test_chunk_text(benchmark, text):
+    chunks = benchmark(chunk_text, text, CHUNK_SIZE, CHUNK_OVERLAP)
+    assert chunks
+
+
+def test_iter_token_chunks(benchmark, text):
+    count = benchmark(lambda: sum(1 for _ in iter_token_chunks(
+        [text], max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)))
+    assert count
+
+
+def test_embed_texts(benchmark, text):
+    pytest.importorskip("sentence_transformers")
+    from backend.embedder import Embedder
+    embedder = Embedder()
+    texts = [c["text"] for c in chunk_text(text[:BATCH * CHUNK_SIZE], CHUNK_SIZE, CHUNK_OVERLAP)][:BATCH]
+    embedder.embed_texts(texts[:1])  # load the model outside the timing
+    embs = benchmark(embedder.embed_texts, texts)
+    assert embs.shape == (len(texts), EMBED_DIM)
+
+
+def test_qdrant_upsert(benchmark, qdrant_store, vectors):
+    ids, payloads = _points(vectors[:BATCH])
+    # rewrites the same points every round, so the collection size stays fixed
+    benchmark(qdrant_store.upsert_arrays, ids, vectors[:BATCH], payloads)
+
+
+@pytest.mark.parametrize("filtered", [False, True])
+def test_qdrant_search(benchmark, qdrant_store, vectors, filtered):
+    hits = benchmark(qdrant_store.search, vectors[7], top_k=5, filter={"file_id": "f7"} if filtered else None)
+    assert hits
+
+
+@pytest.mark.parametrize("filtered", [False, True])
+def test_local_store_search(benchmark, local_store, vectors, filtered):
+    hits = benchmark(local_store.search, vectors[7], top_k=5, filter={"file_id": "f7"} if filtered else None)
+    assert hits[0].id == str(uuid.UUID(int=7))
+
+
+@pytest.mark.parametrize("packing", [False, True])
+def test_build_prompt(benchmark, text, vectors, packing):
+    from backend.rag import RAGPipeline
+    rag = RAGPipeline(use_semantic_cache=False, pack_context=packing)
+    hits = [{"id": c["id"], "score": 1.0 - i / 100, "vector": vectors[i],
+             "payload": {"text": c["text"], "file_id": "f", "index": c["index"], "start": c["start"],
+                         "end": c["end"]}}
+            for i, c in enumerate(chunk_text(text[:20 * CHUNK_SIZE], CHUNK_SIZE, CHUNK_OVERLAP)[:20])]
+    prompt = benchmark(rag.build_prompt, "How does the worker retry after an error?", hits)
+    assert "QUESTION" in prompt
@@ -0,0 +1,86 @@
+"""End-to-end upload cost of the old list-based path vs the ndarray path.
+
+Both variants upload the same points to a fresh collection; the timings and
+peak memory include qdrant-client's own work (``upload_collection`` still
+turns every batch into float lists with ``tolist()`` before sending it, so
+the array path pays for that conversion too).
+
+The list path reproduces what ingestion used to do per vector: ``tolist()``
+the encoder output, wrap each row in a dict and a PointStruct, then rebuild
+another PointStruct with ``list(vec)`` during validation, and upload the
+points. The array path is QdrantStore.upsert_arrays(): one shape/finiteness
+check on the (n, dim) float32 array, then ``upload_collection``.
+
+Each variant runs twice: once for wall time and once under tracemalloc for
+peak Python-side memory (tracemalloc slows allocation-heavy code down, so
+its run is not timed). Qdrant defaults to the embedded in-process client
+(QDRANT_HOST=:memory:), which measures client-side cost only; export
+QDRANT_HOST to include a server round trip.
+
+    python -m benchmarks.bench_vectors --n 20000
+"""
+import os
+
+os.environ.setdefault("QDRANT_HOST", ":memory:")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+import uuid  # noqa: E402
+
+import numpy as np  # noqa: E402
+from qdrant_client.models import PointStruct  # noqa: E402
+
+from backend.config import EMBED_DIM, QDRANT_UPLOAD_BATCH  # noqa: E402
+from backend.vectorstore import QdrantStore  # noqa: E402
+
+
+def list_path(store: QdrantStore, embs: np.ndarray, ids: list, payloads: list):
+    vectors = embs.tolist()
+    points = [PointStruct(id=i, vector=v, payload=p) for i, v, p in zip(ids, vectors, payloads)]
+    normalized = [PointStruct(id=p.id, vector=list(p.vector), payload=p.payload) for p in points]
+    store.client.upload_points(collection_name=store.collection, points=normalized,
+                               batch_size=QDRANT_UPLOAD_BATCH, wait=True)
+
+
+def array_path(store: QdrantStore, embs: np.ndarray, ids: list, payloads: list):
+    store.upsert_arrays(ids, embs, payloads)
+
+
+def run(fn, embs, ids, payloads, trace: bool) -> float:
+    store = QdrantStore(collection=f"bench_vectors_{uuid.uuid4().hex[:8]}")
+    try:
+        if trace:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        fn(store, embs, ids, payloads)
+        seconds = time.perf_counter() - t0
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return peak / 2 ** 20
+        return seconds
+    finally:
+        store.client.delete_collection(store.collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="list vs ndarray upload path, end to end")
+    parser.add_argument("--n", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embs = rng.standard_normal((args.n, EMBED_DIM), dtype=np.float32)
+    ids = [str(uuid.uuid4()) for _ in range(args.n)]
+    payloads = [{"index": i} for i in range(args.n)]
+
+    results = {"n": args.n, "dim": EMBED_DIM, "qdrant": os.environ["QDRANT_HOST"]}
+    for name, fn in (("list_path", list_path), ("array_path", array_path)):
+        results[name] = {"seconds": round(run(fn, embs, ids, payloads, trace=False), 3),
+                         "peak_mb": round(run(fn, embs, ids, payloads, trace=True), 1)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
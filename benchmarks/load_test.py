@@ -0,0 +1,237 @@
+"""Concurrent /ingest + /query load with latency percentiles, saved as JSON.
+
+By default the FastAPI app runs in-process (httpx ASGI transport, with its
+startup/shutdown) against the embedded Qdrant (``--store memory``) or the
+local vector store (``--store local``), and the LLM is
+scripts/mock_llm_server.py on a background thread answering after
+``--llm-latency-ms``. ``--store env`` keeps the configured backends and
+``--url`` drives a running service instead (it must see the generated files,
+i.e. run on the same machine).
+
+``--docs`` documents are ingested up front so queries have something to
+find. Then ``--concurrency`` workers send requests for ``--duration``
+seconds; each one is an ingest with probability ``--ingest-ratio``, else a
+query. Reported per operation: requests/sec, errors and p50/p95/p99 latency
+in ms. ``ingest`` is the /ingest call (queueing), ``ingest_job`` the time
+until the job finished. The report also records the commit, the settings
+and the server's per-stage averages, and ``--compare`` prints the change
+against an earlier report:
+
+    python -m benchmarks.load_test --duration 30 --concurrency 16 --out .benchmarks/load/$(git rev-parse --short HEAD).json
+    python -m benchmarks.load_test --duration 30 --concurrency 16 --compare .benchmarks/load/abc1234.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+# backend is imported only after configure(): its settings are read at import time
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = ("the service request returns an error when the index is rebuilt during upload of large "
+         "documents and the worker retries with exponential backoff until the queue drains").split()
+
+
+def make_document(rng: random.Random, paragraphs: int = 20) -> str:
+    return "\n\n".join(" ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))).capitalize() + "."
+                                for _ in range(rng.randint(2, 6))) for _ in range(paragraphs))
+
+
+def make_question(rng: random.Random) -> str:
+    return "What happens when " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) + "?"
+
+
+def start_mock_llm(latency_ms: float, token_ms: float) -> str:
+    """Serve scripts/mock_llm_server.py on a free port in a daemon thread; returns its base URL."""
+    import uvicorn
+    spec = importlib.util.spec_from_file_location("mock_llm_server", os.path.join(REPO, "scripts", "mock_llm_server.py"))
+    mock = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mock)
+    mock.LATENCY_MS, mock.TOKEN_MS = latency_ms, token_ms
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(mock.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def configure(args, workdir: str):
+    """Point the service at throwaway state; must run before backend is imported."""
+    if args.store != "env":
+        os.environ["DATA_DIR"] = os.path.join(workdir, "data")
+        os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+        os.environ["VECTOR_BACKEND"] = "local" if args.store == "local" else "qdrant"
+        if args.store == "memory":
+            os.environ["QDRANT_HOST"] = ":memory:"
+    if args.llm_latency_ms >= 0:
+        os.environ["LLM_PROVIDER"] = "openai"
+        os.environ["LLM_ENDPOINT"] = start_mock_llm(args.llm_latency_ms, args.llm_token_ms)
+
+
+def percentiles(ms: list) -> dict:
+    if not ms:
+        return {}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+            "mean_ms": round(float(np.mean(ms)), 2), "max_ms": round(float(np.max(ms)), 2)}
+
+
+async def wait_for_job(client, job_id: str, poll: float = 0.05) -> bool:
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job.get("status") in ("done", "failed"):
+            return job["status"] == "done"
+        await asyncio.sleep(poll)
+
+
+async def run_load(client, args, workdir: str) -> dict:
+    rng = random.Random(args.seed)
+    doc_dir = os.path.join(workdir, "docs")
+    os.makedirs(doc_dir, exist_ok=True)
+    counter = iter(range(10 ** 9))
+
+    def new_document() -> str:
+        path = os.path.join(doc_dir, f"doc_{next(counter)}.txt")
+        with open(path, "w") as f:
+            f.write(make_document(rng))
+        return path
+
+    async def ingest() -> str:
+        path = new_document()
+        r = await client.post("/ingest", json={"file_id": os.path.basename(path), "path": path})
+        r.raise_for_status()
+        return r.json()["job_id"]
+
+    # seed the collection
+    seeded = await asyncio.gather(*(ingest() for _ in range(args.docs)))
+    await asyncio.gather(*(wait_for_job(client, j) for j in seeded))
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    jobs = []
+    deadline = time.perf_counter() + args.duration
+
+    async def track_job(job_id: str, submitted: float):
+        ok = await wait_for_job(client, job_id)
+        if ok:
+            latencies["ingest_job"].append((time.perf_counter() - submitted) * 1000)
+        else:
+            errors["ingest_job"] += 1
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            op = "ingest" if rng.random() < args.ingest_ratio else "query"
+            t0 = time.perf_counter()
+            try:
+                if op == "ingest":
+                    job_id = await ingest()
+                    jobs.append(asyncio.create_task(track_job(job_id, t0)))
+                else:
+                    r = await client.post("/query", json={"query": make_question(rng), "top_k": args.top_k})
+                    r.raise_for_status()
+            except Exception:
+                errors[op] += 1
+                continue
+            latencies[op].append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+    await asyncio.gather(*jobs)
+
+    results = {}
+    for op in ("query", "ingest", "ingest_job"):
+        if latencies[op] or errors[op]:
+            results[op] = {"requests": len(latencies[op]), "errors": errors[op],
+                           "rps": round(len(latencies[op]) / wall, 2), **percentiles(latencies[op])}
+    try:
+        stages = (await client.get("/stats")).json().get("stages")
+    except Exception:
+        stages = None
+    return {"wall_seconds": round(wall, 2), "results": results, "stages": stages}
+
+
+async def run(args, workdir: str) -> dict:
+    import httpx
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            return await run_load(client, args, workdir)
+    from backend.app import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=timeout) as client:
+            return await run_load(client, args, workdir)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def compare(report: dict, base: dict):
+    print(f"change vs {base.get('commit') or 'baseline'}:")
+    for op, now in report["results"].items():
+        before = base.get("results", {}).get(op)
+        if not before:
+            continue
+        deltas = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if before.get(key):
+                deltas.append(f"{key} {before[key]} -> {now.get(key)} ({(now.get(key, 0) / before[key] - 1) * 100:+.1f}%)")
+        print(f"  {op}: " + ", ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="concurrent ingest + query load test")
+    parser.add_argument("--url", help="drive a running service instead of the in-process app")
+    parser.add_argument("--store", choices=["memory", "local", "env"], default="memory",
+                        help="embedded Qdrant, local vector store, or the configured backends")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ingest-ratio", type=float, default=0.05)
+    parser.add_argument("--docs", type=int, default=20, help="documents ingested before the load starts")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=200,
+                        help="mock LLM latency; negative keeps the configured LLM")
+    parser.add_argument("--llm-token-ms", type=float, default=20)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if not args.url:
+            configure(args, workdir)
+        report = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "settings": {k: v for k, v in vars(args).items() if k not in ("out", "compare")}}
+        report.update(asyncio.run(run(args, workdir)))
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
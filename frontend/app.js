@@ -6,6 +6,17 @@ const questionBox = document.getElementById('question')
 const answerDiv = document.getElementById('answer')
 let lastFile = null
 
+async function waitForJob(jobId, onProgress) {
+  while (true) {
+    const res = await fetch('/jobs/' + jobId)
+    if (!res.ok) throw new Error('Job lookup failed: ' + res.status)
+    const job = await res.json()
+    if (job.status === 'done' || job.status === 'failed') return job
+    onProgress(job)
+    await new Promise((r) => setTimeout(r, 1000))
+  }
+}
+
 uploadBtn.onclick = async () => {
   const f = fileInput.files[0]
   if (!f) {
@@ -17,19 +28,19 @@ uploadBtn.onclick = async () => {
   try {
     const fd = new FormData()
     fd.append('file', f)
-    const res = await fetch('/upload', { method: 'POST', body: fd })
+    // upload and queue ingestion in one request, then poll the job until it finishes
+    const res = await fetch('/upload?ingest=true', { method: 'POST', body: fd })
     if (!res.ok) throw new Error('Upload failed: ' + res.status)
     const data = await res.json()
     uploadResult.innerText = JSON.stringify(data)
     lastFile = data
-    // auto-ingest
-    const ingRes = await fetch('/ingest', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ file_id: data.file_id, path: data.path }) })
-    if (!ingRes.ok) {
-      const text = await ingRes.text()
-      uploadResult.innerText += '\nIngest failed: ' + text
+    const job = await waitForJob(data.job_id, (j) => {
+      uploadResult.innerText = JSON.stringify(data) + '\nIngesting: ' + JSON.stringify(j.progress)
+    })
+    if (job.status === 'done') {
+      uploadResult.innerText = JSON.stringify(data) + '\nIngested: ' + JSON.stringify(job.result)
     } else {
-      const ingData = await ingRes.json()
-      uploadResult.innerText += '\nIngested: ' + JSON.stringify(ingData)
+      uploadResult.innerText = JSON.stringify(data) + '\nIngest failed: ' + job.error
     }
   } catch (err) {
     uploadResult.innerText = 'Error: ' + err.message
@@ -42,7 +53,35 @@ uploadBtn.onclick = async () => {
 askBtn.onclick = async () => {
   const q = questionBox.value
   if (!q) return
-  const res = await fetch('/query', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ query: q }) })
-  const data = await res.json()
-  answerDiv.innerText = JSON.stringify(data, null, 2)
+  // NDJSON stream: sources arrive right after retrieval, then answer tokens
+  answerDiv.innerText = ''
+  let sources = []
+  let answer = ''
+  const render = (status) => {
+    answerDiv.innerText = answer + (status ? '\n\n' + status : '') + '\n\nSources:\n' + JSON.stringify(sources, null, 2)
+  }
+  const res = await fetch('/query/stream', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ query: q }) })
+  if (!res.ok || !res.body) {
+    answerDiv.innerText = 'Query failed: ' + res.status
+    return
+  }
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffered = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffered += decoder.decode(value, { stream: true })
+    const lines = buffered.split('\n')
+    buffered = lines.pop()
+    for (const line of lines) {
+      if (!line.trim()) continue
+      const event = JSON.parse(line)
+      if (event.type === 'sources') sources = event.sources
+      else if (event.type === 'token') answer += event.text
+      else if (event.type === 'error') answer += '\n[error] ' + event.error
+      render(event.type === 'done' ? '' : '...')
+    }
+  }
+  render('')
 }
@@ -0,0 +1,91 @@
+"""Minimal mock LLM server for load testing the RAG service without a real provider.
+
+Run it with:
+
+    python scripts/mock_llm_server.py --port 9000 --latency-ms 200
+
+and point the backend at it, e.g. ``LLM_PROVIDER=openai LLM_ENDPOINT=http://localhost:9000/v1``
+(OpenAI-style chat completions) or ``LLM_ENDPOINT=http://localhost:9000/generate``
+(generic provider). Chat completions honour ``stream: true`` and emit one
+word per server-sent event every ``--token-ms``. ``--error-rate`` makes a
+fraction of calls return 503 to exercise client retries.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", 200))
+ERROR_RATE = float(os.getenv("MOCK_LLM_ERROR_RATE", 0))
+TOKEN_MS = float(os.getenv("MOCK_LLM_TOKEN_MS", 20))  # delay between streamed tokens
+
+app = FastAPI(title="Mock LLM")
+
+
+def _answer_for(prompt: str) -> str:
+    question = prompt.rsplit("QUESTION:", 1)[-1].split("Answer:", 1)[0].strip()
+    return f"Mock answer to: {question[:200]}"
+
+
+async def _simulate():
+    await asyncio.sleep(LATENCY_MS / 1000.0)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return JSONResponse(status_code=503, content={"error": "mock overload"})
+    return None
+
+
+async def _stream_chunks(answer: str):
+    # OpenAI-style server-sent events, one word per chunk
+    for i, word in enumerate(answer.split(" ")):
+        chunk = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(TOKEN_MS / 1000.0)
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = await _simulate()
+    if error is not None:
+        return error
+    prompt = body.get("messages", [{}])[-1].get("content", "")
+    if body.get("stream"):
+        return StreamingResponse(_stream_chunks(_answer_for(prompt)), media_type="text/event-stream")
+    return {
+        "id": f"mock-{time.time_ns()}",
+        "object": "chat.completion",
+        "model": body.get("model", "mock"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": _answer_for(prompt)},
+                     "finish_reason": "stop"}],
+    }
+
+
+@app.post("/generate")
+async def generate(request: Request):
+    body = await request.json()
+    error = await _simulate()
+    if error is not None:
+        return error
+    return {"text": _answer_for(body.get("prompt") or body.get("input") or body.get("text") or "")}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--token-ms", type=float, default=TOKEN_MS)
+    args = parser.parse_args()
+    LATENCY_MS = args.latency_ms
+    ERROR_RATE = args.error_rate
+    TOKEN_MS = args.token_ms
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+import pytest
+
+from backend.batcher import EmbeddingBatcher
+
+
+def test_batcher_coalesces_concurrent_requests_and_keeps_order():
+    calls = []
+
+    def encode(texts):
+        calls.append(len(texts))
+        return np.array([[float(t)] for t in texts], dtype=np.float32)
+
+    batcher = EmbeddingBatcher(encode, max_batch=8, max_wait_ms=50)
+    results = {}
+
+    def query(i):
+        results[i] = batcher.embed([str(i), str(i + 100)])
+
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert all(results[i].tolist() == [[i], [i + 100]] for i in range(10))
+    assert sum(calls) == 20 and max(calls) <= 8 and len(calls) < 10
+    stats = batcher.stats()
+    assert stats["items"] == 20 and stats["batches"] == len(calls)
+
+
+def test_batcher_propagates_encode_errors():
+    def encode(texts):
+        raise RuntimeError("model failed")
+
+    batcher = EmbeddingBatcher(encode, max_batch=4, max_wait_ms=0)
+    with pytest.raises(RuntimeError, match="model failed"):
+        batcher.embed(["a"])
+    batcher.close()
+
+
+def test_batcher_encodes_directly_after_close():
+    calls = []
+
+    def encode(texts):
+        calls.append(threading.current_thread().name)
+        return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+    batcher = EmbeddingBatcher(encode, max_batch=4, max_wait_ms=0, name="t")
+    batcher.close()
+    batcher.close()
+    assert batcher.embed(["ab", "c"]).tolist() == [[2.0], [1.0]]
+    assert calls == [threading.current_thread().name]
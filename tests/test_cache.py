@@ -0,0 +1,66 @@
+import os
+import time
+
+from backend.cache import LRUCache, SemanticCache, normalize_query, filter_key
+
+
+def test_lru_cache_evicts_least_recently_used():
+    c = LRUCache(2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    s = c.stats()
+    assert (s["entries"], s["hits"], s["misses"], s["evictions"]) == (2, 3, 1, 1)
+
+
+def test_lru_cache_ttl_and_disabled():
+    c = LRUCache(10, ttl=0.01)
+    c.set("a", 1)
+    time.sleep(0.02)
+    assert c.get("a") is None
+    off = LRUCache(0)
+    off.set("a", 1)
+    assert off.get("a") is None
+
+
+def test_filter_key_is_canonical():
+    assert filter_key(None) is None and filter_key({}) is None
+    assert filter_key({"a": 1, "file_id": ["x"]}) == filter_key({"file_id": ["x"], "a": 1})
+    assert filter_key({"file_id": "x"}) != filter_key({"file_id": "y"})
+
+
+def test_normalize_query():
+    assert normalize_query("  what   is\n RAG? ") == "what is RAG?"
+
+
+def test_semantic_cache_requires_similarity_and_same_sources():
+    c = SemanticCache(max_entries=10, ttl=60, threshold=0.9)
+    c.store("docs", [1.0, 0.0, 0.0], ["a", "b"], "cached answer")
+    assert c.lookup("docs", [0.99, 0.05, 0.0], ["b", "a"]) == "cached answer"
+    assert c.lookup("docs", [0.0, 1.0, 0.0], ["a", "b"]) is None
+    assert c.lookup("docs", [1.0, 0.0, 0.0], ["a", "c"]) is None
+    assert c.lookup("other", [1.0, 0.0, 0.0], ["a", "b"]) is None
+
+
+def test_collection_version_is_shared_across_processes(tmp_path, monkeypatch):
+    import subprocess
+    import sys
+
+    from backend import cache
+    monkeypatch.setattr(cache, "COLLECTION_VERSION_DIR", str(tmp_path))
+    before = cache.collection_version("docs")
+    # an ingest in another process (job worker, other uvicorn worker)
+    subprocess.run([sys.executable, "-c", "from backend.cache import invalidate_collection; "
+                    "invalidate_collection('docs')"], check=True, env={**os.environ,
+                   "COLLECTION_VERSION_DIR": str(tmp_path)})
+    after = cache.collection_version("docs")
+    assert after != before
+    cache.invalidate_collection("docs")
+    assert cache.collection_version("docs") not in (before, after)
+    assert cache.collection_version("other") == before == ""
+    # the name never becomes part of the path
+    cache.invalidate_collection("../escape")
+    assert not (tmp_path.parent / "escape").exists() and cache.collection_version("../escape")
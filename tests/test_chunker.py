@@ -1,4 +1,4 @@
-from backend.chunker import chunk_text
+from backend.chunker import chunk_text, iter_chunks, iter_token_chunks
 
 
 def test_chunker_small():
@@ -8,3 +8,34 @@ def test_chunker_small():
     # ensure no overlaps larger than expected
     for i in range(1, len(chunks)):
         assert chunks[i]['start'] < chunks[i]['end']
+
+
+def test_iter_chunks_matches_chunk_text():
+    t = "".join(chr(ord('a') + i % 26) for i in range(5300))
+    pieces = [t[i:i + 700] for i in range(0, len(t), 700)]
+    expected = [(c['text'], c['start'], c['end']) for c in chunk_text(t, chunk_size=1000, overlap=200)]
+    got = [(c['text'], c['start'], c['end']) for c in iter_chunks(pieces, chunk_size=1000, overlap=200)]
+    assert got == expected
+
+
+def test_chunk_ids_are_deterministic():
+    t = "The quick brown fox jumps over the lazy dog. " * 100
+    first = chunk_text(t, chunk_size=300, overlap=50)
+    second = chunk_text(t, chunk_size=300, overlap=50)
+    assert [c['id'] for c in first] == [c['id'] for c in second]
+    assert all(c['hash'] and c['id'].endswith(c['hash'][:8]) for c in first)
+
+
+def test_token_chunks_respect_budget_boundaries_and_streaming():
+    text = ("# Intro\nFirst sentence here. Second one!\n\n" + "Filler words go here. " * 60
+            + "\n## Details\n" + "More text follows now. " * 30)
+    whole = list(iter_token_chunks([text], max_tokens=40, overlap_tokens=8))
+    streamed = list(iter_token_chunks([text[i:i + 37] for i in range(0, len(text), 37)],
+                                      max_tokens=40, overlap_tokens=8))
+    assert [c['text'] for c in streamed] == [c['text'] for c in whole]
+    assert all(c['tokens'] <= 40 for c in whole)
+    assert all(text[c['start']:c['end']] == c['text'] for c in whole)
+    # chunks end on sentence boundaries and the heading starts a fresh chunk
+    assert all(c['text'].endswith(('.', '!')) for c in whole)
+    assert any(c['text'].startswith('## Details') for c in whole)
+    assert len(whole) < len(chunk_text(text, chunk_size=160, overlap=40))
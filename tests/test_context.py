@@ -0,0 +1,40 @@
+import numpy as np
+
+from backend.chunker import estimate_tokens
+from backend.context import pack_context
+
+
+def _hit(id, score, text, index, start, vector=None, file_id="f"):
+    hit = {"id": id, "score": score,
+           "payload": {"text": text, "file_id": file_id, "index": index, "start": start, "end": start + len(text)}}
+    if vector is not None:
+        hit["vector"] = np.asarray(vector, dtype=np.float32)
+    return hit
+
+
+def test_pack_context_merges_dedups_and_fits_budget():
+    doc = "Alpha one two. Beta three four. Gamma five six. Delta seven eight."
+    a = _hit("a", 0.9, doc[:31], 0, 0, [1, 0, 0])          # Alpha.. Beta..
+    b = _hit("b", 0.8, doc[15:47], 1, 15, [0.8, 0.6, 0])   # Beta.. Gamma.. (overlaps a)
+    dup = _hit("d", 0.85, "Alpha one two! Beta three four.", 0, 0, [1, 0.01, 0], file_id="g")
+    other = _hit("o", 0.1, "Unrelated words about something else entirely here.", 0, 0, [0, 0, 1], file_id="h")
+
+    packed = pack_context([a, dup, b, other], budget=1000, count_tokens=estimate_tokens)
+    assert [blk["ids"] for blk in packed["blocks"]] == [["a", "b"], ["o"]]
+    assert packed["blocks"][0]["text"] == doc[:47]
+    assert packed["chunks_in"] == 4 and packed["chunks_used"] == 3
+    assert packed["tokens_after"] < packed["tokens_before"]
+
+    tight = pack_context([a, b, other], budget=12, count_tokens=estimate_tokens)
+    assert tight["tokens_after"] <= 12 and tight["blocks"][0]["ids"][0] == "a"
+
+
+def test_pack_context_checks_offsets_against_the_text():
+    old = "Alpha one two. Beta three four. Gamma five six."
+    new = "Alpha one two XXXXX. Beta three four. Gamma five six."
+    # the first chunk was edited and re-ingested; the second was skipped and still has its old offsets
+    a = _hit("a", 0.9, new[:37], 0, 0)
+    b = _hit("b", 0.8, old[15:], 1, 15)
+    packed = pack_context([a, b], budget=1000, count_tokens=estimate_tokens)
+    assert [blk["ids"] for blk in packed["blocks"]] == [["a", "b"]]
+    assert packed["blocks"][0]["text"] == new
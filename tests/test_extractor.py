@@ -0,0 +1,44 @@
+from backend import extractor
+from backend.extractor import extract_text, iter_text, register_extractor
+
+
+def test_html_and_csv_extractors(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractor, "EXTRACT_CACHE_DIR", str(tmp_path / "cache"))
+    html = tmp_path / "page.html"
+    html.write_text("<html><head><script>var x = 1;</script></head>"
+                    "<body><h1>Title</h1><p>Tom &amp; Jerry</p></body></html>")
+    text = extract_text(str(html))
+    assert "Title" in text and "Tom & Jerry" in text and "var x" not in text
+
+    table = tmp_path / "codes.csv"
+    table.write_text("name,code\nalpha,ERR-1\nbeta,ERR-2\n")
+    assert extract_text(str(table)) == "name: alpha; code: ERR-1\nname: beta; code: ERR-2"
+
+
+def test_registered_extractor_output_is_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractor, "EXTRACT_CACHE", True)
+    monkeypatch.setattr(extractor, "EXTRACT_CACHE_DIR", str(tmp_path / "cache"))
+    # the registration below replaces this entry; monkeypatch removes it again even if the test fails
+    monkeypatch.setitem(extractor._EXTRACTORS, ".fake", None)
+    calls = []
+
+    @register_extractor(".fake")
+    def iter_fake(path):
+        calls.append(path)
+        yield "page one"
+        yield "\npage two"
+
+    doc = tmp_path / "doc.fake"
+    doc.write_text("anything")
+    assert list(iter_text(str(doc))) == ["page one", "\npage two"]
+    assert list(iter_text(str(doc))) == ["page one", "\npage two"]
+    assert len(calls) == 1
+
+    # two ingests extracting the same bytes at once (e.g. one upload into two collections)
+    other = tmp_path / "copy.fake"
+    other.write_text("anything else")
+    first, second = iter_text(str(other)), iter_text(str(other))
+    assert next(first) == "page one"
+    assert list(second) == ["page one", "\npage two"]
+    assert list(first) == ["\npage two"]
+    assert list(iter_text(str(other))) == ["page one", "\npage two"] and len(calls) == 3
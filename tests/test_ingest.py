@@ -0,0 +1,60 @@
+import hashlib
+
+import numpy as np
+
+from backend import ingest
+from backend.chunk_index import ChunkIndex
+from backend.chunker import estimate_tokens, iter_token_chunks
+from backend.local_store import LocalStore
+
+
+class StubEmbedder:
+    model_name = "stub"
+
+    def embed_texts(self, texts):
+        return np.array([np.frombuffer(hashlib.sha256(t.encode()).digest()[:8], dtype=np.uint8)
+                         for t in texts], dtype=np.float32) + 1
+
+
+def test_reingest_skips_moves_reembeds_and_deletes(tmp_path, monkeypatch):
+    store = LocalStore("t", path=str(tmp_path / "store"), dim=8, hnsw_threshold=0)
+    monkeypatch.setattr(ingest, "Embedder", StubEmbedder)
+    monkeypatch.setattr(ingest, "get_store", lambda collection: store)
+    monkeypatch.setattr(ingest, "ChunkIndex", lambda: ChunkIndex(str(tmp_path / "chunks.db")))
+    monkeypatch.setattr(ingest, "token_counter", lambda model_name: estimate_tokens)
+    monkeypatch.setattr(ingest, "invalidate_collection", lambda collection: None)
+    monkeypatch.setattr(ingest, "LEXICAL_INDEX_ENABLED", False)
+    monkeypatch.setattr(ingest, "CHUNKER", "tokens")
+    monkeypatch.setattr(ingest, "CHUNK_MAX_TOKENS", 60)
+    monkeypatch.setattr(ingest, "CHUNK_OVERLAP_TOKENS", 0)
+
+    paras = [f"# Section {i}\n\nParagraph {i}: " + " ".join(f"word{i}x{j}" for j in range(30)) for i in range(8)]
+    doc = tmp_path / "doc.txt"
+
+    def run(text):
+        doc.write_text(text)
+        return ingest.ingest_file(str(doc), "f", collection="t")
+
+    first = run("\n\n".join(paras))
+    assert first["num_chunks"] == first["points"] > 1 and first["skipped"] == 0
+
+    unchanged = run("\n\n".join(paras))
+    assert (unchanged["points"], unchanged["skipped"], unchanged["moved"], unchanged["deleted"]) == \
+        (0, first["num_chunks"], 0, 0)
+
+    prepended = run("# Intro\n\nA brand new intro paragraph at the top.\n\n" + "\n\n".join(paras))
+    assert prepended["points"] >= 1 and prepended["moved"] == first["num_chunks"] and prepended["deleted"] == 0
+    chunks = list(iter_token_chunks([doc.read_text()], max_tokens=60, overlap_tokens=0))
+    stored = store.retrieve_payloads([ingest.point_id("f", c["hash"]) for c in chunks])
+    assert [(p["index"], p["start"], p["end"]) for p in stored.values()] == \
+        [(c["index"], c["start"], c["end"]) for c in chunks]
+
+    # a point the store lost (e.g. an upsert that never completed) is embedded again
+    store.delete([ingest.point_id("f", chunks[-1]["hash"])])
+    lost = run(doc.read_text())
+    assert (lost["points"], lost["skipped"]) == (1, len(chunks) - 1)
+
+    shortened = run("\n\n".join(paras[:3]))
+    assert shortened["points"] == 0 and shortened["deleted"] == len(chunks) - shortened["num_chunks"]
+    assert len(store) == shortened["num_chunks"]
+    assert len(ChunkIndex(str(tmp_path / "chunks.db")).known("t", "f")) == shortened["num_chunks"]
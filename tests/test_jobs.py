@@ -0,0 +1,32 @@
+from backend.jobs import SQLiteJobStore, run_job, HANDLERS
+
+
+def test_sqlite_job_store_roundtrip_and_run(tmp_path, monkeypatch):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+
+    def handler(params, progress):
+        progress({"chunks": params["n"]})
+        return {"ok": True}
+
+    monkeypatch.setitem(HANDLERS, "test", handler)
+    job = store.create("test", {"n": 3})
+    assert [j["id"] for j in SQLiteJobStore(store.path).unfinished()] == [job["id"]]
+    run_job(store, job)
+    done = store.get(job["id"])
+    assert done["status"] == "done"
+    assert done["progress"] == {"chunks": 3}
+    assert done["result"] == {"ok": True}
+    assert store.unfinished() == []
+
+
+def test_unfinished_jobs_are_claimed_once_and_only_after_the_lease(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    job = store.create("test", {}, owner="worker-a")
+    # worker-a is alive (fresh heartbeat): nobody else may resume its job
+    assert not store.claim(job["id"], "worker-b", lease=60)
+    store.update(job["id"], heartbeat=0.0)
+    assert store.claim(job["id"], "worker-b", lease=60)
+    assert not store.claim(job["id"], "worker-c", lease=60)
+    store.heartbeat("worker-b")
+    store.update(job["id"], status="done")
+    assert not store.claim(job["id"], "worker-c", lease=0)
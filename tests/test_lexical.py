@@ -0,0 +1,54 @@
+import pytest
+
+from backend.lexical import LexicalIndex, get_index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_parts():
+    terms = tokenize("See ERR-1042 in api/v1/users")
+    assert "err-1042" in terms and "err" in terms and "1042" in terms
+    assert "api/v1/users" in terms and "users" in terms
+
+
+def test_lexical_index_search_add_remove_and_filter(tmp_path):
+    idx = LexicalIndex(str(tmp_path / "docs.sqlite"))
+    idx.add_many([("a", "the upload service times out", {"text": "a", "n": 1}),
+                  ("b", "error ERR-1042 in the billing worker", {"text": "b", "n": 2}),
+                  ("c", "the billing worker retries forever", {"text": "c", "n": 3})])
+    hits = idx.search("ERR-1042 billing", top_k=2)
+    assert [h["id"] for h in hits] == ["b", "c"]
+    assert hits[0]["payload"] == {"text": "b", "n": 2} and hits[0]["score"] > hits[1]["score"] > 0
+
+    assert [h["id"] for h in idx.search("billing", top_k=3, filter={"text": "c"})] == ["c"]
+    assert [h["id"] for h in idx.search("billing", top_k=3, filter={"n": [1, 2]})] == ["b"]
+    # query syntax is matched literally
+    assert idx.search('billing AND "NEAR(', top_k=3)
+
+    idx.add("c", "nothing about payments", {"text": "c2"})
+    assert [h["id"] for h in idx.search("billing", top_k=3)] == ["b"]
+    idx.remove("b")
+    assert idx.search("ERR-1042", top_k=2) == []
+    assert len(idx) == 2 and idx.present(["a", "b", "c"]) == {"a", "c"}
+
+
+def test_lexical_index_writers_do_not_lose_updates(tmp_path):
+    # two handles on one file stand in for ingests in two processes
+    first, second = LexicalIndex(str(tmp_path / "x.sqlite")), LexicalIndex(str(tmp_path / "x.sqlite"))
+    first.add("a", "alpha", {})
+    second.add("b", "beta", {})
+    first.add("c", "gamma", {})
+    assert len(second) == 3
+    assert {h["id"] for h in second.search("alpha gamma", top_k=5)} == {"a", "c"}
+
+
+def test_reciprocal_rank_fusion():
+    dense = [{"id": "x"}, {"id": "y"}, {"id": "z"}]
+    sparse = [{"id": "z"}, {"id": "y"}]
+    fused = reciprocal_rank_fusion([dense, sparse], top_k=2, k=60)
+    assert [h["id"] for h in fused] == ["z", "y"]
+    assert fused[1]["score"] == 1 / 62 + 1 / 62
+
+
+def test_get_index_rejects_collection_names_that_leave_the_index_dir():
+    for name in ("../../outside/secret", "a/b"):
+        with pytest.raises(ValueError):
+            get_index(name)
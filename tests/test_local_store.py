@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+import pytest
+
+from backend.local_store import LocalStore
+from backend.vectorstore import get_store
+
+
+def _vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_local_store_search_update_delete_and_filter(tmp_path):
+    store = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0)
+    vecs = _vectors(50)
+    ids = [f"p{i}" for i in range(50)]
+    store.upsert_arrays(ids, vecs, [{"i": i, "even": i % 2 == 0} for i in range(50)])
+    hits = store.search(vecs[7], top_k=3)
+    assert hits[0].id == "p7" and abs(hits[0].score - 1.0) < 1e-5
+    assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+
+    filtered = store.search(vecs[7], top_k=5, filter={"even": True})
+    assert len(filtered) == 5 and all(h.payload["even"] for h in filtered)
+    assert store.search(vecs[7], top_k=5, filter={"i": [3, 4]})[0].id in ("p3", "p4")
+
+    store.upsert_arrays(["p7"], vecs[8:9], [{"i": 7, "moved": True}])
+    store.delete(["p8", "p0"])
+    assert len(store) == 48
+    top = store.search(vecs[8], top_k=1)[0]
+    assert top.id == "p7" and top.payload["moved"]
+
+
+def test_local_store_flush_and_reload(tmp_path):
+    store = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0)
+    vecs = _vectors(20)
+    store.upsert_arrays(list(range(20)), vecs, [{"i": i} for i in range(20)])
+    store.delete([5])
+    store.flush()
+    reopened = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0)
+    assert len(reopened) == 19
+    assert [[h.id for h in hs] for hs in reopened.search_batch(vecs[[3, 9]], top_k=1)] == [[3], [9]]
+    reopened.upsert_arrays([100], vecs[:1], [{}])
+    assert len(reopened) == 20
+
+
+def test_local_store_retrieve_and_set_payloads(tmp_path):
+    store = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0)
+    store.upsert_arrays(["a", "b"], _vectors(2), [{"text": "x", "index": 0}, {"text": "y", "index": 1}])
+    assert store.retrieve_payloads(["a", "gone"], fields=["index"]) == {"a": {"index": 0}}
+    store.set_payloads({"b": {"index": 5}, "gone": {"index": 9}})
+    assert store.retrieve_payloads(["b"]) == {"b": {"text": "y", "index": 5}}
+
+
+def test_local_store_indexed_filter_and_incremental_payloads(tmp_path):
+    store = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0, indexed_fields=["file_id"])
+    vecs = _vectors(30)
+    store.upsert_arrays(list(range(30)), vecs, [{"file_id": f"f{i % 3}", "i": i} for i in range(30)])
+    store.set_payloads({4: {"file_id": "f0"}})
+    store.delete([3])
+    hits = store.search(vecs[0], top_k=30, filter={"file_id": ["f0", "f2"], "i": list(range(10))})
+    assert sorted(h.id for h in hits) == [0, 2, 4, 5, 6, 8, 9]
+    store.flush()
+
+    store.upsert_arrays([1], vecs[1:2], [{"file_id": "f9", "i": 1}])
+    store.flush()
+    reopened = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0, indexed_fields=["file_id"])
+    assert [h.id for h in reopened.search(vecs[1], top_k=5, filter={"file_id": "f9"})] == [1]
+    assert reopened.retrieve_payloads([4, 3]) == {4: {"file_id": "f0", "i": 4}}
+
+
+def test_collection_names_cannot_leave_the_data_dir():
+    for name in ("../../evil", "a/b", "", "x" * 65):
+        with pytest.raises(ValueError):
+            get_store(name, backend="local")
+
+
+def test_local_store_writers_take_turns(tmp_path):
+    # two handles on one collection, as in two job worker processes
+    first = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0)
+    second = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0)
+    vecs = _vectors(2)
+    first.upsert_arrays(["a"], vecs[:1], [{}])
+    done = threading.Event()
+    writer = threading.Thread(target=lambda: (second.upsert_arrays(["b"], vecs[1:], [{}]), done.set()))
+    writer.start()
+    assert not done.wait(0.2)  # blocked until the first writer flushes
+    first.flush()
+    writer.join(5)
+    second.flush()
+    reopened = LocalStore("t", path=str(tmp_path), dim=8, hnsw_threshold=0)
+    assert sorted(reopened.retrieve_payloads(["a", "b"])) == ["a", "b"]
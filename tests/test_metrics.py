@@ -0,0 +1,46 @@
+import pytest
+
+from backend import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = metrics.Histogram("t_seconds", "test", ["stage"], buckets=[0.1, 1])
+    for v in (0.05, 0.1, 0.5, 3):
+        h.observe(v, "embed")
+    lines = h.render()
+    assert 't_seconds_bucket{stage="embed",le="0.1"} 2' in lines
+    assert 't_seconds_bucket{stage="embed",le="1.0"} 3' in lines
+    assert 't_seconds_bucket{stage="embed",le="+Inf"} 4' in lines
+    assert 't_seconds_count{stage="embed"} 4' in lines
+
+
+def test_span_adds_to_request_timings():
+    with metrics.request_timings() as timings:
+        with metrics.span("search"):
+            pass
+        metrics.observe("search", 0.5)
+    assert set(timings) == {"search"} and timings["search"] >= 0.5
+    assert metrics.server_timing({"search": 0.0125}, total=0.02) == "search;dur=12.5, total;dur=20.0"
+
+
+def test_stage_spans_are_children_of_the_request_span(monkeypatch):
+    trace = pytest.importorskip("opentelemetry.trace")
+    started = []
+
+    class Tracer:
+        def start_span(self, name, context=None, kind=trace.SpanKind.INTERNAL, attributes=None):
+            ctx = trace.SpanContext(trace_id=1, span_id=len(started) + 1, is_remote=False)
+            otel_span = trace.NonRecordingSpan(ctx)
+            started.append((name, trace.get_current_span(context) if context else None, kind, otel_span))
+            return otel_span
+
+    monkeypatch.setattr(metrics, "_get_tracer", lambda: Tracer())
+    with metrics.request_timings("POST"):
+        with metrics.span("search"):
+            pass
+    with metrics.span("embed"):
+        pass
+    (req, req_parent, req_kind, req_span), (stage, stage_parent, _, _), (_, outside_parent, _, _) = started
+    assert (req, req_parent, req_kind) == ("POST", None, trace.SpanKind.SERVER)
+    assert stage == "search" and stage_parent is req_span
+    assert outside_parent is None
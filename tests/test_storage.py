@@ -0,0 +1,46 @@
+import anyio
+import pytest
+
+from backend import storage
+
+BOUNDARY = "----testboundary"
+
+
+def _multipart(filename: str, data: bytes, field: str = "file") -> bytes:
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nhello\r\n"
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + data + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def _body(raw: bytes, size: int = 7):
+    for i in range(0, len(raw), size):
+        yield raw[i:i + size]
+
+
+def _save(raw: bytes) -> dict:
+    return anyio.run(storage.save_multipart_upload, _body(raw), f"multipart/form-data; boundary={BOUNDARY}")
+
+
+def test_multipart_upload_is_content_addressed_per_extension(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    data = b"same bytes\r\n--not a boundary\r\n" * 100
+    txt = _save(_multipart("notes.TXT", data))
+    assert txt["file_id"].endswith(".txt") and txt["size"] == len(data) and not txt["deduplicated"]
+    with open(txt["path"], "rb") as f:
+        assert f.read() == data
+    assert _save(_multipart("again.txt", data))["deduplicated"]
+    # same bytes under another extension are another document (another extractor)
+    md = _save(_multipart("notes.md", data))
+    assert md["sha256"] == txt["sha256"] and md["file_id"] != txt["file_id"]
+
+
+def test_multipart_upload_limits_and_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "MAX_UPLOAD_BYTES", 100)
+    with pytest.raises(storage.UploadTooLarge):
+        _save(_multipart("big.txt", b"x" * 101))
+    assert not list((tmp_path / ".tmp").iterdir())
+    with pytest.raises(storage.BadUpload):
+        _save(_multipart("a.txt", b"data", field="other"))
+    with pytest.raises(storage.BadUpload):
+        anyio.run(storage.save_multipart_upload, _body(b"{}"), "application/json")